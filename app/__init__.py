@@ -1 +1,98 @@
 # This file makes the app directory a Python package
+from flask import Flask, g, render_template, request
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from app.utils.logging_config import (
+    REQUEST_ID_HEADER, configure_logging, request_correlation_id, reset_correlation_id, set_correlation_id
+)
+
+# Templates and static assets live at the project root, next to app.py
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+logger = logging.getLogger(__name__)
+
+def create_app(config=None, services=None):
+    """
+    Create and configure the Flask application
+    
+    Args:
+        config (dict, optional): Configuration overrides
+        services (ServiceContainer, optional): Services to use instead of
+                                               building them from the environment
+        
+    Returns:
+        Flask: The configured application
+    """
+    # Load environment variables from .env file
+    load_dotenv()
+    configure_logging()
+    
+    # Imported here so that importing the package stays cheap
+    from app.api.routes import api_bp
+    from app.api.webhooks import webhooks_bp
+    from app.services.container import ServiceContainer
+    from app.utils.request_recorder import REQUEST_RECORDING, REQUEST_RECORDING_DIR, RequestRecorder
+    
+    app = Flask(
+        __name__,
+        template_folder=os.path.join(PROJECT_ROOT, 'templates'),
+        static_folder=os.path.join(PROJECT_ROOT, 'static')
+    )
+    
+    # Configure the app
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+    app.config['DATA_DIR'] = os.getenv('DATA_DIR', 'data')
+    if config:
+        app.config.update(config)
+    
+    # Services are created on first use, not at startup
+    app.extensions['services'] = services or ServiceContainer(data_dir=app.config['DATA_DIR'])
+    
+    # Register blueprints
+    app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(webhooks_bp, url_prefix='/webhooks')
+    
+    # Every log record of a request (and the Seam/SMTP calls it makes) carries its id
+    @app.before_request
+    def bind_request_id():
+        g.request_id = request_correlation_id(request.headers.get(REQUEST_ID_HEADER))
+        g.request_id_token = set_correlation_id(g.request_id)
+        g.request_started = time.perf_counter()
+    
+    @app.after_request
+    def log_request(response):
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        logger.info("%s %s %s", request.method, request.path, response.status_code, extra={
+            'event': 'http.request',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.request_started) * 1000, 1)
+        })
+        return response
+    
+    @app.teardown_request
+    def unbind_request_id(exc):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            reset_correlation_id(token)
+    
+    # Opt-in capture of anonymized request traces for load-test replays
+    if app.config.get('REQUEST_RECORDING', REQUEST_RECORDING):
+        trace_dir = (app.config.get('REQUEST_RECORDING_DIR') or REQUEST_RECORDING_DIR
+                     or os.path.join(app.config['DATA_DIR'], 'traces'))
+        RequestRecorder(trace_dir, app.config['SECRET_KEY']).init_app(app)
+    
+    @app.route('/')
+    def index():
+        """Render the main scheduler page"""
+        return render_template('scheduler.html')
+    
+    @app.route('/confirmation/<booking_id>')
+    def confirmation(booking_id):
+        """Render the booking confirmation page"""
+        return render_template('confirmation.html', booking_id=booking_id)
+    
+    return app
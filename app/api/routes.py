@@ -1,160 +1,358 @@
-from flask import Blueprint, request, jsonify, abort
-from app.services.scheduler_service import SchedulerService
-from app.services.notification_service import NotificationService
+from flask import Blueprint, Response, request, jsonify, abort, stream_with_context
+from app.services.booking_store import booking_sort_key
+from app.services.booking_archive import ARCHIVE_RETENTION_DAYS, FINISHED_STATUSES
+from app.services.analytics_service import GRANULARITIES
+from app.services.provisioning_service import ASYNC_PROVISIONING
+from app.services.container import service_proxy
 from app.models.booking import Booking
 from app.models.user import User
+from app.utils.time_utils import iso_to_datetime, get_current_utc_datetime, datetime_to_iso
+from app.utils.recurrence import occurrence_key
+from app.api.validators import (
+    validate, Field, Schema, ValidationError, BOOKING_SCHEMA, BOOKING_STATUSES,
+    device_id_field, ends_after_starts, valid_recurrence
+)
+from datetime import timedelta
+import base64
+import itertools
 import uuid
 import json
-import os
+import logging
 
 # Create the blueprint
 api_bp = Blueprint('api', __name__)
 
-# Initialize services
-scheduler_service = SchedulerService()
-notification_service = NotificationService()
+logger = logging.getLogger(__name__)
 
-# In-memory storage for development (would use a database in production)
-BOOKINGS_FILE = 'data/bookings.json'
-USERS_FILE = 'data/users.json'
+# Services of the running app, built lazily by create_app()'s container
+booking_store = service_proxy('booking_store')
+scheduler_service = service_proxy('scheduler_service')
+notification_service = service_proxy('notification_service')
+reconciliation_service = service_proxy('reconciliation_service')
+reminder_service = service_proxy('reminder_service')
+provisioning_service = service_proxy('provisioning_service')
+cancellation_service = service_proxy('cancellation_service')
+capacity_service = service_proxy('capacity_service')
+change_bus = service_proxy('change_bus')
+utilization_service = service_proxy('utilization_service')
 
-def load_data():
-    """Load data from JSON files"""
-    if not os.path.exists('data'):
-        os.makedirs('data')
-    
-    bookings = []
-    users = []
-    
-    if os.path.exists(BOOKINGS_FILE):
-        try:
-            with open(BOOKINGS_FILE, 'r') as f:
-                bookings_data = json.load(f)
-                bookings = [Booking.from_dict(b) for b in bookings_data]
-        except Exception as e:
-            print(f"Error loading bookings: {str(e)}")
-    
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, 'r') as f:
-                users_data = json.load(f)
-                users = [User.from_dict(u) for u in users_data]
-        except Exception as e:
-            print(f"Error loading users: {str(e)}")
-    
-    return bookings, users
+# Page size limits for GET /bookings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
-def save_bookings(bookings):
-    """Save bookings to JSON file"""
-    if not os.path.exists('data'):
-        os.makedirs('data')
-    
-    with open(BOOKINGS_FILE, 'w') as f:
-        json.dump([b.to_dict() for b in bookings], f, indent=2)
+# Free-slot search defaults and limits
+DEFAULT_FREE_SLOT_WINDOW_DAYS = 7
+MAX_FREE_SLOT_WINDOW_DAYS = 90
+MAX_FREE_SLOT_WINDOW = timedelta(days=MAX_FREE_SLOT_WINDOW_DAYS)
+DEFAULT_MIN_SLOT_MINUTES = 30
 
-def save_users(users):
-    """Save users to JSON file"""
-    if not os.path.exists('data'):
-        os.makedirs('data')
-    
-    with open(USERS_FILE, 'w') as f:
-        json.dump([u.to_dict() for u in users], f, indent=2)
+# Most candidate slots accepted by one batch availability request
+MAX_BATCH_SLOTS = 500
 
-@api_bp.route('/devices', methods=['GET'])
-def get_devices():
-    """Get a list of available devices"""
+# Most bookings cancelled by one POST /bookings/cancel
+MAX_BULK_CANCEL = 1000
+
+# Statuses POST /bookings/cancel looks for when selecting by filter
+CANCELLABLE_STATUSES = tuple(status for status in BOOKING_STATUSES if status not in FINISHED_STATUSES)
+
+# Widest window accepted by GET /scheduler-view
+MAX_SCHEDULER_VIEW_DAYS = 62
+
+# Most buckets in one utilization report
+MAX_UTILIZATION_BUCKETS = 2000
+
+# Widest window accepted by GET /capacity
+MAX_CAPACITY_VIEW_DAYS = 90
+
+# Seconds between keep-alive comments on an idle change stream
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Longest timeout accepted by GET /stream
+MAX_STREAM_SECONDS = 86400
+
+# Bounds on durations given to the maintenance endpoints
+MAX_LOOKAHEAD_HOURS = 24 * 366
+MAX_RETENTION_DAYS = 36500
+
+# One candidate slot of POST /check-availability/batch
+SLOT_SCHEMA = Schema({
+    'device_id': device_id_field(required=True, missing_message="Missing required parameters"),
+    'starts_at': Field('datetime', required=True, missing_message="Missing required parameters",
+                       message="Invalid time format. Must be ISO8601."),
+    'ends_at': Field('datetime', required=True, missing_message="Missing required parameters",
+                     message="Invalid time format. Must be ISO8601."),
+}, checks=(ends_after_starts(),))
+
+def encode_cursor(booking):
+    """Encode the position after a booking as an opaque cursor"""
+    raw = json.dumps(list(booking_sort_key(booking))).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, aborting on garbage"""
+    try:
+        created_at, booking_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (created_at, booking_id)
+    except Exception:
+        abort(400, description="Invalid cursor")
+
+def list_devices():
+    """Get the devices that can be booked"""
     # In a real application, you would get devices from Seam API
     # For demonstration, we'll return a mock device
-    return jsonify([
+    return [
         {
             "device_id": "mock-device-001",
             "name": "Front Door Lock",
             "type": "schlage_lock",
             "status": "online"
         }
-    ])
+    ]
 
-@api_bp.route('/bookings', methods=['GET'])
-def get_bookings():
-    """Get all bookings"""
-    bookings, _ = load_data()
+@api_bp.route('/devices', methods=['GET'])
+def get_devices():
+    """Get a list of available devices"""
+    return jsonify(list_devices())
+
+@api_bp.route('/scheduler-view', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(multiple=True),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+}, checks=(ends_after_starts('start', 'end'),))
+def get_scheduler_view(params):
+    """
+    Get everything the scheduler page needs in one request
+    
+    Query parameters:
+        device_id: devices whose bookings to include; repeat it or
+                   comma-separate several (default: every device)
+        start, end: ISO8601 visible window (default: now to 7 days later,
+                    max 62 days)
+    
+    The response also carries change_token, a resume token for
+    GET /stream taken before the periods were read, so no change made
+    while the view was built is missed.
+    """
+    devices = list_devices()
+    device_ids = params['device_id'] or [device['device_id'] for device in devices]
+    
+    window_start = params['start'] or get_current_utc_datetime()
+    window_end = params['end'] or window_start + timedelta(days=DEFAULT_FREE_SLOT_WINDOW_DAYS)
+    if window_end <= window_start:
+        abort(400, description="End time must be after start time.")
+    if window_end - window_start > timedelta(days=MAX_SCHEDULER_VIEW_DAYS):
+        abort(400, description=f"Window cannot exceed {MAX_SCHEDULER_VIEW_DAYS} days")
+    
+    change_token = change_bus.current_token()
+    booked_periods, errors = scheduler_service.get_booked_periods_for_devices(
+        device_ids, window_start, window_end
+    )
     
-    # Convert to dict format for JSON response
-    bookings_data = [b.to_dict() for b in bookings]
+    response = {
+        "devices": devices,
+        "starts_at": datetime_to_iso(window_start),
+        "ends_at": datetime_to_iso(window_end),
+        "booked_periods": booked_periods,
+        "change_token": change_token
+    }
+    if errors:
+        response["errors"] = errors
+    
+    return jsonify(response)
+
+@api_bp.route('/bookings', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(),
+    'user_id': Field(max_length=128),
+    'status': Field(choices=BOOKING_STATUSES),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+    'updated_since': Field('datetime'),
+    'cursor': Field(max_length=512),
+    'limit': Field('int', minimum=1, message="Invalid limit"),
+    'format': Field(choices=('json', 'ndjson')),
+})
+def get_bookings(params):
+    """
+    Get bookings, filtered and paginated
+    
+    Query parameters:
+        device_id, user_id, status: exact-match filters
+        start, end: ISO8601 bounds on starts_at (>=) and ends_at (<=)
+        updated_since: ISO8601; only bookings modified since then
+        cursor: next_cursor from a previous page
+        limit: page size (default 100, max 1000)
+        format: "ndjson" to stream matching bookings one per line
+    """
+    filters = {
+        name: params[name]
+        for name in ('device_id', 'user_id', 'status', 'start', 'end', 'updated_since')
+    }
+    if params['cursor']:
+        filters['after'] = decode_cursor(params['cursor'])
+    limit = params['limit'] or DEFAULT_PAGE_SIZE
+    
+    streaming = (params['format'] == 'ndjson' or
+                 request.accept_mimetypes.best == 'application/x-ndjson')
+    
+    if streaming:
+        # Stream straight from the store; only honour limit if it was given,
+        # in which case the rows must come in cursor order
+        bookings = booking_store.iter_bookings(ordered=params['limit'] is not None, **filters)
+        if params['limit'] is not None:
+            bookings = itertools.islice(bookings, limit)
+        
+        def generate():
+            for booking in bookings:
+                yield json.dumps(booking.to_dict()) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    limit = min(limit, MAX_PAGE_SIZE)
+    
+    # Read one extra row to know whether another page exists
+    page = list(itertools.islice(booking_store.iter_bookings(ordered=True, **filters), limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
     
-    return jsonify(bookings_data)
+    return jsonify({
+        "bookings": [b.to_dict() for b in page[:limit]],
+        "next_cursor": next_cursor
+    })
 
 @api_bp.route('/bookings/<booking_id>', methods=['GET'])
 def get_booking(booking_id):
     """Get a specific booking"""
-    bookings, _ = load_data()
-    
-    booking = next((b for b in bookings if b.id == booking_id), None)
+    booking = booking_store.get_booking(booking_id)
     if not booking:
         abort(404, description="Booking not found")
     
     return jsonify(booking.to_dict())
 
 @api_bp.route('/bookings', methods=['POST'])
-def create_booking():
-    """Create a new booking"""
-    data = request.json
-    
-    # Validate required fields
-    required_fields = ['device_id', 'starts_at', 'ends_at', 'user_name', 'user_email']
-    for field in required_fields:
-        if field not in data:
-            abort(400, description=f"Missing required field: {field}")
+@validate(body=BOOKING_SCHEMA)
+def create_booking(params):
+    """
+    Create a new booking
+    
+    With "async": true (or a "Prefer: respond-async" header, or
+    ASYNC_PROVISIONING set) the booking is saved as pending and returned
+    with 202 at once; its status moves to provisioning, then active or
+    failed, as the access code is created in the background. Follow it with
+    GET /bookings/<id> or the device's change stream.
+    
+    A one-off booking starting beyond the provisioning horizon is saved as
+    scheduled; its code is pushed to the lock (and sent to the guest) once
+    it enters the window.
+    
+    Bookings are checked against the lock's code slots first: a booking
+    whose lock is full is rejected with 409, unless a slot frees up before
+    it starts, in which case it is saved as scheduled until then (the
+    response then carries provision_at).
+    """
+    # A recurring booking repeats its first occurrence (starts_at/ends_at)
+    recurrence = params['recurrence']
     
     # Check if time slot is available
     if not scheduler_service.check_availability(
-        data['device_id'], 
-        data['starts_at'], 
-        data['ends_at']
+        params['device_id'], 
+        params['starts_at'], 
+        params['ends_at'],
+        recurrence=recurrence
     ):
         abort(409, description="Time slot is not available")
     
-    # Find or create user
-    bookings, users = load_data()
+    # Far-off codes stay off the lock until they enter the provisioning window
+    provision_at = None if recurrence else provisioning_service.deferred_until(params['starts_at'])
+    
+    # Codes of a full lock wait for a slot to free up, if one does in time
+    admission = capacity_service.admit(
+        params['device_id'], params['starts_at'], params['ends_at'],
+        recurrence=recurrence, provision_at=provision_at
+    )
+    if admission['decision'] == 'reject':
+        abort(409, description="No free access code slot on the lock")
+    if admission['decision'] == 'defer':
+        provision_at = admission['provision_at']
     
-    user = next((u for u in users if u.email == data['user_email']), None)
+    # Find or create user
+    user = booking_store.find_user_by_email(params['user_email'])
     if not user:
         user = User(
             id=str(uuid.uuid4()),
-            name=data['user_name'],
-            email=data['user_email'],
-            phone=data.get('user_phone')
+            name=params['user_name'],
+            email=params['user_email'],
+            phone=params['user_phone']
         )
-        users.append(user)
-        save_users(users)
-    
-    # Schedule the access code
-    access_details = scheduler_service.schedule_access(
-        data['device_id'],
-        data['starts_at'],
-        data['ends_at'],
-        data['user_name']
-    )
+        booking_store.add_user(user)
+    
+    asynchronous = params['async']
+    if asynchronous is None:
+        asynchronous = ASYNC_PROVISIONING or 'respond-async' in request.headers.get('Prefer', '')
+    
+    if asynchronous or provision_at is not None:
+        # Hold the slot locally and create the code in the background
+        booking = Booking(
+            device_id=params['device_id'],
+            user_id=user.id,
+            starts_at=datetime_to_iso(params['starts_at']),
+            ends_at=datetime_to_iso(params['ends_at']),
+            recurrence=recurrence,
+            status='scheduled' if provision_at is not None else 'pending'
+        )
+        booking_store.add_booking(booking)
+        provisioning_service.submit(booking, due_at=provision_at)
+        
+        body = {
+            "success": True,
+            "booking": booking.to_dict()
+        }
+        if provision_at is not None:
+            body["provision_at"] = datetime_to_iso(provision_at)
+        response = jsonify(body)
+        if not asynchronous:
+            return response, 201
+        response.headers['Location'] = f"/api/bookings/{booking.id}"
+        return response, 202
+    
+    if recurrence:
+        # Store the series once; occurrence codes are pushed as each one approaches
+        booking = Booking(
+            device_id=params['device_id'],
+            user_id=user.id,
+            starts_at=datetime_to_iso(params['starts_at']),
+            ends_at=datetime_to_iso(params['ends_at']),
+            recurrence=recurrence
+        )
+        provisioned = scheduler_service.provision_occurrences(booking, params['user_name'])
+    else:
+        # Schedule the access code
+        access_details = scheduler_service.schedule_access(
+            params['device_id'],
+            datetime_to_iso(params['starts_at']),
+            datetime_to_iso(params['ends_at']),
+            params['user_name']
+        )
+        
+        # Create booking record
+        booking = Booking(
+            device_id=params['device_id'],
+            user_id=user.id,
+            access_code_id=access_details['access_code_id'],
+            code=access_details['code'],
+            starts_at=access_details['starts_at'],
+            ends_at=access_details['ends_at']
+        )
+        provisioned = [access_details]
     
-    # Create booking record
-    booking = Booking(
-        device_id=data['device_id'],
-        user_id=user.id,
-        access_code_id=access_details['access_code_id'],
-        code=access_details['code'],
-        starts_at=access_details['starts_at'],
-        ends_at=access_details['ends_at']
-    )
+    booking_store.add_booking(booking)
     
-    bookings.append(booking)
-    save_bookings(bookings)
+    # Queue the expiration reminder; the reminder dispatcher sends it when due
+    reminder_service.schedule_reminder(booking)
     
     # Send notification
-    if user.email:
-        notification_service.send_access_code_email(user.email, access_details)
-    
-    if user.phone:
-        notification_service.send_access_code_sms(user.phone, access_details)
+    for access_details in provisioned:
+        notification_service.notify_access_code(user, access_details)
     
     return jsonify({
         "success": True,
@@ -164,9 +362,7 @@ def create_booking():
 @api_bp.route('/bookings/<booking_id>', methods=['DELETE'])
 def cancel_booking(booking_id):
     """Cancel a booking"""
-    bookings, _ = load_data()
-    
-    booking = next((b for b in bookings if b.id == booking_id), None)
+    booking = booking_store.get_booking(booking_id)
     if not booking:
         abort(404, description="Booking not found")
     
@@ -174,91 +370,536 @@ def cancel_booking(booking_id):
     if booking.is_active():
         abort(400, description="Cannot cancel an active booking")
     
-    # Delete access code if it's a future booking
-    if booking.is_future() and booking.access_code_id:
-        try:
-            scheduler_service.seam_service.delete_access_code(booking.access_code_id)
-        except Exception as e:
-            # Log but continue with cancellation
-            print(f"Error deleting access code: {str(e)}")
+    # Codes that cannot be deleted even after retries are reported, not hidden
+    result = cancellation_service.cancel([booking])[0]
+    if result['status'] != 'cancelled':
+        abort(409, description=result['reason'])
     
-    # Update booking status
-    booking.status = 'cancelled'
+    return jsonify({
+        "success": True,
+        "message": "Booking cancelled successfully",
+        "pending_revocation": result['pending_revocation']
+    })
+
+@api_bp.route('/bookings/cancel', methods=['POST'])
+@validate(body={
+    'booking_ids': Field('list', items=Field(max_length=128), message="booking_ids must be a list of IDs"),
+    'device_id': device_id_field(),
+    'user_id': Field(max_length=128),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+})
+def cancel_bookings(params):
+    """
+    Cancel every booking matching a filter
+    
+    Body (at least one filter): booking_ids, device_id, user_id, and start/end
+    (ISO8601 bounds on starts_at (>=) and ends_at (<=), as for GET /bookings);
+    filters are combined. Matching bookings are saved as cancelled in one
+    write, then their access codes are deleted in parallel with retries.
+    Returns one result per booking: cancelled (with the codes revoked and
+    those still pending revocation), skipped (with the reason) or not_found.
+    """
+    filters = {name: params[name] for name in ('device_id', 'user_id', 'start', 'end') if params[name] is not None}
+    if not filters and not params['booking_ids']:
+        abort(400, description="At least one of booking_ids, device_id, user_id, start or end is required")
+    
+    results = []
+    if params['booking_ids'] is not None:
+        booking_ids = list(dict.fromkeys(params['booking_ids']))
+        if len(booking_ids) > MAX_BULK_CANCEL:
+            abort(400, description=f"At most {MAX_BULK_CANCEL} bookings per request")
+        matching = {booking.id for booking in booking_store.iter_bookings(**filters)} if filters else None
+        bookings = []
+        for booking_id in booking_ids:
+            booking = booking_store.get_booking(booking_id)
+            if booking is None:
+                results.append({"booking_id": booking_id, "status": "not_found"})
+            elif matching is not None and booking.id not in matching:
+                results.append({"booking_id": booking_id, "status": "skipped", "reason": "Does not match the filter"})
+            else:
+                bookings.append(booking)
+    else:
+        bookings = list(itertools.islice(
+            booking_store.iter_bookings(status=CANCELLABLE_STATUSES, **filters), MAX_BULK_CANCEL + 1
+        ))
+        if len(bookings) > MAX_BULK_CANCEL:
+            abort(400, description=f"More than {MAX_BULK_CANCEL} bookings match; narrow the filter")
+    
+    results = cancellation_service.cancel(bookings) + results
+    
+    counts = {"cancelled": 0, "skipped": 0, "not_found": 0}
+    for result in results:
+        counts[result['status']] += 1
+    
+    return jsonify(dict(
+        counts,
+        success=True,
+        pending_revocation=sum(len(result.get('pending_revocation', ())) for result in results),
+        results=results
+    ))
+
+@api_bp.route('/bookings/<booking_id>/occurrences', methods=['GET'])
+@validate(query={
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+    'limit': Field('int', default=DEFAULT_PAGE_SIZE, minimum=1, message="Invalid limit"),
+})
+def get_booking_occurrences(booking_id, params):
+    """
+    List the occurrences of a booking within a window
+    
+    Query parameters:
+        start, end: ISO8601 window (default: from now, unbounded)
+        limit: maximum occurrences to return (default 100, max 1000)
+    """
+    booking = booking_store.get_booking(booking_id)
+    if not booking:
+        abort(404, description="Booking not found")
+    
+    start = params['start'] or get_current_utc_datetime()
+    end = params['end']
+    limit = min(params['limit'], MAX_PAGE_SIZE)
+    
+    series = booking.get_recurrence()
+    if series:
+        occurrences = itertools.islice(series.occurrences(start, end), limit)
+    else:
+        occurrences = [(iso_to_datetime(booking.starts_at), iso_to_datetime(booking.ends_at))]
+    
+    return jsonify({
+        "occurrences": [
+            {
+                "starts_at": datetime_to_iso(occurrence_start),
+                "ends_at": datetime_to_iso(occurrence_end),
+                "provisioned": (occurrence_key(occurrence_start) in booking.occurrence_codes
+                                if series else bool(booking.access_code_id))
+            }
+            for occurrence_start, occurrence_end in occurrences
+        ]
+    })
+
+@api_bp.route('/provision-upcoming-occurrences', methods=['POST'])
+@validate(body={
+    'lookahead_hours': Field('float', minimum=0, maximum=MAX_LOOKAHEAD_HOURS),
+})
+def provision_upcoming_occurrences(params):
+    """Push access codes for recurring occurrences that are about to start"""
+    kwargs = {}
+    if params['lookahead_hours'] is not None:
+        kwargs['lookahead_hours'] = params['lookahead_hours']
+    
+    results = scheduler_service.provision_upcoming_occurrences(**kwargs)
+    
+    for booking, access_details in results:
+        user = booking_store.get_user(booking.user_id)
+        if user:
+            notification_service.notify_access_code(user, access_details)
     
-    # Save updated bookings
-    save_bookings(bookings)
+    return jsonify({
+        "success": True,
+        "provisioned": [
+            {"booking_id": booking.id, "starts_at": details['starts_at'], "ends_at": details['ends_at']}
+            for booking, details in results
+        ]
+    })
+
+@api_bp.route('/provision-due-bookings', methods=['POST'])
+def provision_due_bookings():
+    """Push the codes of scheduled bookings that entered the provisioning window"""
+    outcomes = provisioning_service.dispatch_due()
     
     return jsonify({
         "success": True,
-        "message": "Booking cancelled successfully"
+        "outcomes": outcomes
     })
 
 @api_bp.route('/check-availability', methods=['GET'])
-def check_availability():
+@validate(query={
+    'device_id': device_id_field(required=True),
+    'starts_at': Field('datetime', required=True),
+    'ends_at': Field('datetime', required=True),
+    'recurrence': Field(max_length=200),
+}, checks=(ends_after_starts(), valid_recurrence()))
+def check_availability(params):
     """Check if a time slot is available"""
-    device_id = request.args.get('device_id')
-    start_time = request.args.get('starts_at')
-    end_time = request.args.get('ends_at')
+    is_available = scheduler_service.check_availability(
+        params['device_id'], params['starts_at'], params['ends_at'],
+        recurrence=params['recurrence']
+    )
     
-    if not device_id or not start_time or not end_time:
-        abort(400, description="Missing required parameters")
+    return jsonify({
+        "is_available": is_available
+    })
+
+@api_bp.route('/free-slots', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(required=True, multiple=True),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+    'min_duration': Field('minutes', default=timedelta(minutes=DEFAULT_MIN_SLOT_MINUTES),
+                          minimum=timedelta(seconds=1), maximum=MAX_FREE_SLOT_WINDOW),
+    'granularity': Field('minutes', minimum=timedelta(seconds=1), maximum=MAX_FREE_SLOT_WINDOW),
+    'at': Field('datetime'),
+})
+def get_free_slots(params):
+    """
+    Find free time on one or more devices
+    
+    Query parameters:
+        device_id: device to search; repeat it or comma-separate several
+        start, end: ISO8601 search window (default: now to 7 days later, max 90 days)
+        min_duration: shortest gap to return, in minutes (default 30)
+        granularity: optional slot grid in minutes; gaps are snapped to it
+        at: optional ISO8601 time; also report the first device free for
+            min_duration starting then
+    """
+    device_ids = params['device_id']
+    
+    window_start = params['start'] or get_current_utc_datetime()
+    window_end = params['end'] or window_start + timedelta(days=DEFAULT_FREE_SLOT_WINDOW_DAYS)
+    if window_end <= window_start:
+        abort(400, description="End time must be after start time.")
+    if window_end - window_start > timedelta(days=MAX_FREE_SLOT_WINDOW_DAYS):
+        abort(400, description=f"Search window cannot exceed {MAX_FREE_SLOT_WINDOW_DAYS} days")
+    
+    at = params['at']
+    
+    free_slots, first_free_device = scheduler_service.find_free_slots(
+        device_ids, window_start, window_end, params['min_duration'], params['granularity'], at
+    )
     
-    is_available = scheduler_service.check_availability(device_id, start_time, end_time)
+    response = {
+        "starts_at": datetime_to_iso(window_start),
+        "ends_at": datetime_to_iso(window_end),
+        "free_slots": {
+            device_id: [
+                {"starts_at": datetime_to_iso(start), "ends_at": datetime_to_iso(end)}
+                for start, end in gaps
+            ]
+            for device_id, gaps in free_slots.items()
+        }
+    }
+    
+    if at is not None:
+        response["first_free_device"] = first_free_device
+    
+    return jsonify(response)
+
+@api_bp.route('/check-availability/batch', methods=['POST'])
+@validate(body={
+    'slots': Field('list', required=True, missing_message="slots must be a non-empty list",
+                   message="slots must be a non-empty list"),
+})
+def check_availability_batch(params):
+    """
+    Check many candidate time slots in one request
+    
+    Expects {"slots": [{"device_id", "starts_at", "ends_at"}, ...]} and
+    returns one result per slot, in order. Malformed slots get an error
+    instead of failing the whole batch. A free slot on a lock with no free
+    code slot is unavailable (with a reason); one whose code would have to
+    wait for a code slot carries provision_at.
+    """
+    slots = params['slots']
+    
+    if not slots:
+        abort(400, description="slots must be a non-empty list")
+    if len(slots) > MAX_BATCH_SLOTS:
+        abort(400, description=f"At most {MAX_BATCH_SLOTS} slots per request")
+    
+    results = []
+    candidates = []
+    for slot in slots:
+        result = {
+            "device_id": slot.get('device_id') if isinstance(slot, dict) else None,
+            "starts_at": slot.get('starts_at') if isinstance(slot, dict) else None,
+            "ends_at": slot.get('ends_at') if isinstance(slot, dict) else None
+        }
+        results.append(result)
+        
+        if not isinstance(slot, dict):
+            result.update(is_available=False, error="Missing required parameters")
+            continue
+        try:
+            slot_params = SLOT_SCHEMA.validate(slot)
+        except ValidationError as e:
+            result.update(is_available=False, error=str(e))
+            continue
+        
+        candidates.append((result, (slot_params['device_id'], slot_params['starts_at'], slot_params['ends_at'])))
+    
+    availability = scheduler_service.check_availability_batch([slot for _, slot in candidates])
+    for (result, _), is_available in zip(candidates, availability):
+        result['is_available'] = is_available
+    
+    available = [(result, slot) for (result, slot) in candidates if result['is_available']]
+    admissions = capacity_service.admit_batch([
+        (device_id, starts_at, ends_at, None, provisioning_service.deferred_until(starts_at))
+        for _, (device_id, starts_at, ends_at) in available
+    ])
+    for (result, _), admission in zip(available, admissions):
+        if admission['decision'] == 'reject':
+            result.update(is_available=False, reason="No free access code slot on the lock")
+        elif admission['decision'] == 'defer':
+            result['provision_at'] = datetime_to_iso(admission['provision_at'])
     
     return jsonify({
-        "is_available": is_available
+        "results": results
     })
 
 @api_bp.route('/cleanup-expired-codes', methods=['POST'])
-def cleanup_expired_codes():
+@validate(body={'device_id': device_id_field(required=True)})
+def cleanup_expired_codes(params):
     """Clean up expired access codes"""
-    device_id = request.json.get('device_id')
-    
-    if not device_id:
-        abort(400, description="Device ID is required")
+    device_id = params['device_id']
     
     deleted_codes = scheduler_service.seam_service.delete_expired_codes(device_id)
     
     # Update booking statuses
-    bookings, _ = load_data()
-    updated = False
-    
-    for booking in bookings:
-        if booking.is_expired() and booking.status == 'active':
-            booking.status = 'expired'
-            updated = True
+    expired = []
+    for booking in booking_store.iter_bookings(device_id=device_id, status='active', end=get_current_utc_datetime()):
+        booking.status = 'expired'
+        expired.append(booking)
     
-    if updated:
-        save_bookings(bookings)
+    booking_store.update_bookings(expired)
     
     return jsonify({
         "success": True,
         "deleted_codes": deleted_codes
     })
 
-@api_bp.route('/booked-periods', methods=['GET'])
-def get_booked_periods():
-    """Get all booked time periods for a device"""
-    device_id = request.args.get('device_id')
+@api_bp.route('/archive-finished-bookings', methods=['POST'])
+@validate(body={
+    'retention_days': Field('float', default=ARCHIVE_RETENTION_DAYS, minimum=0, maximum=MAX_RETENTION_DAYS),
+})
+def archive_finished_bookings(params):
+    """Move finished bookings that ended over retention_days ago to the archive"""
+    archived = booking_store.archive_finished(
+        get_current_utc_datetime() - timedelta(days=params['retention_days'])
+    )
+    
+    return jsonify({
+        "success": True,
+        "archived": archived
+    })
+
+@api_bp.route('/archive/bookings', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(),
+    'user_id': Field(max_length=128),
+    'status': Field(choices=BOOKING_STATUSES),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+    'limit': Field('int', minimum=1, message="Invalid limit"),
+    'format': Field(choices=('json', 'ndjson')),
+})
+def get_archived_bookings(params):
+    """
+    Search archived bookings, for audits
+    
+    Query parameters:
+        device_id, user_id, status: exact-match filters
+        start, end: ISO8601 bounds on starts_at (>=) and ends_at (<=);
+                    only the archive months between them are read
+        limit: most bookings to return (default 100, max 1000)
+        format: "ndjson" to stream every match one per line
+    """
+    bookings = booking_store.archive.iter_bookings(
+        **{name: params[name] for name in ('device_id', 'user_id', 'status', 'start', 'end')}
+    )
     
-    if not device_id:
-        abort(400, description="Device ID is required")
+    if params['format'] == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        if params['limit'] is not None:
+            bookings = itertools.islice(bookings, params['limit'])
+        
+        def generate():
+            for booking in bookings:
+                yield json.dumps(booking.to_dict()) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
     
-    booked_periods = scheduler_service.get_booked_periods(device_id)
+    limit = min(params['limit'] or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    page = list(itertools.islice(bookings, limit + 1))
+    
+    return jsonify({
+        "bookings": [b.to_dict() for b in page[:limit]],
+        "truncated": len(page) > limit
+    })
+
+@api_bp.route('/analytics/utilization', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(multiple=True),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+    'granularity': Field(choices=tuple(GRANULARITIES), default='day'),
+}, checks=(ends_after_starts('start', 'end'),))
+def get_utilization(params):
+    """
+    Get booked hours, utilization and peak concurrency per device
+    
+    Query parameters:
+        device_id: devices to report; repeat it or comma-separate several
+                   (default: every device with bookings)
+        start, end: ISO8601 range, rounded out to whole UTC hours
+                    (default: the 7 days up to now)
+        granularity: bucket size of the breakdown: hour, day (default) or week
+    """
+    end = params['end'] or get_current_utc_datetime()
+    start = params['start'] or end - timedelta(days=7)
+    if start >= end:
+        abort(400, description="End time must be after start time.")
+    if (end - start) / GRANULARITIES[params['granularity']] > MAX_UTILIZATION_BUCKETS:
+        abort(400, description=f"At most {MAX_UTILIZATION_BUCKETS} buckets per report")
+    
+    # Pick up bookings written by other workers before reading the counters
+    booking_store.refresh()
+    device_ids = params['device_id'] or utilization_service.device_ids()
+    
+    return jsonify(dict(
+        utilization_service.utilization(device_ids, start, end, params['granularity']),
+        granularity=params['granularity']
+    ))
+
+@api_bp.route('/capacity', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(multiple=True),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+    'granularity': Field(choices=tuple(GRANULARITIES), default='hour'),
+}, checks=(ends_after_starts('start', 'end'),))
+def get_capacity(params):
+    """
+    Get access code slot pressure per device over time
+    
+    Query parameters:
+        device_id: devices to report; repeat it or comma-separate several
+                   (default: every device with bookings)
+        start, end: ISO8601 range (default: now to 7 days later, max 90
+                    days); slots are only known from now on
+        granularity: bucket size of the breakdown: hour (default), day or week
+    
+    Each device reports its capacity (slots, lock model, and whether the
+    figure comes from the model's configuration, the device or the
+    default), the most slots its bookings take at once (peak_used) and
+    pressure, peak_used over slots (null when unlimited), per bucket.
+    """
+    start = max(params['start'] or get_current_utc_datetime(), get_current_utc_datetime())
+    end = params['end'] or start + timedelta(days=DEFAULT_FREE_SLOT_WINDOW_DAYS)
+    if start >= end:
+        abort(400, description="End time must be after now and the start time.")
+    if end - start > timedelta(days=MAX_CAPACITY_VIEW_DAYS):
+        abort(400, description=f"Window cannot exceed {MAX_CAPACITY_VIEW_DAYS} days")
+    step = GRANULARITIES[params['granularity']]
+    if (end - start) / step > MAX_UTILIZATION_BUCKETS:
+        abort(400, description=f"At most {MAX_UTILIZATION_BUCKETS} buckets per report")
+    
+    device_ids = params['device_id'] or booking_store.device_ids()
+    
+    return jsonify(dict(
+        capacity_service.usage(device_ids, start, end, step),
+        granularity=params['granularity']
+    ))
+
+@api_bp.route('/reconcile', methods=['POST'])
+@validate(body={
+    'device_ids': Field('list', items=device_id_field(), message="device_ids must be a list"),
+    'apply': Field('bool', default=False),
+    'force': Field('bool', default=False),
+})
+def reconcile(params):
+    """
+    Detect drift between bookings and the codes on the locks
+    
+    Expects optional {"device_ids": [...], "apply": false, "force": false}.
+    By default this is a dry run that only reports the repair plan.
+    """
+    apply = params['apply']
+    reports = reconciliation_service.reconcile(
+        params['device_ids'], apply=apply, force=params['force']
+    )
+    
+    return jsonify({
+        "dry_run": not apply,
+        "devices": reports
+    })
+
+@api_bp.route('/booked-periods', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(required=True),
+    'start': Field('datetime'),
+    'end': Field('datetime'),
+}, checks=(ends_after_starts('start', 'end'),))
+def get_booked_periods(params):
+    """Get all booked time periods for a device"""
+    # Optional calendar window in which to expand recurring bookings
+    booked_periods = scheduler_service.get_booked_periods(
+        params['device_id'],
+        window_start=params['start'],
+        window_end=params['end']
+    )
     
     return jsonify({
         "booked_periods": booked_periods
     })
 
+@api_bp.route('/stream', methods=['GET'])
+@validate(query={
+    'device_id': device_id_field(required=True),
+    'after': Field(max_length=64),
+    'timeout': Field('float', minimum=0, maximum=MAX_STREAM_SECONDS),
+})
+def stream_changes(params):
+    """
+    Stream a device's booking changes as server-sent events
+    
+    Each event is named after the change (booking.created, booking.cancelled,
+    booking.expired, booking.updated) and its id is a resume token; browsers
+    send the last one back as Last-Event-ID when they reconnect. A "reset"
+    event means the changes since that token are no longer known and the
+    client should reload its view.
+    
+    Query parameters:
+        device_id: the device to follow
+        after: resume token (default: Last-Event-ID, else only new changes)
+        timeout: optional number of seconds after which the stream ends
+    """
+    device_id = params['device_id']
+    bus = change_bus._get_current_object()
+    token = params['after'] or request.headers.get('Last-Event-ID') or bus.current_token()
+    timeout = params['timeout']
+    
+    def generate():
+        nonlocal token
+        deadline = None if timeout is None else get_current_utc_datetime() + timedelta(seconds=timeout)
+        yield "retry: 3000\n\n"
+        while True:
+            wait = STREAM_KEEPALIVE_SECONDS
+            if deadline is not None:
+                wait = min(wait, (deadline - get_current_utc_datetime()).total_seconds())
+                if wait <= 0:
+                    return
+            
+            changes = bus.wait(device_id, token, wait)
+            if changes is None:
+                token = bus.current_token()
+                yield f"id: {token}\nevent: reset\ndata: {{}}\n\n"
+            elif not changes:
+                yield ": keepalive\n\n"
+            for change in changes or ():
+                token = change['id']
+                yield f"id: {token}\nevent: {change['type']}\ndata: {json.dumps(change['data'])}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @api_bp.route('/handle-consecutive-bookings', methods=['POST'])
-def handle_consecutive_bookings():
+@validate(body={'device_id': device_id_field(required=True)})
+def handle_consecutive_bookings(params):
     """Identify and handle consecutive bookings"""
-    device_id = request.json.get('device_id')
-    
-    if not device_id:
-        abort(400, description="Device ID is required")
-    
-    consecutive_groups = scheduler_service.handle_consecutive_bookings(device_id)
+    consecutive_groups = scheduler_service.handle_consecutive_bookings(params['device_id'])
     
     # Format the response
     formatted_groups = []
@@ -1,98 +1,361 @@
-from datetime import datetime
+from datetime import timedelta
+from functools import wraps
+from flask import request, abort
+from app.utils.time_utils import EARLIEST_DATETIME, LATEST_DATETIME, to_utc_datetime, get_current_utc_datetime
+from app.utils.recurrence import Recurrence
+import math
 import re
 
+# Patterns are compiled once, when the module is imported
+ISO8601_REGEX = re.compile(
+    r'^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?$'
+)
+EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+PHONE_REGEX = re.compile(r'^\+?[0-9]{10,15}$')
+DEVICE_ID_REGEX = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.:-]{0,127}$')
+
+# Longest single booking (or occurrence of a recurring booking)
+MAX_BOOKING_HOURS = 72
+
+BOOKING_STATUSES = ('scheduled', 'pending', 'provisioning', 'active', 'failed', 'cancelled', 'expired')
+
+class ValidationError(ValueError):
+    """Raised when request input does not match its schema"""
+
 def validate_iso8601(date_string):
     """
     Validate that a string is in ISO8601 format
-    
+
     Args:
         date_string (str): The string to validate
-        
+
     Returns:
         bool: True if valid, False otherwise
     """
     try:
-        # Try to parse the string as an ISO8601 datetime
-        datetime.fromisoformat(date_string.replace('Z', '+00:00'))
+        _parse_datetime(date_string)
         return True
-    except (ValueError, AttributeError):
+    except ValueError:
         return False
 
 def validate_email(email):
     """
     Validate that a string is a valid email address
-    
+
     Args:
         email (str): The email to validate
-        
+
     Returns:
         bool: True if valid, False otherwise
     """
-    # Simple regex for email validation
-    email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(email_regex, email))
+    return isinstance(email, str) and bool(EMAIL_REGEX.match(email))
 
 def validate_phone(phone):
     """
     Validate that a string is a valid phone number
-    
+
     Args:
         phone (str): The phone number to validate
-        
+
     Returns:
         bool: True if valid, False otherwise
     """
-    # Simple regex for phone validation (allows international formats)
-    phone_regex = r'^\+?[0-9]{10,15}$'
-    return bool(re.match(phone_regex, phone))
+    # Allows international formats
+    return isinstance(phone, str) and bool(PHONE_REGEX.match(phone))
+
+# Value parsers: each takes the raw value and returns the parsed one or raises ValueError
+
+def _parse_str(value):
+    if not isinstance(value, str):
+        raise ValueError
+    return value
+
+def _parse_datetime(value):
+    if not isinstance(value, str) or not ISO8601_REGEX.match(value):
+        raise ValueError
+    parsed = to_utc_datetime(value)
+    if not EARLIEST_DATETIME <= parsed < LATEST_DATETIME:
+        raise ValueError
+    return parsed
+
+def _parse_int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    return int(value)
+
+def _parse_float(value):
+    if isinstance(value, bool):
+        raise ValueError
+    parsed = float(value)
+    if not math.isfinite(parsed):
+        raise ValueError
+    return parsed
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false', '1', '0'):
+        return value.lower() in ('true', '1')
+    raise ValueError
+
+def _parse_minutes(value):
+    return timedelta(minutes=_parse_float(value))
+
+def _parse_list(value):
+    if not isinstance(value, list):
+        raise ValueError
+    return value
+
+PARSERS = {
+    'str': _parse_str,
+    'datetime': _parse_datetime,
+    'int': _parse_int,
+    'float': _parse_float,
+    'bool': _parse_bool,
+    'minutes': _parse_minutes,
+    'list': _parse_list,
+}
+
+class Field:
+    def __init__(self, type='str', required=False, default=None, pattern=None, choices=None,
+                 minimum=None, maximum=None, max_length=None, multiple=False, items=None,
+                 message=None, missing_message=None):
+        """
+        Declare one request parameter
+
+        The parser and pattern are resolved here, so a schema built at import
+        time does no compiling or lookups per request.
+
+        Args:
+            type (str, optional): Key of PARSERS
+            required (bool, optional): Reject the request if the value is missing
+            default (object, optional): Value used when the parameter is missing
+            pattern (str|Pattern, optional): Regex the raw string must match
+            choices (tuple, optional): Allowed values
+            minimum, maximum (optional): Bounds on the parsed value
+            max_length (int, optional): Longest allowed string
+            multiple (bool, optional): Query parameter that may be repeated and/or
+                                       comma-separated; parsed into a list
+            items (Field, optional): Schema of each element of a "list" value
+            message (str, optional): Error when the value is invalid
+            missing_message (str, optional): Error when a required value is missing
+        """
+        self.parse = PARSERS[type]
+        self.required = required
+        self.default = default
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.choices = frozenset(choices) if choices else None
+        self.minimum = minimum
+        self.maximum = maximum
+        self.max_length = max_length
+        self.multiple = multiple
+        self.items = items
+        self.message = message
+        self.missing_message = missing_message
+
+    def read(self, source, name):
+        """Get the raw value (or values, for multiple) of this field from a mapping"""
+        if self.multiple and hasattr(source, 'getlist'):
+            values = []
+            for raw in source.getlist(name):
+                for value in raw.split(','):
+                    value = value.strip()
+                    if value and value not in values:
+                        values.append(value)
+            return values or None
+        value = source.get(name)
+        return None if value == '' else value
+
+    def convert(self, name, value):
+        """Parse and check one raw value"""
+        if self.multiple:
+            return [self._convert_one(name, item) for item in (value if isinstance(value, list) else [value])]
+        return self._convert_one(name, value)
+
+    def _convert_one(self, name, value):
+        if self.pattern is not None and not (isinstance(value, str) and self.pattern.match(value)):
+            raise ValidationError(self.message or f"Invalid {name}")
+        if self.max_length is not None and isinstance(value, str) and len(value) > self.max_length:
+            raise ValidationError(f"{name} cannot exceed {self.max_length} characters")
+
+        try:
+            parsed = self.parse(value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValidationError(self.message or _invalid_message(name, self.parse))
+
+        if self.choices is not None and parsed not in self.choices:
+            raise ValidationError(f"Invalid {name}. Must be one of: {', '.join(sorted(self.choices))}")
+        if (self.minimum is not None and parsed < self.minimum) or \
+           (self.maximum is not None and parsed > self.maximum):
+            raise ValidationError(self.message or f"Invalid {name}")
+        if self.items is not None:
+            parsed = [self.items.convert(name, item) for item in parsed]
+        return parsed
+
+class Schema:
+    def __init__(self, fields, checks=()):
+        """
+        Compile a request schema
+
+        Args:
+            fields (dict): Parameter name -> Field
+            checks (tuple, optional): Cross-field checks; each takes the parsed
+                                      values and raises ValidationError
+        """
+        self.fields = tuple(fields.items())
+        self.checks = tuple(checks)
+
+    def validate(self, source):
+        """
+        Parse a mapping of raw values
+
+        Args:
+            source (Mapping): Query arguments or a JSON object
+
+        Returns:
+            dict: Parsed values (missing optional fields get their default)
+
+        Raises:
+            ValidationError: If any value is missing or invalid
+        """
+        if not isinstance(source, dict) and not hasattr(source, 'getlist'):
+            raise ValidationError("Request body must be a JSON object")
+
+        params = {}
+        for name, field in self.fields:
+            value = field.read(source, name)
+            if value is None:
+                if field.required:
+                    raise ValidationError(field.missing_message or f"Missing required field: {name}")
+                params[name] = field.default
+            else:
+                params[name] = field.convert(name, value)
+
+        for check in self.checks:
+            check(params)
+        return params
+
+def validate(query=None, body=None, checks=()):
+    """
+    Validate a route's input before the handler runs
+
+    The parsed values are passed to the handler as a "params" keyword
+    argument. Invalid requests are rejected with a 400 before the handler
+    (and so any Seam call) runs.
+
+    Args:
+        query (dict|Schema, optional): Schema of the query string
+        body (dict|Schema, optional): Schema of the JSON body (a missing body
+                                      counts as an empty object)
+        checks (tuple, optional): Cross-field checks over the combined values
+
+    Returns:
+        callable: Route decorator
+    """
+    query_schema = _schema(query)
+    body_schema = _schema(body)
+    checks = tuple(checks)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            params = {}
+            try:
+                if query_schema is not None:
+                    params.update(query_schema.validate(request.args))
+                if body_schema is not None:
+                    data = request.get_json(silent=True)
+                    params.update(body_schema.validate({} if data is None else data))
+                for check in checks:
+                    check(params)
+            except ValidationError as e:
+                abort(400, description=str(e))
+            return view(*args, params=params, **kwargs)
+        return wrapper
+    return decorator
+
+# Cross-field checks
+
+def ends_after_starts(start='starts_at', end='ends_at'):
+    """Check that an end time follows its start time (when both are given)"""
+    def check(params):
+        if params.get(start) and params.get(end) and params[end] <= params[start]:
+            raise ValidationError("End time must be after start time.")
+    return check
+
+def starts_in_future(start='starts_at'):
+    """Check that a start time is not in the past"""
+    def check(params):
+        if params.get(start) and params[start] < get_current_utc_datetime():
+            raise ValidationError("Start time cannot be in the past.")
+    return check
+
+def max_duration(hours, start='starts_at', end='ends_at'):
+    """Check that a time span is not longer than the given number of hours"""
+    limit = timedelta(hours=hours)
+    def check(params):
+        if params.get(start) and params.get(end) and params[end] - params[start] > limit:
+            raise ValidationError(f"Booking duration cannot exceed {hours} hours.")
+    return check
+
+def valid_recurrence(rule='recurrence', start='starts_at', end='ends_at'):
+    """Check that a recurrence rule parses and ends in range for the given first occurrence"""
+    def check(params):
+        if params.get(rule):
+            try:
+                last_end = Recurrence(params[rule], params[start], params[end]).last_end()
+            except ValueError as e:
+                raise ValidationError(str(e))
+            except OverflowError:
+                last_end = LATEST_DATETIME
+            if last_end is not None and last_end >= LATEST_DATETIME:
+                raise ValidationError("Recurring series must end before the year 9000")
+    return check
+
+def device_id_field(**kwargs):
+    """Field for a Seam device ID"""
+    kwargs.setdefault('missing_message', "Device ID is required")
+    kwargs.setdefault('message', "Invalid device ID")
+    return Field(pattern=DEVICE_ID_REGEX, **kwargs)
+
+BOOKING_SCHEMA = Schema({
+    'device_id': device_id_field(required=True),
+    'starts_at': Field('datetime', required=True, message="Invalid start time format. Must be ISO8601."),
+    'ends_at': Field('datetime', required=True, message="Invalid end time format. Must be ISO8601."),
+    'user_name': Field(required=True, max_length=200),
+    'user_email': Field(required=True, pattern=EMAIL_REGEX, message="Invalid email address."),
+    'user_phone': Field(pattern=PHONE_REGEX, message="Invalid phone number."),
+    'recurrence': Field(max_length=200),
+    'async': Field('bool'),
+}, checks=(
+    ends_after_starts(),
+    starts_in_future(),
+    max_duration(MAX_BOOKING_HOURS),
+    valid_recurrence(),
+))
 
 def validate_booking_data(data):
     """
     Validate booking data
-    
+
     Args:
         data (dict): The booking data to validate
-        
+
     Returns:
         tuple: (is_valid, error_message)
     """
-    # Check required fields
-    required_fields = ['device_id', 'starts_at', 'ends_at', 'user_name', 'user_email']
-    for field in required_fields:
-        if field not in data:
-            return False, f"Missing required field: {field}"
-    
-    # Validate time formats
-    if not validate_iso8601(data['starts_at']):
-        return False, "Invalid start time format. Must be ISO8601."
-    
-    if not validate_iso8601(data['ends_at']):
-        return False, "Invalid end time format. Must be ISO8601."
-    
-    # Validate email
-    if not validate_email(data['user_email']):
-        return False, "Invalid email address."
-    
-    # Validate phone if provided
-    if 'user_phone' in data and data['user_phone'] and not validate_phone(data['user_phone']):
-        return False, "Invalid phone number."
-    
-    # Validate time logic
-    start_time = datetime.fromisoformat(data['starts_at'].replace('Z', '+00:00'))
-    end_time = datetime.fromisoformat(data['ends_at'].replace('Z', '+00:00'))
-    
-    if start_time >= end_time:
-        return False, "End time must be after start time."
-    
-    now = datetime.utcnow()
-    if start_time < now:
-        return False, "Start time cannot be in the past."
-    
-    # Check duration (optional)
-    max_duration_hours = 72  # 3 days
-    duration = (end_time - start_time).total_seconds() / 3600
-    
-    if duration > max_duration_hours:
-        return False, f"Booking duration cannot exceed {max_duration_hours} hours."
-    
-    return True, None 
\ No newline at end of file
+    try:
+        BOOKING_SCHEMA.validate(data)
+    except ValidationError as e:
+        return False, str(e)
+    return True, None
+
+def _schema(spec):
+    if spec is None or isinstance(spec, Schema):
+        return spec
+    return Schema(spec)
+
+def _invalid_message(name, parse):
+    if parse is _parse_datetime:
+        return f"Invalid {name} format. Must be ISO8601."
+    return f"Invalid {name}"
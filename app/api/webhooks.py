@@ -0,0 +1,39 @@
+from flask import Blueprint, request, jsonify, abort
+from app.services.container import service_proxy
+from app.services.webhook_service import WebhookSignatureError
+import json
+
+# Create the blueprint
+webhooks_bp = Blueprint('webhooks', __name__)
+
+# Services of the running app, built lazily by create_app()'s container
+webhook_service = service_proxy('webhook_service')
+
+@webhooks_bp.route('/seam', methods=['POST'])
+def receive_seam_webhook():
+    """Receive a signed access code or device event from Seam"""
+    if not webhook_service.secret:
+        abort(503, description="Webhook secret not configured")
+
+    body = request.get_data()
+
+    try:
+        webhook_service.verify_signature(request.headers, body)
+    except WebhookSignatureError as e:
+        abort(401, description=str(e))
+
+    try:
+        event = json.loads(body)
+    except ValueError:
+        abort(400, description="Invalid JSON payload")
+
+    if not isinstance(event, dict):
+        abort(400, description="Invalid JSON payload")
+
+    event_id = event.get('event_id') or request.headers.get('svix-id')
+    status = webhook_service.ingest(event_id, event)
+
+    return jsonify({
+        "success": True,
+        "status": status
+    })
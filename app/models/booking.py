@@ -1,11 +1,14 @@
 from datetime import datetime
 import uuid
-from app.utils.time_utils import get_current_utc_iso, is_time_between, is_in_past, is_in_future
+from app.utils.time_utils import get_current_utc_iso, get_current_utc_datetime, is_time_between, is_in_past, is_in_future, datetime_to_iso, to_utc_datetime
+from app.utils.recurrence import Recurrence
 
 class Booking:
     def __init__(self, id=None, device_id=None, user_id=None, 
                  access_code_id=None, code=None, starts_at=None, 
-                 ends_at=None, created_at=None, status=None):
+                 ends_at=None, created_at=None, status=None, updated_at=None,
+                 recurrence=None, occurrence_codes=None, access_code_status=None,
+                 provisioning_error=None):
         """
         Initialize a Booking object
         
@@ -18,7 +21,17 @@ class Booking:
             starts_at (str, optional): ISO8601 formatted string for start time
             ends_at (str, optional): ISO8601 formatted string for end time
             created_at (datetime, optional): When the booking was created
-            status (str, optional): Status of the booking (active, expired, cancelled)
+            status (str, optional): Status of the booking (scheduled, pending,
+                                    provisioning, active, failed, expired, cancelled)
+            updated_at (datetime, optional): When the booking was last modified
+            recurrence (str, optional): RRULE-style rule making this a recurring series;
+                                        starts_at/ends_at are then the first occurrence
+            occurrence_codes (dict, optional): Access codes provisioned for upcoming
+                                               occurrences, keyed by occurrence start
+            access_code_status (str, optional): Lock-side state of the access code as
+                                                reported by Seam (set, removed, failed)
+            provisioning_error (str, optional): Why the access code of a
+                                                 failed booking could not be created
         """
         self.id = id or str(uuid.uuid4())
         self.device_id = device_id
@@ -27,8 +40,13 @@ class Booking:
         self.code = code
         self.starts_at = starts_at
         self.ends_at = ends_at
-        self.created_at = created_at or datetime.utcnow()
+        self.created_at = created_at or get_current_utc_datetime()
         self.status = status or 'active'
+        self.updated_at = updated_at or self.created_at
+        self.recurrence = recurrence
+        self.occurrence_codes = occurrence_codes or {}
+        self.access_code_status = access_code_status
+        self.provisioning_error = provisioning_error
     
     def to_dict(self):
         """
@@ -37,7 +55,7 @@ class Booking:
         Returns:
             dict: Dictionary representation of the booking
         """
-        return {
+        data = {
             'id': self.id,
             'device_id': self.device_id,
             'user_id': self.user_id,
@@ -45,9 +63,20 @@ class Booking:
             'code': self.code,
             'starts_at': self.starts_at,
             'ends_at': self.ends_at,
-            'created_at': self.created_at.isoformat() + 'Z' if isinstance(self.created_at, datetime) else self.created_at,
-            'status': self.status
+            'created_at': datetime_to_iso(self.created_at) if isinstance(self.created_at, datetime) else self.created_at,
+            'status': self.status,
+            'updated_at': datetime_to_iso(self.updated_at) if isinstance(self.updated_at, datetime) else self.updated_at,
+            'recurrence': self.recurrence,
+            'access_code_status': self.access_code_status
         }
+        
+        if self.recurrence:
+            data['occurrence_codes'] = self.occurrence_codes
+        
+        if self.provisioning_error:
+            data['provisioning_error'] = self.provisioning_error
+        
+        return data
     
     @classmethod
     def from_dict(cls, data):
@@ -60,14 +89,8 @@ class Booking:
         Returns:
             Booking: A new Booking object
         """
-        if data.get('created_at'):
-            # Parse ISO format to datetime
-            if isinstance(data['created_at'], str):
-                created_at = datetime.fromisoformat(data['created_at'].replace('Z', '+00:00'))
-            else:
-                created_at = data['created_at']
-        else:
-            created_at = None
+        created_at = cls._parse_timestamp(data.get('created_at'))
+        updated_at = cls._parse_timestamp(data.get('updated_at'))
             
         return cls(
             id=data.get('id'),
@@ -78,9 +101,56 @@ class Booking:
             starts_at=data.get('starts_at'),
             ends_at=data.get('ends_at'),
             created_at=created_at,
-            status=data.get('status')
+            status=data.get('status'),
+            updated_at=updated_at,
+            recurrence=data.get('recurrence'),
+            occurrence_codes=data.get('occurrence_codes'),
+            access_code_status=data.get('access_code_status'),
+            provisioning_error=data.get('provisioning_error')
         )
     
+    @staticmethod
+    def _parse_timestamp(value):
+        """
+        Parse a stored timestamp into a datetime
+        
+        Args:
+            value (str|datetime): ISO8601 string or datetime
+            
+        Returns:
+            datetime: The parsed datetime, or None if no value was given
+        """
+        if not value:
+            return None
+        if isinstance(value, str):
+            # Parse ISO format to datetime
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return value
+    
+    def get_recurrence(self):
+        """
+        Get the recurring series this booking describes
+        
+        Returns:
+            Recurrence: The series, or None for a one-off booking
+        """
+        if not self.recurrence:
+            return None
+        return Recurrence(self.recurrence, self.starts_at, self.ends_at)
+    
+    def final_ends_at(self):
+        """
+        Get the time at which the booking stops granting access
+        
+        Returns:
+            datetime: End of the booking (or of its last occurrence), or None
+                      for a series that never ends
+        """
+        recurrence = self.get_recurrence()
+        if recurrence:
+            return recurrence.last_end()
+        return to_utc_datetime(self.ends_at)
+    
     def is_active(self):
         """
         Check if the booking is currently active
@@ -90,6 +160,10 @@ class Booking:
         """
         if self.status != 'active':
             return False
+        
+        recurrence = self.get_recurrence()
+        if recurrence:
+            return recurrence.occurrence_at(get_current_utc_datetime()) is not None
             
         now = get_current_utc_iso()
         return is_time_between(now, self.starts_at, self.ends_at)
@@ -101,6 +175,10 @@ class Booking:
         Returns:
             bool: True if the booking has expired, False otherwise
         """
+        if self.recurrence:
+            final_end = self.final_ends_at()
+            return final_end is not None and final_end < get_current_utc_datetime()
+        
         now = get_current_utc_iso()
         return is_in_past(self.ends_at)
     
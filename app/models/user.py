@@ -1,4 +1,5 @@
 from datetime import datetime
+from app.utils.time_utils import datetime_to_iso, get_current_utc_datetime
 
 class User:
     def __init__(self, id=None, name=None, email=None, phone=None, created_at=None):
@@ -16,7 +17,7 @@ class User:
         self.name = name
         self.email = email
         self.phone = phone
-        self.created_at = created_at or datetime.utcnow()
+        self.created_at = created_at or get_current_utc_datetime()
     
     def to_dict(self):
         """
@@ -30,7 +31,7 @@ class User:
             'name': self.name,
             'email': self.email,
             'phone': self.phone,
-            'created_at': self.created_at.isoformat() + 'Z'
+            'created_at': datetime_to_iso(self.created_at)
         }
     
     @classmethod
@@ -0,0 +1,241 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from app.models.booking import Booking
+from app.utils.time_utils import datetime_to_iso, get_current_utc_datetime, to_utc_datetime
+
+# Bookings in these statuses count as occupied time
+COUNTED_STATUSES = ('scheduled', 'pending', 'provisioning', 'active', 'expired')
+
+# How far past the present (or a future series' start) its occurrences are counted
+ANALYTICS_SERIES_HORIZON_DAYS = int(os.getenv('ANALYTICS_SERIES_HORIZON_DAYS', 90))
+
+# Bucket sizes accepted by utilization queries
+GRANULARITIES = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_HOUR = timedelta(hours=1)
+
+# Hour indexes (hours since the epoch) fit in 2**24, i.e. until the year 3883
+_TREE_SIZE = 1 << 24
+
+class UtilizationService:
+    def __init__(self, booking_store, series_horizon_days=ANALYTICS_SERIES_HORIZON_DAYS):
+        """
+        Initialize the utilization service
+
+        Keeps, per device, the booked seconds of every UTC hour in a sparse
+        Fenwick tree (running prefix sums), so the booked time of any range
+        is two prefix lookups and a breakdown into buckets costs one pair
+        per bucket, however much history there is. Overlapping bookings are
+        counted per hour for peak concurrency.
+
+        Counters are built once from the store (hot and archived bookings)
+        and then updated from booking changes as the store sees them, so
+        queries never rescan bookings.
+
+        Args:
+            booking_store (BookingStore): Store whose bookings are measured
+            series_horizon_days (int, optional): Days past the time a series is seen
+                                                 (or starts, if later) up to which
+                                                 its occurrences count
+        """
+        self.booking_store = booking_store
+        self.series_horizon_days = series_horizon_days
+        self._devices = {}
+        self._contributions = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """Build the counters from every stored booking (once)"""
+        if self._loaded:
+            return
+        for row in self.booking_store.archive.iter_rows():
+            self.record_booking_row(row)
+        for booking in self.booking_store.iter_bookings():
+            self.record_booking_row(booking.to_dict())
+        self._loaded = True
+
+    def resync(self):
+        """
+        Re-read every booking at the next query
+
+        Registered with BookingStore.add_reset_listener: after another
+        process compacted the log, rows it wrote meanwhile were never
+        reported. Reloading re-applies every row, replacing the
+        contributions already held, so nothing is counted twice.
+        """
+        with self._lock:
+            self._loaded = False
+
+    def record_booking_row(self, row, is_new=True):
+        """
+        Apply a booking row to the counters
+
+        Registered with BookingStore.add_change_listener. A booking's
+        previous contribution is replaced, so rows may be applied more than
+        once or out of order (older versions are ignored).
+
+        Args:
+            row (dict): The booking row
+            is_new (bool, optional): Unused; part of the listener signature
+        """
+        updated_at = row.get('updated_at') or ''
+        hours = self._booked_hours(row) if row.get('status') in COUNTED_STATUSES else {}
+
+        with self._lock:
+            previous = self._contributions.get(row['id'])
+            if previous is not None:
+                if previous[1] > updated_at:
+                    return
+                self._apply(previous[0], previous[2], -1)
+            self._apply(row.get('device_id'), hours, 1)
+            self._contributions[row['id']] = (row.get('device_id'), updated_at, hours)
+
+    def _booked_hours(self, row):
+        """Booked seconds of a booking per hour index"""
+        booking = Booking.from_dict(row)
+        series = booking.get_recurrence()
+        if series:
+            horizon = max(get_current_utc_datetime(), to_utc_datetime(booking.starts_at))
+            horizon += timedelta(days=self.series_horizon_days)
+            intervals = series.occurrences(None, horizon)
+        else:
+            intervals = [(to_utc_datetime(booking.starts_at), to_utc_datetime(booking.ends_at))]
+
+        hours = {}
+        for start, end in intervals:
+            hour = _hour_index(start)
+            while start < end:
+                hour_end = _EPOCH + (hour + 1) * _HOUR
+                seconds = (min(end, hour_end) - start).total_seconds()
+                hours[hour] = hours.get(hour, 0) + seconds
+                start = hour_end
+                hour += 1
+        return hours
+
+    def _apply(self, device_id, hours, sign):
+        """Add (sign=1) or remove (sign=-1) a booking's hours; caller holds the lock"""
+        if not hours:
+            return
+        usage = self._devices.get(device_id)
+        if usage is None:
+            usage = self._devices[device_id] = _DeviceUsage()
+        for hour, seconds in hours.items():
+            usage.seconds.add(hour, sign * seconds)
+            count = usage.bookings.get(hour, 0) + sign
+            if count:
+                usage.bookings[hour] = count
+            else:
+                usage.bookings.pop(hour, None)
+
+    def device_ids(self):
+        """
+        Get the devices that have counted bookings
+
+        Returns:
+            list: Device IDs
+        """
+        self.load()
+        with self._lock:
+            return sorted(device_id for device_id in self._devices if device_id)
+
+    def utilization(self, device_ids, start, end, granularity='day'):
+        """
+        Get booked time and peak concurrency per device within a range
+
+        Args:
+            device_ids (list): IDs of the locks
+            start (datetime): Start of the range (rounded down to the hour)
+            end (datetime): End of the range (rounded up to the hour)
+            granularity (str, optional): Bucket size: hour, day or week
+
+        Returns:
+            dict: starts_at/ends_at of the rounded range and, per device,
+                  booked_hours, utilization (booked share of the range),
+                  peak_concurrent and the per-bucket breakdown
+        """
+        self.load()
+        first = _hour_index(start)
+        last = -(-int((to_utc_datetime(end) - _EPOCH).total_seconds()) // 3600)
+        step = int(GRANULARITIES[granularity] / _HOUR)
+
+        devices = {}
+        with self._lock:
+            for device_id in device_ids:
+                usage = self._devices.get(device_id) or _DeviceUsage()
+                buckets = []
+                for bucket_start in range(first, last, step):
+                    bucket_end = min(bucket_start + step, last)
+                    seconds = usage.seconds.range_sum(bucket_start, bucket_end)
+                    buckets.append({
+                        'starts_at': _hour_datetime(bucket_start),
+                        'booked_hours': round(seconds / 3600, 4),
+                        'utilization': round(seconds / ((bucket_end - bucket_start) * 3600), 4)
+                    })
+                seconds = usage.seconds.range_sum(first, last)
+                devices[device_id] = {
+                    'booked_hours': round(seconds / 3600, 4),
+                    'utilization': round(seconds / ((last - first) * 3600), 4) if last > first else 0,
+                    'peak_concurrent': usage.peak(first, last),
+                    'buckets': buckets
+                }
+
+        return {
+            'starts_at': _hour_datetime(first),
+            'ends_at': _hour_datetime(last),
+            'devices': devices
+        }
+
+class _DeviceUsage:
+    """Counters of one device"""
+
+    def __init__(self):
+        self.seconds = _FenwickTree()
+        # Hour index -> number of bookings overlapping that hour
+        self.bookings = {}
+
+    def peak(self, first, last):
+        """Most bookings overlapping any one hour in [first, last)"""
+        if last - first > len(self.bookings):
+            counts = (count for hour, count in self.bookings.items() if first <= hour < last)
+        else:
+            counts = (self.bookings.get(hour, 0) for hour in range(first, last))
+        return max(counts, default=0)
+
+class _FenwickTree:
+    """Sparse Fenwick (binary indexed) tree: O(log n) point updates and prefix sums"""
+
+    def __init__(self, size=_TREE_SIZE):
+        self.size = size
+        self._tree = {}
+
+    def add(self, index, value):
+        index += 1
+        while index <= self.size:
+            self._tree[index] = self._tree.get(index, 0) + value
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """Sum of the values at indexes below index"""
+        total = 0
+        while index > 0:
+            total += self._tree.get(index, 0)
+            index -= index & -index
+        return total
+
+    def range_sum(self, start, end):
+        """Sum of the values at indexes in [start, end)"""
+        return self.prefix_sum(end) - self.prefix_sum(start)
+
+def _hour_index(value):
+    """Hours since the epoch of the UTC hour containing a time"""
+    return int((to_utc_datetime(value) - _EPOCH).total_seconds() // 3600)
+
+def _hour_datetime(index):
+    return datetime_to_iso(_EPOCH + index * _HOUR)
@@ -0,0 +1,206 @@
+import gzip
+import json
+import os
+import zlib
+from app.models.booking import Booking
+from app.utils.time_utils import to_utc_datetime
+
+# Finished bookings stay in the hot store this long after they end
+ARCHIVE_RETENTION_DAYS = int(os.getenv('ARCHIVE_RETENTION_DAYS', 30))
+
+# Statuses of bookings that are over and may be archived
+FINISHED_STATUSES = ('cancelled', 'expired', 'failed')
+
+SEGMENT_PREFIX = 'bookings-'
+SEGMENT_SUFFIX = '.ndjson.gz'
+
+# Every gzip member starts with these bytes (magic number, deflate method)
+_GZIP_MAGIC = b'\x1f\x8b\x08'
+
+class BookingArchive:
+    def __init__(self, archive_dir):
+        """
+        Initialize the booking archive
+
+        Finished bookings are kept in gzip-compressed NDJSON segments, one
+        per month in which the bookings (or, for a series, their last
+        occurrence) ended: bookings-YYYY-MM.ndjson.gz. Each archiving run
+        appends one gzip member per segment it touches, so segments are
+        append-only and never rewritten. Range queries only open the
+        segments whose month can hold a match. A member torn by a crashed
+        run is skipped; its rows were still in the hot log and are archived
+        again by the next run.
+
+        Args:
+            archive_dir (str): Directory holding the segments
+        """
+        self.archive_dir = archive_dir
+
+    def segment_path(self, month):
+        """
+        Get the path of a month's segment
+
+        Args:
+            month (str): "YYYY-MM"
+
+        Returns:
+            str: Path of the segment file
+        """
+        return os.path.join(self.archive_dir, f"{SEGMENT_PREFIX}{month}{SEGMENT_SUFFIX}")
+
+    def segments(self, start=None, end=None):
+        """
+        List the segments that can hold bookings ending within a range
+
+        Args:
+            start (datetime, optional): Earliest end time of interest
+            end (datetime, optional): Latest end time of interest
+
+        Returns:
+            list: (month, path) tuples in month order
+        """
+        if not os.path.isdir(self.archive_dir):
+            return []
+
+        low = _month(start) if start is not None else None
+        high = _month(end) if end is not None else None
+
+        segments = []
+        for name in os.listdir(self.archive_dir):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            month = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            if (low is None or month >= low) and (high is None or month <= high):
+                segments.append((month, os.path.join(self.archive_dir, name)))
+        return sorted(segments)
+
+    def append(self, rows):
+        """
+        Append booking rows to their month segments
+
+        Callers must hold the booking store's write lock.
+
+        Args:
+            rows (list): Booking rows whose final end time is known
+        """
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(_month(Booking.from_dict(row).final_ends_at()), []).append(row)
+
+        if not os.path.exists(self.archive_dir):
+            os.makedirs(self.archive_dir)
+
+        for month, month_rows in sorted(by_month.items()):
+            data = ''.join(json.dumps(row) + '\n' for row in month_rows).encode()
+            with open(self.segment_path(month), 'ab') as f:
+                f.write(gzip.compress(data))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def iter_rows(self, start=None, end=None):
+        """
+        Yield the archived rows of the segments covering a range
+
+        A row archived twice (a run interrupted before the hot log was
+        rewritten) is yielded once.
+
+        Args:
+            start (datetime, optional): Earliest end time of interest
+            end (datetime, optional): Latest end time of interest
+
+        Returns:
+            generator: Booking rows, segment by segment
+        """
+        for month_rows in self._iter_months(start, end):
+            yield from month_rows
+
+    def iter_bookings(self, device_id=None, user_id=None, status=None, start=None, end=None):
+        """
+        Yield archived bookings matching the given filters
+
+        Filters mean the same as in BookingStore.iter_bookings.
+
+        Args:
+            device_id (str, optional): Only bookings for this device
+            user_id (str, optional): Only bookings for this user
+            status (str, optional): Only bookings with this status
+            start (datetime, optional): Only bookings starting at or after this time
+            end (datetime, optional): Only bookings ending at or before this time
+
+        Returns:
+            generator: Matching Booking objects, in creation order within each month
+        """
+        for month_rows in self._iter_months(start, end):
+            matches = []
+            for row in month_rows:
+                if device_id is not None and row.get('device_id') != device_id:
+                    continue
+                if user_id is not None and row.get('user_id') != user_id:
+                    continue
+                if status is not None and row.get('status') != status:
+                    continue
+
+                booking = Booking.from_dict(row)
+                if start is not None and to_utc_datetime(booking.starts_at) < start:
+                    continue
+                if end is not None and booking.final_ends_at() > end:
+                    continue
+                matches.append(booking)
+
+            yield from sorted(matches, key=lambda b: (to_utc_datetime(b.created_at), b.id))
+
+    def get_booking(self, booking_id):
+        """
+        Find an archived booking by ID (scans every segment)
+
+        Args:
+            booking_id (str): The booking ID
+
+        Returns:
+            Booking: The booking, or None if it is not archived
+        """
+        for row in self.iter_rows():
+            if row['id'] == booking_id:
+                return Booking.from_dict(row)
+        return None
+
+    def _iter_months(self, start, end):
+        """Yield the deduplicated rows of each segment covering a range"""
+        for _, path in self.segments(start, end):
+            rows = {}
+            for row in _read_segment(path):
+                rows[row['id']] = row
+            yield rows.values()
+
+def _month(value):
+    """Segment month ("YYYY-MM") of a time"""
+    return to_utc_datetime(value).strftime('%Y-%m')
+
+def _read_segment(path):
+    """
+    Yield the rows of a segment, member by member
+
+    A corrupt member (a torn write followed by later appends) is skipped up
+    to the next member header; a trailing member still being written ends
+    the read, and its rows show up on the next one.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    while data:
+        decoder = zlib.decompressobj(wbits=31)
+        try:
+            text = decoder.decompress(data)
+        except zlib.error:
+            following = data.find(_GZIP_MAGIC, 1)
+            if following < 0:
+                return
+            data = data[following:]
+            continue
+        if not decoder.eof:
+            return
+
+        for line in text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+        data = decoder.unused_data
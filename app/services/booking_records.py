@@ -0,0 +1,378 @@
+import json
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from app.models.booking import Booking
+
+# Keep a fixed-width binary copy of the booking log's index fields next to it
+BOOKING_RECORDS_ENABLED = os.getenv('BOOKING_RECORDS_ENABLED', 'True').lower() == 'true'
+
+_MAGIC = b'SLBR'
+_FORMAT_VERSION = 1
+
+# magic, format version, inode of the booking log the records describe
+_HEADER = struct.Struct('<4sHQ')
+_HEADER_SIZE = 64
+
+# Width of each string field; longer values flag the record as overflowed
+STRING_SIZE = 64
+
+# log offset, line length, created_at, updated_at, starts_at, final end (microseconds
+# since the epoch), status, flags, id, device_id, user_id, access_code_id
+_RECORD = struct.Struct(f'<QIqqqqBB{STRING_SIZE}s{STRING_SIZE}s{STRING_SIZE}s{STRING_SIZE}s')
+
+# Status codes; anything else is stored as UNKNOWN_STATUS with the OVERFLOW flag
+STATUSES = ('scheduled', 'pending', 'provisioning', 'active', 'failed', 'cancelled', 'expired')
+UNKNOWN_STATUS = 255
+
+# Flags
+RECURRING = 1
+OVERFLOW = 2  # the record alone cannot answer filters or index the row; read the JSON line
+
+# final end of a series that never ends; NO_TIME marks a missing time
+NO_END = 2 ** 63 - 1
+NO_TIME = -2 ** 63
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def to_micros(value):
+    """
+    Convert a datetime to microseconds since the epoch
+
+    Args:
+        value (datetime): Aware or naive (UTC) datetime
+
+    Returns:
+        int: Microseconds since 1970-01-01T00:00:00Z
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+def from_micros(micros):
+    """
+    Convert microseconds since the epoch to an aware UTC datetime
+
+    Args:
+        micros (int): Microseconds since 1970-01-01T00:00:00Z
+
+    Returns:
+        datetime: The time
+    """
+    return _EPOCH + timedelta(microseconds=micros)
+
+class BookingRecord:
+    """One fixed-width record; its strings are only decoded when read"""
+
+    __slots__ = ('log_offset', 'length', 'created_at', 'updated_at', 'starts_at', 'final_end',
+                 'status_code', 'flags', '_strings')
+
+    def __init__(self, values):
+        (self.log_offset, self.length, self.created_at, self.updated_at, self.starts_at,
+         self.final_end, self.status_code, self.flags) = values[:8]
+        self._strings = values[8:]
+
+    @property
+    def status(self):
+        return STATUSES[self.status_code] if self.status_code < len(STATUSES) else None
+
+    @property
+    def id(self):
+        return _text(self._strings[0])
+
+    @property
+    def device_id(self):
+        return _text(self._strings[1])
+
+    @property
+    def user_id(self):
+        return _text(self._strings[2])
+
+    @property
+    def access_code_id(self):
+        return _text(self._strings[3])
+
+    @property
+    def overflow(self):
+        return bool(self.flags & OVERFLOW)
+
+    @property
+    def recurring(self):
+        return bool(self.flags & RECURRING)
+
+def _text(value):
+    value = value.rstrip(b'\0')
+    return value.decode() if value else None
+
+def encode_record(row, log_offset, length):
+    """
+    Build the fixed-width record of a booking row
+
+    Args:
+        row (dict): The booking row as written to the log
+        log_offset (int): Offset of its line in the log
+        length (int): Length of its line, newline included
+
+    Returns:
+        bytes: The packed record
+    """
+    flags = RECURRING if row.get('recurrence') else 0
+    if row.get('occurrence_codes'):
+        # A variable number of codes; the access-code index reads them from the line
+        flags |= OVERFLOW
+
+    status = row.get('status')
+    if status in STATUSES:
+        status_code = STATUSES.index(status)
+    else:
+        status_code = UNKNOWN_STATUS
+        flags |= OVERFLOW
+
+    strings = []
+    for field in ('id', 'device_id', 'user_id', 'access_code_id'):
+        value = (row.get(field) or '').encode()
+        if len(value) > STRING_SIZE or not isinstance(row.get(field) or '', str):
+            flags |= OVERFLOW
+            value = b''
+        strings.append(value)
+
+    try:
+        booking = Booking.from_dict(row)
+        created_at = to_micros(booking.created_at) if booking.created_at else NO_TIME
+        updated_at = to_micros(booking.updated_at) if booking.updated_at else NO_TIME
+        starts_at = to_micros(Booking._parse_timestamp(booking.starts_at)) if booking.starts_at else NO_TIME
+        final_end = booking.final_ends_at()
+        final_end = NO_END if final_end is None else to_micros(final_end)
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        created_at = updated_at = starts_at = NO_TIME
+        final_end = NO_END
+        flags |= OVERFLOW
+
+    return _RECORD.pack(log_offset, length, created_at, updated_at, starts_at, final_end,
+                        status_code, flags, *strings)
+
+class BookingRecordFile:
+    def __init__(self, path):
+        """
+        Initialize the record file of a booking log
+
+        Holds one fixed-width binary record per line of the booking log, in
+        log order: the line's offset and length plus the fields bookings are
+        filtered and indexed on (status, times, IDs). Readers memory-map the
+        file, so indexing the log and filtering bookings read the mapped
+        buffer (shared with every other process through the page cache)
+        instead of parsing JSON; only the bookings actually returned are
+        decoded from their log lines.
+
+        The file is written under the booking store's write lock and always
+        describes a prefix of the log. A record file that is missing, or
+        that belongs to an earlier version of the log (before a compaction),
+        is ignored by readers and rebuilt by the next writer.
+
+        Args:
+            path (str): Path of the record file
+        """
+        self.path = path
+        self._map = None
+        self._map_size = 0
+        self._map_inode = None
+
+    def view(self, log_inode):
+        """
+        Map the records of a version of the log
+
+        Args:
+            log_inode (int): Inode of the booking log being read
+
+        Returns:
+            mmap: The mapped file (header included), or None if there are no
+                  usable records for that log
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if st.st_size <= _HEADER_SIZE:
+            return None
+
+        if self._map is None or st.st_ino != self._map_inode or st.st_size != self._map_size:
+            with open(self.path, 'rb') as f:
+                # Older maps stay valid for readers still holding them
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map_size = len(self._map)
+            self._map_inode = st.st_ino
+
+        magic, version, inode = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION or inode != log_inode:
+            return None
+        return self._map
+
+    def count(self, data):
+        """Number of complete records in a mapped file"""
+        return (len(data) - _HEADER_SIZE) // _RECORD.size
+
+    def read(self, data, index):
+        """
+        Decode one record
+
+        Args:
+            data (mmap): Mapped file returned by view()
+            index (int): Record number
+
+        Returns:
+            BookingRecord: The record
+        """
+        return BookingRecord(_RECORD.unpack_from(data, _HEADER_SIZE + index * _RECORD.size))
+
+    def raw(self, data, index):
+        """Get one record as packed bytes"""
+        offset = _HEADER_SIZE + index * _RECORD.size
+        return data[offset:offset + _RECORD.size]
+
+    def iter_records(self, data, start=0):
+        """
+        Decode the records of a mapped file from a record number on
+
+        Args:
+            data (mmap): Mapped file returned by view()
+            start (int, optional): First record number
+
+        Yields:
+            BookingRecord: The records, in log order
+        """
+        end = _HEADER_SIZE + self.count(data) * _RECORD.size
+        buffer = memoryview(data)[_HEADER_SIZE + start * _RECORD.size:end]
+        try:
+            for values in _RECORD.iter_unpack(buffer):
+                yield BookingRecord(values)
+        finally:
+            buffer.release()
+
+    def iter_index_rows(self, data):
+        """
+        Decode just what the store's indexes need from every record
+
+        Args:
+            data (mmap): Mapped file returned by view()
+
+        Yields:
+            tuple: (log offset, line length, overflowed, row with id, device_id,
+                   user_id and access_code_id), in log order
+        """
+        end = _HEADER_SIZE + self.count(data) * _RECORD.size
+        buffer = memoryview(data)[_HEADER_SIZE:end]
+        try:
+            for (log_offset, length, _, _, _, _, _, flags,
+                 record_id, device_id, user_id, access_code_id) in _RECORD.iter_unpack(buffer):
+                yield log_offset, length, flags & OVERFLOW, {
+                    'id': record_id.rstrip(b'\0').decode() or None,
+                    'device_id': device_id.rstrip(b'\0').decode() or None,
+                    'user_id': user_id.rstrip(b'\0').decode() or None,
+                    'access_code_id': access_code_id.rstrip(b'\0').decode() or None
+                }
+        finally:
+            buffer.release()
+
+    def covered(self, log_inode):
+        """
+        Get how much of the log the records describe
+
+        Args:
+            log_inode (int): Inode of the booking log
+
+        Returns:
+            tuple: (number of records, log position right after the last one)
+        """
+        data = self.view(log_inode)
+        count = self.count(data) if data is not None else 0
+        if not count:
+            return 0, 0
+        last = self.read(data, count - 1)
+        return count, last.log_offset + last.length
+
+    def sync(self, log_path, log_inode, upto):
+        """
+        Bring the records up to a position of the log (caller holds the write lock)
+
+        Lines the records do not describe yet (e.g. written before the
+        record file existed) are parsed and recorded; records of another
+        version of the log are discarded first.
+
+        Args:
+            log_path (str): Path of the booking log
+            log_inode (int): Its inode
+            upto (int): Log position to cover (the end of its last complete line)
+
+        Returns:
+            int: Number of records in the file
+        """
+        count, position = self.covered(log_inode)
+        if not count:
+            self._start(log_inode)
+        if position >= upto:
+            return count
+
+        records = []
+        with open(log_path, 'rb') as f:
+            f.seek(position)
+            for line in f:
+                if position + len(line) > upto or not line.endswith(b'\n'):
+                    break
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    if row is not None:
+                        records.append(encode_record(row, position, len(line)))
+                position += len(line)
+        return self.append(records) if records else count
+
+    def append(self, records):
+        """
+        Append packed records (caller holds the write lock)
+
+        Args:
+            records (list): Records built by encode_record
+
+        Returns:
+            int: Number of records in the file
+        """
+        with open(self.path, 'ab') as f:
+            f.write(b''.join(records))
+            return (f.tell() - _HEADER_SIZE) // _RECORD.size
+
+    def rewrite(self, log_inode, records):
+        """
+        Replace the file with records for a new version of the log
+
+        Args:
+            log_inode (int): Inode of the new booking log
+            records (list): Its packed records, in log order
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_header(log_inode))
+            f.write(b''.join(records))
+        os.replace(tmp_path, self.path)
+
+    def _start(self, log_inode):
+        with open(self.path, 'wb') as f:
+            f.write(_header(log_inode))
+
+def relocate(record, log_offset):
+    """
+    Copy a packed record, pointing it at a new offset of its line
+
+    Args:
+        record (bytes): The packed record
+        log_offset (int): New offset of the line
+
+    Returns:
+        bytes: The updated record
+    """
+    return struct.pack('<Q', log_offset) + record[8:]
+
+def _header(log_inode):
+    return _HEADER.pack(_MAGIC, _FORMAT_VERSION, log_inode).ljust(_HEADER_SIZE, b'\0')
@@ -0,0 +1,1209 @@
+import logging
+import heapq
+import json
+import os
+import threading
+import uuid
+from app.models.booking import Booking
+from app.models.user import User
+from app.services.booking_archive import BookingArchive, FINISHED_STATUSES
+from app.services.booking_records import BOOKING_RECORDS_ENABLED, BookingRecordFile, encode_record, relocate, to_micros
+from app.utils.time_utils import to_utc_datetime, datetime_to_iso, get_current_utc_datetime
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; writes are then unlocked
+    fcntl = None
+
+# Rewrite a log once it holds this many superseded rows and more stale rows than live ones
+COMPACT_MIN_STALE_ROWS = 1000
+
+class BookingStore:
+    def __init__(self, data_dir='data'):
+        """
+        Initialize the booking store
+
+        Bookings and users are kept in append-only, newline-delimited JSON
+        logs: every write appends the full record and later lines supersede
+        earlier ones. In-process hash indexes (booking id and user id to file
+        offset, plus email, device_id and user_id lookups) are caught up
+        incrementally from the end of the log, so point lookups stay
+        constant-time and writes made by other processes are picked up
+        without reloading the whole history.
+
+        The booking log is shadowed by a memory-mapped file of fixed-width
+        records (see BookingRecordFile): loading the store reads the indexes
+        from it instead of parsing every line, and filtered scans test the
+        records so only matching bookings are read and decoded.
+
+        Args:
+            data_dir (str, optional): Directory holding the data files
+        """
+        self.data_dir = data_dir
+        self.bookings_file = os.path.join(data_dir, 'bookings.ndjson')
+        self.users_file = os.path.join(data_dir, 'users.ndjson')
+        self.legacy_bookings_file = os.path.join(data_dir, 'bookings.json')
+        self.legacy_users_file = os.path.join(data_dir, 'users.json')
+        self.events_file = os.path.join(data_dir, 'seam_events.ndjson')
+        self.devices_file = os.path.join(data_dir, 'devices.ndjson')
+        self.jobs_file = os.path.join(data_dir, 'jobs.ndjson')
+        self.booking_records_file = os.path.join(data_dir, 'bookings.records')
+        self.lock_file = os.path.join(data_dir, '.bookings.lock')
+        self.archive = BookingArchive(os.path.join(data_dir, 'archive'))
+
+        self._bookings = _RecordLog(
+            self.bookings_file, self._index_booking, self._reset_booking_indexes,
+            records=BookingRecordFile(self.booking_records_file) if BOOKING_RECORDS_ENABLED else None,
+            on_rebuilt=self._mark_bookings_rebuilt
+        )
+        self._users = _RecordLog(self.users_file, self._index_user, self._reset_user_indexes)
+        self._events = _RecordLog(self.events_file, _ignore_row, _ignore_reset)
+        self._devices = _RecordLog(self.devices_file, _ignore_row, _ignore_reset)
+        self._jobs = _RecordLog(self.jobs_file, self._index_job, self._reset_job_indexes)
+        self._bookings_by_device = {}
+        self._bookings_by_user = {}
+        self._bookings_by_access_code = {}
+        self._users_by_email = {}
+        self._job_heap = []
+        self._pending_jobs = {}
+        self._running_jobs = {}
+        self._jobs_by_booking = {}
+        self._listeners = []
+        self._change_listeners = []
+        self._reset_listeners = []
+        self._bookings_rebuilt = False
+        self._mutex = threading.RLock()
+        self._ready = False
+
+    def add_listener(self, callback):
+        """
+        Register a callback run after a write concerning a device
+
+        Callbacks receive the device ID after its bookings or device state
+        are written by this process, and are where caches for the device
+        should be invalidated.
+
+        Args:
+            callback (callable): The callback
+        """
+        self._listeners.append(callback)
+
+    def add_change_listener(self, callback):
+        """
+        Register a callback run for every booking change seen in the log
+
+        Unlike add_listener, this also sees bookings written by other
+        processes, as soon as this store catches up with the log (see
+        refresh). Rows loaded at startup or when the log is rebuilt are not
+        reported (see add_reset_listener).
+
+        Args:
+            callback (callable): Called with (row, is_new) for each booking row
+        """
+        self._change_listeners.append(callback)
+
+    def add_reset_listener(self, callback):
+        """
+        Register a callback run after the booking log was rebuilt
+
+        When another process compacts or replaces the booking log, this
+        store reloads it without reporting its rows to change listeners,
+        so rows that process wrote since this store last caught up are
+        never reported. Reset listeners are then called (with no arguments,
+        outside the store's locks) and should resynchronise whatever they
+        built from the reported rows.
+
+        Args:
+            callback (callable): The callback
+        """
+        self._reset_listeners.append(callback)
+
+    def refresh(self):
+        """Catch up with rows written by other processes"""
+        self._refresh()
+
+    def write_stats(self):
+        """
+        Get how much this store has written, per log
+
+        Returns:
+            dict: rows, bytes (including compaction rewrites) and compactions
+                  per log (bookings, users, events, devices, jobs)
+        """
+        logs = {'bookings': self._bookings, 'users': self._users, 'events': self._events,
+                'devices': self._devices, 'jobs': self._jobs}
+        return {
+            name: {'rows': log.rows_written, 'bytes': log.bytes_written, 'compactions': log.compactions}
+            for name, log in logs.items()
+        }
+
+    def _mark_bookings_rebuilt(self):
+        self._bookings_rebuilt = True
+
+    def _notify_rebuilt(self):
+        """Tell the reset listeners if the booking log was rebuilt; call without the locks"""
+        with self._mutex:
+            rebuilt, self._bookings_rebuilt = self._bookings_rebuilt, False
+        if rebuilt:
+            for listener in self._reset_listeners:
+                listener()
+
+    def _notify(self, device_ids):
+        """Tell the listeners which devices were just written"""
+        for device_id in set(device_ids):
+            for listener in self._listeners:
+                listener(device_id)
+
+    def _ensure_data_dir(self):
+        """Create the data directory and migrate legacy data if needed"""
+        if self._ready:
+            return
+
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+        if os.path.exists(self.legacy_bookings_file) and not os.path.exists(self.bookings_file):
+            self._migrate_legacy_file(self.legacy_bookings_file, self.bookings_file, Booking)
+        if os.path.exists(self.legacy_users_file) and not os.path.exists(self.users_file):
+            self._migrate_legacy_file(self.legacy_users_file, self.users_file, User)
+
+        self._ready = True
+
+    def _migrate_legacy_file(self, legacy_file, log_file, model):
+        """Convert an old single-array JSON file into the line-based format"""
+        with open(legacy_file, 'r') as f:
+            records = json.load(f)
+
+        tmp_file = log_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            for record in records:
+                f.write(json.dumps(model.from_dict(record).to_dict()) + '\n')
+        os.replace(tmp_file, log_file)
+
+    def _locked(self):
+        """Return a context manager holding the store's write lock"""
+        return _FileLock(self.lock_file)
+
+    def _refresh(self):
+        """Catch the indexes up with anything appended since the last call"""
+        self._ensure_data_dir()
+        with self._mutex:
+            self._bookings.refresh()
+            self._users.refresh()
+            self._events.refresh()
+            self._devices.refresh()
+            self._jobs.refresh()
+        self._notify_rebuilt()
+
+    # Index maintenance
+
+    def _index_booking(self, row, is_new):
+        """Add a booking row to the secondary indexes"""
+        # Codes come and go (recurring occurrences), so index every version
+        if row.get('access_code_id'):
+            self._bookings_by_access_code[row['access_code_id']] = row['id']
+        for details in (row.get('occurrence_codes') or {}).values():
+            self._bookings_by_access_code[details['access_code_id']] = row['id']
+
+        if not self._bookings.replaying:
+            for listener in self._change_listeners:
+                listener(row, is_new)
+
+        if not is_new:
+            # device_id and user_id never change once a booking exists
+            return
+        self._bookings_by_device.setdefault(row.get('device_id'), []).append(row['id'])
+        self._bookings_by_user.setdefault(row.get('user_id'), []).append(row['id'])
+
+    def _reset_booking_indexes(self):
+        self._bookings_by_device = {}
+        self._bookings_by_user = {}
+        self._bookings_by_access_code = {}
+
+    def _index_user(self, row, is_new):
+        """Add a user row to the email index"""
+        if row.get('email'):
+            self._users_by_email[row['email']] = row['id']
+
+    def _reset_user_indexes(self):
+        self._users_by_email = {}
+
+    def _index_job(self, row, is_new):
+        """Track pending jobs in the due-time heap"""
+        if row.get('status') == 'pending':
+            due_at = to_utc_datetime(row['due_at'])
+            self._pending_jobs[row['id']] = due_at
+            heapq.heappush(self._job_heap, (due_at, row['id']))
+        else:
+            # Its heap entry is discarded lazily once it reaches the top
+            self._pending_jobs.pop(row['id'], None)
+
+        if row.get('status') == 'running':
+            self._running_jobs[row['id']] = to_utc_datetime(row['updated_at'])
+        else:
+            self._running_jobs.pop(row['id'], None)
+
+        if is_new and row.get('booking_id'):
+            self._jobs_by_booking.setdefault(row['booking_id'], []).append(row['id'])
+
+    def _reset_job_indexes(self):
+        self._job_heap = []
+        self._pending_jobs = {}
+        self._running_jobs = {}
+        self._jobs_by_booking = {}
+
+    # Bookings
+
+    def iter_bookings(self, device_id=None, user_id=None, status=None,
+                      start=None, end=None, updated_since=None, after=None,
+                      recurring=None, ordered=False):
+        """
+        Yield bookings matching the given filters
+
+        Bookings come in log order unless ordered is set or a cursor is given:
+        processes appending concurrently can write a booking after others
+        created later, so pages must be cut from bookings sorted by
+        booking_sort_key, not from the log.
+
+        Args:
+            device_id (str, optional): Only bookings for this device
+            user_id (str, optional): Only bookings for this user
+            status (str|tuple, optional): Only bookings with this status (or one of these)
+            start (datetime, optional): Only bookings starting at or after this time
+            end (datetime, optional): Only bookings ending at or before this time
+                                      (for a series, its last occurrence)
+            updated_since (datetime, optional): Only bookings modified at or after this time
+            after (tuple, optional): (created_at, id) cursor; only bookings after it
+            recurring (bool, optional): Only recurring series (True) or one-off bookings (False)
+            ordered (bool, optional): Yield in booking_sort_key order (implied by after)
+
+        Returns:
+            generator: Matching Booking objects
+        """
+        matching = self._matching_bookings(device_id, user_id, status, start, end, updated_since,
+                                           after, recurring)
+        if ordered or after is not None:
+            yield from sorted(matching, key=booking_sort_key)
+        else:
+            yield from matching
+
+    def _matching_bookings(self, device_id, user_id, status, start, end, updated_since, after, recurring):
+        """Yield the bookings iter_bookings returns, in log order"""
+        statuses = {status} if isinstance(status, str) else set(status) if status is not None else None
+
+        self._refresh()
+        with self._mutex:
+            if device_id is not None:
+                candidate_ids = list(self._bookings_by_device.get(device_id, []))
+            elif user_id is not None:
+                candidate_ids = list(self._bookings_by_user.get(user_id, []))
+            else:
+                candidate_ids = list(self._bookings.offsets)
+            candidates = self._bookings.snapshot(candidate_ids, _record_filter(
+                device_id, user_id, statuses, start, end, updated_since, after, recurring
+            ))
+
+        for row in candidates:
+            if device_id is not None and row.get('device_id') != device_id:
+                continue
+            if user_id is not None and row.get('user_id') != user_id:
+                continue
+            if statuses is not None and row.get('status') not in statuses:
+                continue
+            if recurring is not None and bool(row.get('recurrence')) != recurring:
+                continue
+
+            booking = Booking.from_dict(row)
+
+            if after is not None and booking_sort_key(booking) <= after:
+                continue
+            if start is not None and to_utc_datetime(booking.starts_at) < start:
+                continue
+            if end is not None:
+                final_end = booking.final_ends_at()
+                if final_end is None or final_end > end:
+                    continue
+            if updated_since is not None and to_utc_datetime(booking.updated_at) < updated_since:
+                continue
+
+            yield booking
+
+    def get_booking(self, booking_id):
+        """
+        Get a single booking by ID
+
+        Args:
+            booking_id (str): The booking ID
+
+        Returns:
+            Booking: The booking, or None if it does not exist
+        """
+        self._refresh()
+        with self._mutex:
+            row = self._bookings.get(booking_id)
+        return Booking.from_dict(row) if row else None
+
+    def find_booking_by_access_code(self, access_code_id):
+        """
+        Find the booking that owns a Seam access code
+
+        Args:
+            access_code_id (str): The ID of the access code from Seam
+
+        Returns:
+            Booking: The booking, or None if no booking owns the code
+        """
+        self._refresh()
+        with self._mutex:
+            booking_id = self._bookings_by_access_code.get(access_code_id)
+            row = self._bookings.get(booking_id) if booking_id else None
+        return Booking.from_dict(row) if row else None
+
+    def booking_ids_for_device(self, device_id):
+        """
+        Get the IDs of every booking made on a device, in creation order
+
+        Args:
+            device_id (str): The ID of the lock device
+
+        Returns:
+            list: Booking IDs
+        """
+        self._refresh()
+        with self._mutex:
+            return list(self._bookings_by_device.get(device_id, []))
+
+    def booking_ids_for_user(self, user_id):
+        """
+        Get the IDs of every booking made by a user, in creation order
+
+        Args:
+            user_id (str): The ID of the user
+
+        Returns:
+            list: Booking IDs
+        """
+        self._refresh()
+        with self._mutex:
+            return list(self._bookings_by_user.get(user_id, []))
+
+    def add_booking(self, booking):
+        """
+        Append a new booking to the store
+
+        Args:
+            booking (Booking): The booking to add
+        """
+        self._write(self._bookings, [booking.to_dict()])
+        self._notify([booking.device_id])
+
+    def update_booking(self, booking):
+        """
+        Persist changes to an existing booking
+
+        Args:
+            booking (Booking): The modified booking
+        """
+        self.update_bookings([booking])
+
+    def update_bookings(self, bookings):
+        """
+        Persist changes to several bookings in a single append
+
+        Args:
+            bookings (list): Modified Booking objects
+        """
+        now = get_current_utc_datetime()
+        rows = []
+        for booking in bookings:
+            booking.updated_at = now
+            rows.append(booking.to_dict())
+
+        if rows:
+            self._write(self._bookings, rows)
+            self._notify(booking.device_id for booking in bookings)
+
+    def update_booking_if_unchanged(self, booking, updated_at):
+        """
+        Persist changes to a booking unless someone else saved it since it was read
+
+        The stored booking is compared under the cross-process lock, so a
+        concurrent cancellation is never overwritten by a stale copy.
+
+        Args:
+            booking (Booking): The modified booking
+            updated_at (datetime): The updated_at of the copy the changes were made to
+
+        Returns:
+            bool: Whether the booking was saved
+        """
+        def unchanged_row():
+            row = self._bookings.get(booking.id)
+            if row is None or Booking.from_dict(row).updated_at != updated_at:
+                return []
+            booking.updated_at = get_current_utc_datetime()
+            return [booking.to_dict()]
+
+        if not self._write(self._bookings, unchanged_row):
+            return False
+        self._notify([booking.device_id])
+        return True
+
+    def archive_finished(self, before):
+        """
+        Move finished bookings that ended before a time to the archive
+
+        The rows are appended to the archive first and the hot log is then
+        rewritten without them, so a crash in between leaves duplicates the
+        archive ignores rather than losing bookings.
+
+        Args:
+            before (datetime): Aware UTC time; cancelled, expired and failed bookings
+                               whose final end is earlier are archived
+
+        Returns:
+            int: Number of bookings archived
+        """
+        self._ensure_data_dir()
+        with self._mutex, self._locked():
+            self._bookings.refresh()
+            rows = []
+            for row in self._bookings.snapshot(list(self._bookings.offsets)):
+                if row.get('status') not in FINISHED_STATUSES:
+                    continue
+                final_end = Booking.from_dict(row).final_ends_at()
+                if final_end is not None and final_end < before:
+                    rows.append(row)
+
+            if rows:
+                self.archive.append(rows)
+                self._bookings.compact(drop={row['id'] for row in rows})
+
+        self._notify_rebuilt()
+        self._notify(row.get('device_id') for row in rows)
+        return len(rows)
+
+    # Users
+
+    def get_user(self, user_id):
+        """
+        Get a user by ID
+
+        Args:
+            user_id (str): The user ID
+
+        Returns:
+            User: The user, or None if not found
+        """
+        self._refresh()
+        with self._mutex:
+            row = self._users.get(user_id)
+        return User.from_dict(row) if row else None
+
+    def find_user_by_email(self, email):
+        """
+        Find a user by email address
+
+        Args:
+            email (str): The email address
+
+        Returns:
+            User: The user, or None if not found
+        """
+        self._refresh()
+        with self._mutex:
+            user_id = self._users_by_email.get(email)
+            row = self._users.get(user_id) if user_id else None
+        return User.from_dict(row) if row else None
+
+    def add_user(self, user):
+        """
+        Add a new user
+
+        Args:
+            user (User): The user to add
+        """
+        self._write(self._users, [user.to_dict()])
+
+    # Seam events and device state
+
+    def has_event(self, event_id):
+        """
+        Check whether a Seam event was already logged
+
+        Args:
+            event_id (str): Seam's event ID
+
+        Returns:
+            bool: True if the event is in the event log
+        """
+        self._refresh()
+        with self._mutex:
+            return event_id in self._events.offsets
+
+    def record_event(self, event_id, event):
+        """
+        Append a received Seam event to the event log unless it was seen before
+
+        Args:
+            event_id (str): Seam's event ID, used for deduplication
+            event (dict): The event payload
+
+        Returns:
+            bool: True if the event is new, False if it is a duplicate
+        """
+        self._ensure_data_dir()
+        with self._mutex, self._locked():
+            self._events.refresh()
+            if event_id in self._events.offsets:
+                return False
+            self._events.append([{
+                'id': event_id,
+                'received_at': datetime_to_iso(get_current_utc_datetime()),
+                'event': event
+            }])
+            return True
+
+    def iter_events(self):
+        """
+        Yield logged Seam events in the order they were received
+
+        Returns:
+            generator: Dictionaries with id, received_at and event
+        """
+        self._refresh()
+        with self._mutex:
+            rows = self._events.snapshot(list(self._events.offsets))
+        return rows
+
+    def get_device_state(self, device_id):
+        """
+        Get the last known state of a device
+
+        Args:
+            device_id (str): The ID of the lock device
+
+        Returns:
+            dict: State with status and updated_at, or None if nothing is known
+        """
+        self._refresh()
+        with self._mutex:
+            return self._devices.get(device_id)
+
+    def set_device_state(self, device_id, status):
+        """
+        Record the state of a device
+
+        Args:
+            device_id (str): The ID of the lock device
+            status (str): Device status (online, offline)
+        """
+        self.update_device_state(device_id, status=status)
+
+    def update_device_state(self, device_id, **fields):
+        """
+        Merge fields into the recorded state of a device
+
+        Args:
+            device_id (str): The ID of the lock device
+            **fields: State fields to set
+        """
+        def merged_row():
+            row = dict(self._devices.get(device_id) or {'id': device_id})
+            row.update(fields)
+            row['updated_at'] = datetime_to_iso(get_current_utc_datetime())
+            return [row]
+
+        self._write(self._devices, merged_row)
+        self._notify([device_id])
+
+    def device_ids(self):
+        """
+        Get every device that has bookings
+
+        Returns:
+            list: Device IDs
+        """
+        self._refresh()
+        with self._mutex:
+            return [device_id for device_id in self._bookings_by_device if device_id]
+
+    # Delayed jobs
+
+    def enqueue_job(self, kind, due_at, booking_id=None, job_id=None, correlation_id=None):
+        """
+        Schedule a job to run at a given time
+
+        Jobs are kept in their own log and ordered by due time in a heap that
+        is rebuilt from the log, so they survive restarts. Enqueueing an
+        existing job ID reschedules it.
+
+        Args:
+            kind (str): Job type, e.g. "expiration_reminder"
+            due_at (datetime): When the job should run
+            booking_id (str, optional): Booking the job belongs to
+            job_id (str, optional): Job ID (default: a new UUID)
+            correlation_id (str, optional): Correlation id of the request queuing the job,
+                                            restored while it runs
+
+        Returns:
+            dict: The job
+        """
+        now = datetime_to_iso(get_current_utc_datetime())
+        row = {
+            'id': job_id or str(uuid.uuid4()),
+            'kind': kind,
+            'booking_id': booking_id,
+            'due_at': datetime_to_iso(to_utc_datetime(due_at)),
+            'status': 'pending',
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now
+        }
+        if correlation_id:
+            row['correlation_id'] = correlation_id
+        self._write(self._jobs, [row])
+        return row
+
+    def get_job(self, job_id):
+        """
+        Get a job by ID
+
+        Args:
+            job_id (str): The job ID
+
+        Returns:
+            dict: The job, or None if not found
+        """
+        self._refresh()
+        with self._mutex:
+            return self._jobs.get(job_id)
+
+    def next_job_due(self):
+        """
+        Get the due time of the earliest pending job
+
+        Returns:
+            datetime: Aware UTC due time, or None if no job is pending
+        """
+        self._refresh()
+        with self._mutex:
+            top = self._peek_job()
+        return top[0] if top else None
+
+    def _peek_job(self):
+        """Drop superseded heap entries and return the earliest (due_at, job id)"""
+        while self._job_heap:
+            due_at, job_id = self._job_heap[0]
+            if self._pending_jobs.get(job_id) == due_at:
+                return self._job_heap[0]
+            heapq.heappop(self._job_heap)
+        return None
+
+    def claim_due_jobs(self, now, limit=100, kinds=None):
+        """
+        Take pending jobs that are due, marking them running
+
+        The claim is written under the cross-process lock, so a job is only
+        handed to one dispatcher.
+
+        Args:
+            now (datetime): Aware UTC current time
+            limit (int, optional): Most jobs to claim
+            kinds (tuple, optional): Only claim jobs of these kinds
+
+        Returns:
+            list: Claimed jobs, earliest first
+        """
+        def claimed_rows():
+            rows = []
+            skipped = []
+            updated_at = datetime_to_iso(get_current_utc_datetime())
+            while len(rows) < limit:
+                top = self._peek_job()
+                if top is None or top[0] > now:
+                    break
+                heapq.heappop(self._job_heap)
+                row = dict(self._jobs.get(top[1]))
+                if kinds is not None and row.get('kind') not in kinds:
+                    # Another dispatcher's job: leave it queued
+                    skipped.append(top)
+                    continue
+                row['status'] = 'running'
+                row['attempts'] = row.get('attempts', 0) + 1
+                row['updated_at'] = updated_at
+                rows.append(row)
+            for entry in skipped:
+                heapq.heappush(self._job_heap, entry)
+            return rows
+
+        return self._write(self._jobs, claimed_rows)
+
+    def finish_jobs(self, jobs, status='done'):
+        """
+        Record the outcome of claimed jobs
+
+        Args:
+            jobs (list): Jobs returned by claim_due_jobs
+            status (str, optional): Final status (done, failed)
+        """
+        updated_at = datetime_to_iso(get_current_utc_datetime())
+        rows = [dict(job, status=status, updated_at=updated_at) for job in jobs]
+        if rows:
+            self._write(self._jobs, rows)
+
+    def retry_job(self, job, due_at):
+        """
+        Put a claimed job back in the queue
+
+        Args:
+            job (dict): Job returned by claim_due_jobs
+            due_at (datetime): When to try again
+        """
+        self._write(self._jobs, [dict(
+            job, status='pending', due_at=datetime_to_iso(to_utc_datetime(due_at)),
+            updated_at=datetime_to_iso(get_current_utc_datetime())
+        )])
+
+    def requeue_stalled_jobs(self, before, kinds=None):
+        """
+        Queue again the running jobs claimed before a time
+
+        A job still running long after it was claimed was abandoned by a
+        dispatcher that died; it becomes pending and due immediately.
+
+        Args:
+            before (datetime): Aware UTC time; jobs claimed earlier are requeued
+            kinds (tuple, optional): Only requeue jobs of these kinds
+
+        Returns:
+            int: Number of jobs requeued
+        """
+        def requeued_rows():
+            now = datetime_to_iso(get_current_utc_datetime())
+            rows = []
+            for job_id, claimed_at in list(self._running_jobs.items()):
+                if claimed_at >= before:
+                    continue
+                row = self._jobs.get(job_id)
+                if kinds is None or row.get('kind') in kinds:
+                    rows.append(dict(row, status='pending', due_at=now, updated_at=now))
+            return rows
+
+        return len(self._write(self._jobs, requeued_rows))
+
+    def cancel_jobs(self, booking_id):
+        """
+        Cancel the pending jobs of one or more bookings in a single append
+
+        Args:
+            booking_id (str|list): The booking ID, or a list of them
+
+        Returns:
+            int: Number of jobs cancelled
+        """
+        booking_ids = [booking_id] if isinstance(booking_id, str) else booking_id
+
+        def cancelled_rows():
+            updated_at = datetime_to_iso(get_current_utc_datetime())
+            return [
+                dict(self._jobs.get(job_id), status='cancelled', updated_at=updated_at)
+                for booking_id in booking_ids
+                for job_id in self._jobs_by_booking.get(booking_id, [])
+                if job_id in self._pending_jobs
+            ]
+
+        return len(self._write(self._jobs, cancelled_rows))
+
+    # Writes
+
+    def _write(self, log, rows):
+        """
+        Append rows to a log under the cross-process lock, compacting when worthwhile
+
+        Args:
+            log (_RecordLog): The log to append to
+            rows (list|callable): Rows to append, or a callable building them
+                                  from the log's current state once it is locked
+
+        Returns:
+            list: The rows appended
+        """
+        self._ensure_data_dir()
+        with self._mutex, self._locked():
+            log.refresh()
+            rows = rows() if callable(rows) else rows
+            if rows:
+                log.append(rows)
+            if log.stale >= COMPACT_MIN_STALE_ROWS and log.stale > len(log.offsets):
+                log.compact()
+        self._notify_rebuilt()
+        return rows
+
+def _record_filter(device_id, user_id, statuses, start, end, updated_since, after, recurring):
+    """
+    Build the iter_bookings test run on booking records before rows are read
+
+    It only rejects rows that certainly do not match; rows it lets through
+    are still checked against the decoded booking.
+    """
+    if not any(value is not None for value in (device_id, user_id, statuses, start, end,
+                                                updated_since, after, recurring)):
+        return None
+    start_micros = to_micros(start) if start is not None else None
+    end_micros = to_micros(end) if end is not None else None
+    updated_micros = to_micros(updated_since) if updated_since is not None else None
+    after_micros = to_micros(to_utc_datetime(after[0])) if after is not None else None
+
+    def accept(record):
+        if record.overflow:
+            return True
+        if statuses is not None and record.status not in statuses:
+            return False
+        if recurring is not None and record.recurring != recurring:
+            return False
+        if start_micros is not None and record.starts_at < start_micros:
+            return False
+        if end_micros is not None and record.final_end > end_micros:
+            return False
+        if updated_micros is not None and record.updated_at < updated_micros:
+            return False
+        if after_micros is not None and record.created_at < after_micros:
+            return False
+        if device_id is not None and record.device_id != device_id:
+            return False
+        if user_id is not None and record.user_id != user_id:
+            return False
+        return True
+
+    return accept
+
+def _ignore_row(row, is_new):
+    pass
+
+def _ignore_reset():
+    pass
+
+def booking_sort_key(booking):
+    """
+    Get the (created_at, id) key that orders bookings and cursors
+
+    Args:
+        booking (Booking): The booking
+
+    Returns:
+        tuple: (ISO8601 created_at string, booking id)
+    """
+    return (to_utc_datetime(booking.created_at).isoformat(timespec='microseconds'), booking.id)
+
+class _RecordLog:
+    """Append-only NDJSON file of records keyed by 'id', indexed by file offset"""
+
+    def __init__(self, path, on_row, on_reset, records=None, on_rebuilt=None):
+        """
+        Args:
+            path (str): Path of the log file
+            on_row (callable): Called with (row, is_new) for every row indexed
+            on_reset (callable): Called before the index is rebuilt from scratch
+            on_rebuilt (callable, optional): Called once the index was rebuilt because
+                                             another process replaced or truncated
+                                             the file (not after our own compactions)
+            records (BookingRecordFile, optional): Fixed-width records of the
+                                                  lines, kept in step with the log;
+                                                  loads and filters read them
+                                                  instead of parsing JSON
+        """
+        self.path = path
+        self.on_row = on_row
+        self.on_reset = on_reset
+        self.records = records
+        self.on_rebuilt = on_rebuilt
+        self.offsets = {}
+        # Record number of the latest version of each record, where the record file has it
+        self.record_numbers = {}
+        self.stale = 0
+        # Write volume of this process: rows and bytes appended, rewrites
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.compactions = 0
+        # True while rows already in the file are being (re)loaded rather than tailed
+        self.replaying = True
+        self._size = 0
+        self._inode = None
+        self._records_seen = 0
+        # Inode of the file our own compaction wrote; rebuilding for it is no news
+        self._rewritten_inode = None
+
+    def refresh(self):
+        """Index rows appended since the last refresh, or rebuild if the file was replaced"""
+        if self._catch_up() and self.on_rebuilt is not None:
+            self.on_rebuilt()
+
+    def _catch_up(self):
+        """Do refresh()'s work; return True if another process's rewrite was reloaded"""
+        rebuilt = False
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset(None)
+                rebuilt = True
+            self.replaying = False
+            return rebuilt
+
+        if self._inode is None and self._size == 0:
+            # First sight of the file (possibly just created by our own append). If
+            # another process created it after we saw none, it may have compacted
+            # away rows we never saw.
+            rebuilt = not self.replaying and st.st_ino != self._rewritten_inode
+            self._rewritten_inode = None
+            self._inode = st.st_ino
+        elif st.st_ino != self._inode or st.st_size < self._size:
+            rebuilt = st.st_ino != self._rewritten_inode
+            self._rewritten_inode = None
+            self._reset(st.st_ino)
+
+        if st.st_size == self._size:
+            self.replaying = False
+            return rebuilt
+
+        with open(self.path, 'rb') as f:
+            if self.replaying and self.records is not None:
+                self._load_records(f, st.st_size)
+
+            f.seek(self._size)
+            position = self._size
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # A writer is mid-append; pick the row up next time
+                    break
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        logger.error("Error loading row from %s: %s", self.path, e)
+                    else:
+                        self._index(row, position)
+                position += len(line)
+            self._size = position
+
+        if self.records is not None:
+            self._attach_records()
+        self.replaying = False
+        return rebuilt
+
+    def _index(self, row, position, record_number=None):
+        is_new = row['id'] not in self.offsets
+        if not is_new:
+            self.stale += 1
+        self.offsets[row['id']] = position
+        if record_number is None:
+            self.record_numbers.pop(row['id'], None)
+        else:
+            self.record_numbers[row['id']] = record_number
+        self.on_row(row, is_new)
+
+    def _load_records(self, f, file_size):
+        """Index the lines the record file describes without parsing them"""
+        data = self.records.view(self._inode)
+        count = self.records.count(data) if data is not None else 0
+        if not count:
+            return
+
+        # The records must describe this very file: check the last one against its line
+        last = self.records.read(data, count - 1)
+        if last.log_offset + last.length > file_size:
+            return
+        f.seek(last.log_offset)
+        line = f.read(last.length)
+        try:
+            if not line.endswith(b'\n') or (not last.overflow and json.loads(line)['id'] != last.id):
+                return
+        except (ValueError, KeyError):
+            return
+
+        for number, (offset, length, overflow, row) in enumerate(self.records.iter_index_rows(data)):
+            if overflow:
+                # Fields the record cannot hold (e.g. occurrence codes): read the line
+                f.seek(offset)
+                row = json.loads(f.read(length))
+            self._index(row, offset, number)
+        self._size = last.log_offset + last.length
+        self._records_seen = count
+
+    def _attach_records(self):
+        """Pick up records written since, for rows that were indexed from their lines"""
+        data = self.records.view(self._inode)
+        if data is None:
+            return
+        count = self.records.count(data)
+        if count <= self._records_seen:
+            return
+        for number, record in enumerate(self.records.iter_records(data, self._records_seen), self._records_seen):
+            if record.log_offset >= self._size:
+                # Describes a line not indexed yet; attached once it is
+                break
+            self._records_seen = number + 1
+            if self.offsets.get(record.id) == record.log_offset:
+                self.record_numbers[record.id] = number
+
+    def _reset(self, inode):
+        self.offsets = {}
+        self.record_numbers = {}
+        self._records_seen = 0
+        self.stale = 0
+        self.replaying = True
+        self._size = 0
+        self._inode = inode
+        self.on_reset()
+
+    def get(self, record_id):
+        """
+        Read the latest version of one record, or None
+
+        If another process replaced the file since the last refresh, the
+        offset points into the new file; the log is then refreshed and the
+        record read again.
+        """
+        for _ in range(2):
+            offset = self.offsets.get(record_id)
+            if offset is None:
+                return None
+            row = self._read_at(offset)
+            if row is not None and row.get('id') == record_id:
+                return row
+            self.refresh()
+        return None
+
+    def _read_at(self, offset):
+        """Parse the line at an offset of the file last indexed, or None if it was replaced"""
+        try:
+            with open(self.path, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != self._inode:
+                    return None
+                f.seek(offset)
+                return json.loads(f.readline())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def snapshot(self, record_ids, prefilter=None):
+        """
+        Return a generator over the latest versions of the given records
+
+        Offsets are captured now, so the generator stays consistent even if
+        the log is appended to or compacted while it is being consumed.
+
+        Args:
+            record_ids (iterable): IDs of the records
+            prefilter (callable, optional): Called with the BookingRecord of a
+                                            row, where the record file has one;
+                                            rows it rejects are skipped unread
+        """
+        positions = [(self.offsets[r], self.record_numbers.get(r)) for r in record_ids if r in self.offsets]
+        if not positions:
+            return iter(())
+        data = None
+        if prefilter is not None and self.records is not None and self.record_numbers:
+            data = self.records.view(self._inode)
+        limit = self.records.count(data) if data is not None else 0
+        f = open(self.path, 'rb')
+
+        def rows():
+            with f:
+                for offset, number in positions:
+                    if number is not None and number < limit and not prefilter(self.records.read(data, number)):
+                        continue
+                    f.seek(offset)
+                    yield json.loads(f.readline())
+
+        return rows()
+
+    def append(self, rows):
+        """Append rows and index them; caller must hold the write lock and have refreshed"""
+        lines = [(json.dumps(row) + '\n').encode() for row in rows]
+        data = b''.join(lines)
+        with open(self.path, 'ab') as f:
+            position = f.tell()
+            inode = os.fstat(f.fileno()).st_ino
+            # Encoded before the lines are written, so a row that cannot be
+            # described raises without leaving anything in the log
+            records = self._encode_records(position, rows, lines) if self.records is not None else None
+            f.write(data)
+        if self._inode is None:
+            # We created the file
+            self._rewritten_inode = inode
+        self.rows_written += len(rows)
+        self.bytes_written += len(data)
+        if records is not None:
+            self._append_records(inode, position, records)
+        self.refresh()
+
+    def _encode_records(self, position, rows, lines):
+        """Build the records of lines about to be appended at a position"""
+        records = []
+        for row, line in zip(rows, lines):
+            records.append(encode_record(row, position, len(line)))
+            position += len(line)
+        return records
+
+    def _append_records(self, inode, position, records):
+        """Describe appended lines in the record file (it is only an accelerator)"""
+        try:
+            self.records.sync(self.path, inode, position)
+            self.records.append(records)
+            self.bytes_written += sum(len(record) for record in records)
+        except OSError as e:
+            logger.error("Error writing booking records to %s: %s", self.records.path, e)
+
+    def compact(self, drop=()):
+        """Rewrite the log keeping only the latest version of each record not in drop"""
+        tmp_file = self.path + '.tmp'
+        data = self.records.view(self._inode) if self.records is not None else None
+        records = []
+        with open(self.path, 'rb') as src, open(tmp_file, 'wb') as out:
+            for record_id, offset in self.offsets.items():
+                if record_id in drop:
+                    continue
+                src.seek(offset)
+                line = src.readline()
+                if self.records is not None:
+                    # Existing records only move; lines without one are described afresh
+                    number = self.record_numbers.get(record_id)
+                    if data is not None and number is not None:
+                        records.append(relocate(self.records.raw(data, number), out.tell()))
+                    else:
+                        records.append(encode_record(json.loads(line), out.tell(), len(line)))
+                out.write(line)
+                self.bytes_written += len(line)
+            inode = os.fstat(out.fileno()).st_ino
+        os.replace(tmp_file, self.path)
+        self._rewritten_inode = inode
+        if self.records is not None:
+            try:
+                self.records.rewrite(inode, records)
+                self.bytes_written += sum(len(record) for record in records)
+            except OSError as e:
+                logger.error("Error writing booking records to %s: %s", self.records.path, e)
+        self.compactions += 1
+        self.refresh()
+
+class _FileLock:
+    """Exclusive advisory lock on a file, shared by every process using the store"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._fd.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._fd.fileno(), fcntl.LOCK_UN)
+        self._fd.close()
+        self._fd = None
@@ -0,0 +1,174 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from app.services.booking_archive import FINISHED_STATUSES
+from app.utils.logging_config import correlation_context, get_correlation_id
+from app.utils.time_utils import sleep
+
+logger = logging.getLogger(__name__)
+
+# Access codes deleted at once when cancelling several bookings
+REVOKE_WORKERS = int(os.getenv('REVOKE_WORKERS', 8))
+
+# Failed deletes are retried this many times in total, further apart each time
+REVOKE_MAX_ATTEMPTS = 3
+REVOKE_RETRY_SECONDS = 0.5
+
+class CancellationService:
+    def __init__(self, booking_store, seam_service, reconciliation_service=None,
+                 workers=REVOKE_WORKERS, max_attempts=REVOKE_MAX_ATTEMPTS,
+                 retry_seconds=REVOKE_RETRY_SECONDS):
+        """
+        Initialize the cancellation service
+
+        Cancels bookings in one store write, then deletes their access codes
+        from the locks over a bounded pool of workers, retrying each failed
+        delete. Codes that still could not be deleted are reported back and
+        their devices are marked for the next reconciliation, which removes
+        codes no booking accounts for.
+
+        Args:
+            booking_store (BookingStore): Store holding the bookings and their jobs
+            seam_service (SeamService): Service used to delete the codes
+            reconciliation_service (ReconciliationService, optional): Told which
+                                                                      devices kept codes
+            workers (int, optional): Deletes in flight at most
+            max_attempts (int, optional): Tries per code
+            retry_seconds (float, optional): Wait before the second try; doubles after
+        """
+        self.booking_store = booking_store
+        self.seam_service = seam_service
+        self.reconciliation_service = reconciliation_service
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+
+    def refusal(self, booking):
+        """
+        Get why a booking cannot be cancelled
+
+        Args:
+            booking (Booking): The booking
+
+        Returns:
+            str: The reason, or None if it can be cancelled
+        """
+        if booking.status in FINISHED_STATUSES:
+            return f"Booking is already {booking.status}"
+        if booking.is_active():
+            return "Cannot cancel an active booking"
+        return None
+
+    def codes_to_revoke(self, booking):
+        """
+        Get the access codes to delete when a booking is cancelled
+
+        Args:
+            booking (Booking): The booking
+
+        Returns:
+            list: Access code IDs on the lock
+        """
+        codes = []
+        if booking.access_code_id and booking.is_future():
+            codes.append(booking.access_code_id)
+        # Codes already pushed for upcoming occurrences of a series
+        codes += [details['access_code_id'] for details in booking.occurrence_codes.values()]
+        return codes
+
+    def cancel(self, bookings):
+        """
+        Cancel bookings and revoke their access codes
+
+        Bookings that cannot be cancelled are left as they are. The others
+        are saved as cancelled in a single append, with their pending jobs
+        (provisioning, reminders) cancelled in another, before any code is
+        deleted.
+
+        Args:
+            bookings (list): Booking objects
+
+        Returns:
+            list: One result per booking, in order: booking_id, status
+                  ("cancelled" or "skipped"), and either the reason it was
+                  skipped or the codes revoked and still pending revocation
+        """
+        results, cancelled, codes = [], [], {}
+        for booking in bookings:
+            reason = self.refusal(booking)
+            if reason:
+                results.append({'booking_id': booking.id, 'status': 'skipped', 'reason': reason})
+                continue
+            codes[booking.id] = self.codes_to_revoke(booking)
+            booking.status = 'cancelled'
+            booking.occurrence_codes = {}
+            cancelled.append(booking)
+            results.append({'booking_id': booking.id, 'status': 'cancelled'})
+
+        if cancelled:
+            self.booking_store.update_bookings(cancelled)
+            self.booking_store.cancel_jobs([booking.id for booking in cancelled])
+
+        outcomes = self.revoke([code for booking in cancelled for code in codes[booking.id]])
+
+        devices_with_leftovers = set()
+        by_id = {booking.id: booking for booking in cancelled}
+        for result in results:
+            if result['status'] != 'cancelled':
+                continue
+            booking_codes = codes[result['booking_id']]
+            result['revoked'] = [code for code in booking_codes if outcomes[code] is None]
+            result['pending_revocation'] = [
+                {'access_code_id': code, 'error': outcomes[code]}
+                for code in booking_codes if outcomes[code] is not None
+            ]
+            if result['pending_revocation']:
+                devices_with_leftovers.add(by_id[result['booking_id']].device_id)
+
+        if self.reconciliation_service is not None:
+            for device_id in devices_with_leftovers:
+                self.reconciliation_service.mark_dirty(device_id)
+        return results
+
+    def revoke(self, access_code_ids):
+        """
+        Delete access codes in parallel, retrying failures
+
+        Args:
+            access_code_ids (list): Codes to delete
+
+        Returns:
+            dict: Per code, None once deleted or the last error message
+        """
+        if not access_code_ids:
+            return {}
+        if len(access_code_ids) == 1 or self.workers <= 1:
+            return {code: self._revoke_one(code) for code in access_code_ids}
+
+        # Pool threads log under the caller's correlation id
+        correlation_id = get_correlation_id()
+        with ThreadPoolExecutor(max_workers=min(len(access_code_ids), self.workers)) as pool:
+            return dict(zip(access_code_ids, pool.map(
+                lambda code: self._revoke_one(code, correlation_id), access_code_ids
+            )))
+
+    def _revoke_one(self, access_code_id, correlation_id=None):
+        """Delete one code; return None on success or the last error"""
+        if correlation_id:
+            with correlation_context(correlation_id):
+                return self._revoke_one(access_code_id)
+
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.seam_service.delete_access_code(access_code_id)
+                return None
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                if attempt < self.max_attempts:
+                    sleep(self.retry_seconds * 2 ** (attempt - 1))
+
+        logger.error("Could not delete access code %s after %d attempts: %s",
+                     access_code_id, self.max_attempts, error,
+                     extra={'event': 'cancellation.revoke_failed', 'access_code_id': access_code_id})
+        return error
@@ -0,0 +1,374 @@
+import logging
+import os
+import threading
+from datetime import timedelta
+from app.services.provisioning_service import PROVISION_JOB, PROVISION_HORIZON_HOURS
+from app.services.scheduler_service import HELD_STATUSES, OCCURRENCE_LOOKAHEAD_HOURS
+from app.utils.recurrence import Recurrence
+from app.utils.time_utils import datetime_to_iso, get_current_utc_datetime, to_utc_datetime
+
+logger = logging.getLogger(__name__)
+
+# Code slots of a lock whose model is not configured and that reports none (0: unlimited)
+LOCK_CODE_SLOTS = int(os.getenv('LOCK_CODE_SLOTS', 0))
+
+# Code slots per lock model (Seam device_type), e.g. "schlage_lock=30,yale_lock=250".
+# These win over the capacity a lock reports.
+LOCK_CODE_SLOTS_BY_MODEL = os.getenv('LOCK_CODE_SLOTS_BY_MODEL', '')
+
+# Use the capacity each lock reports to Seam; this looks the device up in Seam
+LOCK_CAPACITY_DISCOVERY = os.getenv('LOCK_CAPACITY_DISCOVERY', 'False').lower() == 'true'
+
+# How long a lock's capacity is reused before Seam is asked again (after a
+# failed lookup, the shorter delay)
+LOCK_CAPACITY_TTL_SECONDS = 3600
+LOCK_CAPACITY_RETRY_SECONDS = 300
+
+# How far ahead the occurrences of a new recurring series are checked for free slots
+SERIES_CAPACITY_DAYS = 30
+
+def parse_model_slots(spec):
+    """
+    Parse "model=slots,..." into a dict
+
+    Args:
+        spec (str): Comma-separated model=slots pairs
+
+    Returns:
+        dict: Code slots per lock model
+    """
+    slots = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        model, count = item.split('=', 1)
+        slots[model.strip()] = max(int(count), 0)
+    return slots
+
+class CapacityService:
+    def __init__(self, booking_store, seam_service, default_slots=LOCK_CODE_SLOTS, model_slots=None,
+                 discovery=LOCK_CAPACITY_DISCOVERY, horizon_hours=PROVISION_HORIZON_HOURS,
+                 lookahead_hours=OCCURRENCE_LOOKAHEAD_HOURS):
+        """
+        Initialize the capacity service
+
+        Locks hold a limited number of access codes. This service accounts
+        for the slots each device's bookings take over time, from the local
+        index: a one-off booking takes a slot from when its code is pushed
+        (now, or the due time of its provisioning job if it is scheduled)
+        until it ends, and each occurrence of a series takes one from the
+        lookahead before it starts. New bookings are checked against the
+        lock's capacity before any code is created, so a full lock is found
+        here rather than by Seam rejecting the create.
+
+        A lock's capacity is the configured value for its model, else the
+        number of codes Seam reports it supports (with discovery), else
+        default_slots. Seam is only asked for the device when model
+        capacities are configured or discovery is on; otherwise every lock
+        has default_slots, and with the default of 0 nothing is enforced.
+
+        Args:
+            booking_store (BookingStore): Store holding the bookings and their jobs
+            seam_service (SeamService): Service used to look up lock models
+            default_slots (int, optional): Capacity of other locks (0: unlimited)
+            model_slots (dict, optional): Capacity per lock model
+                                          (default: LOCK_CODE_SLOTS_BY_MODEL)
+            discovery (bool, optional): Use the capacity locks report to Seam
+            horizon_hours (float, optional): How far ahead scheduled codes are pushed
+            lookahead_hours (int, optional): How far ahead occurrence codes are pushed
+        """
+        self.booking_store = booking_store
+        self.seam_service = seam_service
+        self.default_slots = default_slots
+        self.model_slots = parse_model_slots(LOCK_CODE_SLOTS_BY_MODEL) if model_slots is None else model_slots
+        self.discovery = discovery
+        self.horizon_hours = horizon_hours
+        self.lookahead_hours = lookahead_hours
+        self._capacities = {}
+        self._lock = threading.Lock()
+
+    def capacity(self, device_id):
+        """
+        Get how many codes a lock holds
+
+        Args:
+            device_id (str): The ID of the lock
+
+        Returns:
+            dict: slots (0 if unlimited), model (None if unknown) and source
+                  of the figure (model, device or default)
+        """
+        if not self.model_slots and not self.discovery:
+            return {'slots': self.default_slots, 'model': None, 'source': 'default'}
+
+        now = get_current_utc_datetime()
+        with self._lock:
+            cached = self._capacities.get(device_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        ttl = LOCK_CAPACITY_TTL_SECONDS
+        model = reported = None
+        try:
+            device = self.seam_service.get_device_info(device_id)
+            model = _field(device, 'device_type')
+            reported = _field(_field(device, 'properties'), 'max_active_codes_supported')
+        except Exception as e:
+            logger.warning("Could not look up the capacity of device %s: %s", device_id, e,
+                           extra={'event': 'capacity.lookup_failed', 'device_id': device_id})
+            ttl = LOCK_CAPACITY_RETRY_SECONDS
+
+        if model in self.model_slots:
+            capacity = {'slots': self.model_slots[model], 'model': model, 'source': 'model'}
+        elif self.discovery and isinstance(reported, int) and reported > 0:
+            capacity = {'slots': reported, 'model': model, 'source': 'device'}
+        else:
+            capacity = {'slots': self.default_slots, 'model': model, 'source': 'default'}
+
+        with self._lock:
+            self._capacities[device_id] = (now + timedelta(seconds=ttl), capacity)
+        return capacity
+
+    def slot_intervals(self, device_id, until, exclude=None, now=None):
+        """
+        Get the code slots a device's bookings take from now on
+
+        Args:
+            device_id (str): The ID of the lock
+            until (datetime): Ignore slots taken from this time on
+            exclude (str, optional): ID of a booking to leave out
+            now (datetime, optional): Current time
+
+        Returns:
+            list: (start, end) tuples, one per code, clipped to start no earlier than now
+        """
+        now = now or get_current_utc_datetime()
+        intervals = []
+        for booking in self.booking_store.iter_bookings(device_id=device_id, status=HELD_STATUSES):
+            if booking.id == exclude:
+                continue
+            for start, end in self._booking_slots(booking, now, until):
+                if start < until:
+                    intervals.append((max(start, now), end))
+        return intervals
+
+    def _booking_slots(self, booking, now, until):
+        """Slots a held booking takes that end after now"""
+        lookahead = timedelta(hours=self.lookahead_hours)
+        series = booking.get_recurrence()
+        if series:
+            return [(start - lookahead, end) for start, end in series.occurrences(now, until + lookahead)]
+
+        ends_at = to_utc_datetime(booking.ends_at)
+        if ends_at <= now:
+            return []
+        return [(self._pushed_at(booking, now), ends_at)]
+
+    def _pushed_at(self, booking, now):
+        """When a one-off booking's code goes on the lock"""
+        if booking.status != 'scheduled':
+            return now
+        job = self.booking_store.get_job(f"{PROVISION_JOB}:{booking.id}")
+        if job is not None and job['status'] == 'pending':
+            return max(to_utc_datetime(job['due_at']), now)
+        return max(to_utc_datetime(booking.starts_at) - timedelta(hours=self.horizon_hours), now)
+
+    def admit(self, device_id, starts_at, ends_at, recurrence=None, provision_at=None, exclude=None):
+        """
+        Decide whether a booking fits on its lock
+
+        A one-off booking whose slot is taken when its code would be pushed
+        can be deferred: its code is then pushed once a slot frees up, as
+        long as that is before the booking starts.
+
+        Args:
+            device_id (str): The ID of the lock
+            starts_at (str|datetime): Start of the booking (first occurrence of a series)
+            ends_at (str|datetime): End of the booking (first occurrence of a series)
+            recurrence (str, optional): RRULE-style rule of a recurring series
+            provision_at (datetime, optional): When its code would be pushed (default: now)
+            exclude (str, optional): ID of the booking itself, if already saved
+
+        Returns:
+            dict: decision (admit, defer or reject), provision_at (when to
+                  push the code if deferred), slots and peak_used (most
+                  slots other bookings take while this one would hold its own)
+        """
+        return self.admit_batch([(device_id, starts_at, ends_at, recurrence, provision_at)], exclude=exclude)[0]
+
+    def admit_batch(self, bookings, exclude=None):
+        """
+        Decide whether each of several candidate bookings fits on its lock
+
+        Candidates are judged independently of each other; each lock's
+        capacity and bookings are read once.
+
+        Args:
+            bookings (list): (device_id, starts_at, ends_at, recurrence, provision_at) tuples
+            exclude (str, optional): ID of a booking to leave out
+
+        Returns:
+            list: One decision per candidate, as returned by admit()
+        """
+        now = get_current_utc_datetime()
+        candidates = []
+        for device_id, starts_at, ends_at, recurrence, provision_at in bookings:
+            starts_at, ends_at = to_utc_datetime(starts_at), to_utc_datetime(ends_at)
+            if recurrence:
+                lookahead = timedelta(hours=self.lookahead_hours)
+                series = Recurrence(recurrence, starts_at, ends_at)
+                slots = [
+                    (max(start - lookahead, now), end)
+                    for start, end in series.occurrences(now, now + timedelta(days=SERIES_CAPACITY_DAYS))
+                ]
+            else:
+                slots = [(max(provision_at or now, now), ends_at)]
+            candidates.append((device_id, starts_at, bool(recurrence), slots))
+
+        until_by_device = {}
+        for device_id, _, _, slots in candidates:
+            until = max((end for _, end in slots), default=now)
+            until_by_device[device_id] = max(until_by_device.get(device_id, until), until)
+        capacities = {device_id: self.capacity(device_id)['slots'] for device_id in until_by_device}
+        steps = {
+            device_id: _usage_steps(self.slot_intervals(device_id, until, exclude=exclude, now=now))
+            for device_id, until in until_by_device.items() if capacities[device_id]
+        }
+
+        decisions = []
+        for device_id, starts_at, recurring, slots in candidates:
+            capacity = capacities[device_id]
+            if not capacity:
+                decisions.append({'decision': 'admit', 'provision_at': None, 'slots': 0, 'peak_used': None})
+                continue
+
+            device_steps = steps[device_id]
+            peak = max((_peak(device_steps, start, end) for start, end in slots), default=0)
+            decision = {'decision': 'admit', 'provision_at': None, 'slots': capacity, 'peak_used': peak}
+            if peak >= capacity:
+                free_at = None if recurring else _free_from(device_steps, slots[0][0], slots[0][1], capacity)
+                if free_at is not None and free_at <= starts_at:
+                    decision.update(decision='defer', provision_at=free_at)
+                else:
+                    decision['decision'] = 'reject'
+            decisions.append(decision)
+        return decisions
+
+    def usage(self, device_ids, start, end, step):
+        """
+        Get code-slot pressure per device over time
+
+        Args:
+            device_ids (list): IDs of the locks
+            start (datetime): Start of the range; slots are only known from now on
+            end (datetime): End of the range
+            step (timedelta): Bucket size
+
+        Returns:
+            dict: starts_at/ends_at of the range and, per device, its capacity,
+                  peak_used, pressure (peak_used / slots, None if unlimited) and
+                  the per-bucket breakdown
+        """
+        now = get_current_utc_datetime()
+        start = max(to_utc_datetime(start), now)
+        end = to_utc_datetime(end)
+
+        devices = {}
+        for device_id in device_ids:
+            capacity = self.capacity(device_id)
+            device_steps = _usage_steps(self.slot_intervals(device_id, end, now=now))
+            buckets = []
+            bucket_start = start
+            while bucket_start < end:
+                bucket_end = min(bucket_start + step, end)
+                used = _peak(device_steps, bucket_start, bucket_end)
+                buckets.append({
+                    'starts_at': datetime_to_iso(bucket_start),
+                    'peak_used': used,
+                    'pressure': _pressure(used, capacity['slots'])
+                })
+                bucket_start = bucket_end
+            peak = max((bucket['peak_used'] for bucket in buckets), default=0)
+            devices[device_id] = dict(
+                capacity,
+                peak_used=peak,
+                pressure=_pressure(peak, capacity['slots']),
+                buckets=buckets
+            )
+
+        return {
+            'starts_at': datetime_to_iso(start),
+            'ends_at': datetime_to_iso(end),
+            'devices': devices
+        }
+
+def _field(value, name):
+    """Read a field of a Seam SDK object or plain dict"""
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+def _pressure(used, slots):
+    return round(used / slots, 4) if slots else None
+
+def _usage_steps(intervals):
+    """
+    Turn slot intervals into a step function
+
+    Returns:
+        list: (time, slots used from then on) tuples sorted by time; before the
+              first time no slot is used
+    """
+    deltas = {}
+    for start, end in intervals:
+        if end > start:
+            deltas[start] = deltas.get(start, 0) + 1
+            deltas[end] = deltas.get(end, 0) - 1
+
+    steps = []
+    used = 0
+    for moment in sorted(deltas):
+        used += deltas[moment]
+        steps.append((moment, used))
+    return steps
+
+def _used_at(steps, moment):
+    """Slots used at a time"""
+    used = 0
+    for step_moment, step_used in steps:
+        if step_moment > moment:
+            break
+        used = step_used
+    return used
+
+def _peak(steps, start, end):
+    """Most slots used at any time in [start, end)"""
+    peak = 0
+    for moment, used in steps:
+        if moment >= end:
+            break
+        if moment <= start:
+            peak = used
+        else:
+            peak = max(peak, used)
+    return peak
+
+def _free_from(steps, start, end, capacity):
+    """
+    Get the earliest time from which a slot stays free until end
+
+    Returns:
+        datetime: A time at or after start, or None if no slot is free up to end
+    """
+    # Slots used on each stretch of [start, end), walked back from the end
+    stretches = [(start, _used_at(steps, start))]
+    stretches += [(moment, used) for moment, used in steps if start < moment < end]
+
+    free_from = None
+    peak = 0
+    for moment, used in reversed(stretches):
+        peak = max(peak, used)
+        if peak >= capacity:
+            break
+        free_from = moment
+    return free_from
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+# Changes kept per device for clients resuming a stream
+CHANGE_HISTORY_PER_DEVICE = int(os.getenv('CHANGE_HISTORY_PER_DEVICE', 500))
+
+# How often a waiting stream checks the booking log for other processes' writes
+CHANGE_POLL_SECONDS = 1.0
+
+# Booking status -> change type, for rows that update an existing booking
+STATUS_CHANGES = {
+    'cancelled': 'booking.cancelled',
+    'expired': 'booking.expired',
+    'failed': 'booking.failed',
+}
+
+class ChangeBus:
+    def __init__(self, poll=None, history=CHANGE_HISTORY_PER_DEVICE):
+        """
+        Initialize the change bus
+
+        Keeps a bounded, ordered history of booking changes per device and
+        wakes streams waiting on a device when one is published. Every
+        change gets a resume token "<epoch>-<sequence>"; the epoch is unique
+        to this bus, so a token from another process or an earlier run is
+        recognised as unusable rather than misread.
+
+        Args:
+            poll (callable, optional): Called while waiting, to pick up changes
+                                       made by other processes (e.g. BookingStore.refresh)
+            history (int, optional): Changes kept per device
+        """
+        self.poll = poll
+        self.history = history
+        self.epoch = uuid.uuid4().hex[:8]
+        self._sequence = 0
+        self._changes = {}
+        self._evicted = {}
+        self._condition = threading.Condition()
+
+    def publish(self, device_id, change_type, data):
+        """
+        Record a change and wake the streams of its device
+
+        Args:
+            device_id (str): The device the change concerns
+            change_type (str): e.g. "booking.created"
+            data (dict): Change payload
+
+        Returns:
+            dict: The change, with id (resume token), type and data
+        """
+        with self._condition:
+            self._sequence += 1
+            change = {'id': f"{self.epoch}-{self._sequence}", 'seq': self._sequence,
+                      'type': change_type, 'data': data}
+            changes = self._changes.get(device_id)
+            if changes is None:
+                changes = self._changes[device_id] = deque(maxlen=self.history)
+            elif len(changes) == changes.maxlen:
+                # Remember what falls off so stale resume tokens are detected
+                self._evicted[device_id] = changes[0]['seq']
+            changes.append(change)
+            self._condition.notify_all()
+        return change
+
+    def publish_booking_row(self, row, is_new):
+        """
+        Publish a booking row from the store's log as a change
+
+        Registered with BookingStore.add_change_listener.
+
+        Args:
+            row (dict): The booking row
+            is_new (bool): Whether the row created the booking
+        """
+        if is_new:
+            change_type = 'booking.created'
+        else:
+            change_type = STATUS_CHANGES.get(row.get('status'), 'booking.updated')
+
+        self.publish(row.get('device_id'), change_type, {
+            'booking_id': row['id'],
+            'access_code_id': row.get('access_code_id'),
+            'status': row.get('status'),
+            'starts_at': row.get('starts_at'),
+            'ends_at': row.get('ends_at'),
+            'recurrence': row.get('recurrence')
+        })
+
+    def reset(self):
+        """
+        Forget every change and invalidate every resume token
+
+        Registered with BookingStore.add_reset_listener: after another
+        process rebuilt the booking log, changes it made were never
+        published, so every stream is sent a "reset" and reloads its view.
+        """
+        with self._condition:
+            self.epoch = uuid.uuid4().hex[:8]
+            self._changes = {}
+            self._evicted = {}
+            self._condition.notify_all()
+
+    def current_token(self):
+        """
+        Get a token that resumes after every change published so far
+
+        Returns:
+            str: Resume token
+        """
+        with self._condition:
+            return f"{self.epoch}-{self._sequence}"
+
+    def changes_since(self, device_id, token):
+        """
+        Get a device's changes after a resume token
+
+        Args:
+            device_id (str): The device
+            token (str): Resume token from an earlier change or current_token()
+
+        Returns:
+            list: Changes in order, or None if the token cannot be resumed
+                  (unknown epoch or changes already dropped from the history)
+        """
+        seq = self._parse_token(token)
+        if seq is None:
+            return None
+
+        with self._condition:
+            return self._changes_after(device_id, seq)
+
+    def wait(self, device_id, token, timeout):
+        """
+        Wait for a device's changes after a resume token
+
+        Args:
+            device_id (str): The device
+            token (str): Resume token
+            timeout (float): Seconds to wait at most
+
+        Returns:
+            list: Changes (empty on timeout), or None if the token cannot be resumed
+        """
+        seq = self._parse_token(token)
+        if seq is None:
+            return None
+
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.poll is not None:
+                self.poll()
+            with self._condition:
+                if self._parse_token(token) is None:
+                    # The bus was reset while we waited
+                    return None
+                changes = self._changes_after(device_id, seq)
+                if changes is None or changes:
+                    return changes
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(min(remaining, CHANGE_POLL_SECONDS))
+
+    def _parse_token(self, token):
+        epoch, _, seq = (token or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _changes_after(self, device_id, seq):
+        """Changes after seq, or None if some were dropped; caller holds the lock"""
+        if seq < self._evicted.get(device_id, 0):
+            return None
+        return [change for change in self._changes.get(device_id, ()) if change['seq'] > seq]
@@ -0,0 +1,165 @@
+import os
+import threading
+from flask import current_app
+from werkzeug.local import LocalProxy
+from app.services.analytics_service import UtilizationService
+from app.services.booking_store import BookingStore
+from app.services.cancellation_service import CancellationService
+from app.services.capacity_service import CapacityService
+from app.services.change_bus import ChangeBus
+from app.services.seam_service import SeamService
+from app.services.scheduler_service import SchedulerService
+from app.services.notification_service import NotificationService
+from app.services.provisioning_service import ProvisioningService
+from app.services.reconciliation_service import ReconciliationService
+from app.services.reminder_service import ReminderService
+from app.services.webhook_service import WebhookService
+from app.services.shared_cache import SharedCache, SHARED_CACHE_ENABLED
+
+class ServiceContainer:
+    def __init__(self, data_dir='data', **services):
+        """
+        Initialize the service container
+
+        Services are built on first access, so creating the app (or a
+        worker) costs nothing until a request actually needs one.
+
+        Args:
+            data_dir (str, optional): Directory for the booking store
+            **services: Pre-built services to use instead of the defaults,
+                        keyed by attribute name (e.g. seam_service=...)
+        """
+        self.data_dir = data_dir
+        self._services = dict(services)
+        self._lock = threading.RLock()
+
+    def _get(self, name, factory):
+        """Return the named service, building it once if needed"""
+        if name not in self._services:
+            with self._lock:
+                if name not in self._services:
+                    self._services[name] = factory()
+        return self._services[name]
+
+    @property
+    def shared_cache(self):
+        return self._get('shared_cache', self._build_shared_cache)
+
+    def _build_shared_cache(self):
+        if not SHARED_CACHE_ENABLED:
+            return None
+        return SharedCache(os.path.join(self.data_dir, '.shared_cache'))
+
+    @property
+    def booking_store(self):
+        return self._get('booking_store', self._build_booking_store)
+
+    def _build_booking_store(self):
+        store = BookingStore(data_dir=self.data_dir)
+        if self.shared_cache is not None:
+            # Every write to a device's bookings invalidates its cached views
+            store.add_listener(self.shared_cache.invalidate)
+        return store
+
+    @property
+    def change_bus(self):
+        return self._get('change_bus', self._build_change_bus)
+
+    def _build_change_bus(self):
+        # Fed from the booking log, so writes by other workers reach this process's streams
+        bus = ChangeBus(poll=self.booking_store.refresh)
+        self.booking_store.add_change_listener(bus.publish_booking_row)
+        self.booking_store.add_reset_listener(bus.reset)
+        return bus
+
+    @property
+    def utilization_service(self):
+        return self._get('utilization_service', self._build_utilization_service)
+
+    def _build_utilization_service(self):
+        service = UtilizationService(self.booking_store)
+        # Registered before the counters are built, so no change falls in between
+        self.booking_store.add_change_listener(service.record_booking_row)
+        self.booking_store.add_reset_listener(service.resync)
+        return service
+
+    @property
+    def seam_service(self):
+        return self._get('seam_service', SeamService)
+
+    @property
+    def scheduler_service(self):
+        return self._get('scheduler_service', lambda: SchedulerService(
+            seam_service=self.seam_service,
+            booking_store=self.booking_store,
+            cache=self.shared_cache
+        ))
+
+    @property
+    def notification_service(self):
+        return self._get('notification_service', NotificationService)
+
+    @property
+    def reconciliation_service(self):
+        return self._get('reconciliation_service', lambda: ReconciliationService(
+            self.booking_store, self.seam_service
+        ))
+
+    @property
+    def reminder_service(self):
+        return self._get('reminder_service', lambda: ReminderService(
+            self.booking_store, self.notification_service
+        ))
+
+    @property
+    def capacity_service(self):
+        return self._get('capacity_service', lambda: CapacityService(
+            self.booking_store, self.seam_service
+        ))
+
+    @property
+    def provisioning_service(self):
+        return self._get('provisioning_service', lambda: ProvisioningService(
+            self.booking_store, self.scheduler_service,
+            self.notification_service, self.reminder_service,
+            capacity_service=self.capacity_service
+        ))
+
+    @property
+    def cancellation_service(self):
+        return self._get('cancellation_service', lambda: CancellationService(
+            self.booking_store, self.seam_service, self.reconciliation_service
+        ))
+
+    @property
+    def webhook_service(self):
+        return self._get('webhook_service', self._build_webhook_service)
+
+    def _build_webhook_service(self):
+        service = WebhookService(self.booking_store)
+        service.add_listener(self.reconciliation_service.mark_dirty)
+        return service
+
+def current_services():
+    """
+    Get the service container of the running app
+
+    Returns:
+        ServiceContainer: The container attached by create_app()
+    """
+    return current_app.extensions['services']
+
+def service_proxy(name):
+    """
+    Get a proxy to one of the running app's services
+
+    Modules can bind the proxy at import time and use it like the service
+    itself; it resolves against the app handling the current request.
+
+    Args:
+        name (str): Service attribute name on ServiceContainer
+
+    Returns:
+        LocalProxy: Proxy to the service
+    """
+    return LocalProxy(lambda: getattr(current_services(), name))
@@ -0,0 +1,76 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+from app.utils.time_utils import get_current_utc_datetime, is_in_past
+
+class FakeSeamService:
+    def __init__(self, latency_ms=0):
+        """
+        Initialize the fake Seam service
+
+        An in-memory stand-in for SeamService, for replays and simulations
+        that must not touch real locks. Codes behave like Seam's: listed
+        per device with their times, deleted by ID. Calls are counted per
+        operation, and deleted codes are kept in `deleted` with the (clock)
+        time of their deletion.
+
+        Args:
+            latency_ms (float, optional): Delay added to every call, to
+                                          mimic the round trip to Seam
+        """
+        self.latency_ms = latency_ms
+        self.codes = {}
+        self.call_counts = {}
+        self.deleted = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        """Count a call and wait out the simulated latency"""
+        with self._lock:
+            self.call_counts[operation] = self.call_counts.get(operation, 0) + 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def create_access_code(self, device_id, code, name, starts_at, ends_at):
+        self._call('access_codes.create')
+        with self._lock:
+            access_code_id = f"fake_ac_{next(self._ids)}"
+            self.codes[access_code_id] = SimpleNamespace(
+                access_code_id=access_code_id, device_id=device_id, code=code,
+                name=name, starts_at=starts_at, ends_at=ends_at
+            )
+        return {
+            "access_code_id": access_code_id,
+            "code": code,
+            "starts_at": starts_at,
+            "ends_at": ends_at,
+            "name": name
+        }
+
+    def get_access_codes(self, device_id):
+        self._call('access_codes.list')
+        with self._lock:
+            return [code for code in self.codes.values() if code.device_id == device_id]
+
+    def delete_access_code(self, access_code_id):
+        self._call('access_codes.delete')
+        with self._lock:
+            code = self.codes.pop(access_code_id, None)
+            if code is not None:
+                code.deleted_at = get_current_utc_datetime()
+                self.deleted.append(code)
+        return True
+
+    def delete_expired_codes(self, device_id):
+        deleted_codes = []
+        for code in self.get_access_codes(device_id):
+            if is_in_past(code.ends_at):
+                self.delete_access_code(code.access_code_id)
+                deleted_codes.append(code.access_code_id)
+        return deleted_codes
+
+    def get_device_info(self, device_id):
+        self._call('devices.get')
+        return SimpleNamespace(device_id=device_id, display_name=device_id)
@@ -1,9 +1,14 @@
+import logging
 import smtplib
 import os
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from app.utils.time_utils import format_datetime_for_display
+from app.services.sms_service import SMSService, build_sms_provider
+from app.utils.logging_config import REQUEST_ID_HEADER, get_correlation_id
+
+logger = logging.getLogger(__name__)
 
 class NotificationService:
     def __init__(self, email_config=None, sms_config=None):
@@ -12,7 +17,9 @@ class NotificationService:
         
         Args:
             email_config (dict, optional): Email configuration parameters
-            sms_config (dict, optional): SMS configuration parameters
+            sms_config (dict, optional): SMS configuration parameters (see
+                                         build_sms_provider); defaults to the
+                                         SMS_* environment variables
         """
         self.email_config = email_config or {
             'smtp_server': os.getenv('SMTP_SERVER', 'smtp.gmail.com'),
@@ -23,6 +30,7 @@ class NotificationService:
         }
         
         self.sms_config = sms_config or {}
+        self.sms_service = SMSService(build_sms_provider(self.sms_config))
     
     def format_datetime(self, datetime_str):
         """
@@ -48,7 +56,7 @@ class NotificationService:
             bool: True if the email was sent successfully, False otherwise
         """
         if not self.email_config['smtp_username'] or not self.email_config['smtp_password']:
-            print("Email credentials not configured. Email not sent.")
+            logger.warning("Email credentials not configured. Email not sent.", extra={'event': 'email.skipped'})
             return False
         
         try:
@@ -57,6 +65,7 @@ class NotificationService:
             msg['Subject'] = 'Your Smart Lock Access Code'
             msg['From'] = self.email_config['from_email']
             msg['To'] = email
+            self._tag(msg)
             
             # Format the email body
             start_time = self.format_datetime(access_details['starts_at'])
@@ -84,26 +93,58 @@ class NotificationService:
                 server.login(self.email_config['smtp_username'], self.email_config['smtp_password'])
                 server.send_message(msg)
             
+            logger.info("Access code email sent", extra={'event': 'email.sent', 'kind': 'access_code'})
             return True
         except Exception as e:
-            print(f"Failed to send email: {str(e)}")
+            logger.error("Failed to send email: %s", e, extra={'event': 'email.failed', 'kind': 'access_code'})
             return False
     
     def send_access_code_sms(self, phone_number, access_details):
         """
-        Send an SMS with access code details (placeholder for SMS integration)
+        Queue an SMS with access code details
+        
+        The message is sent in the background by the SMS service, so this
+        returns without waiting on the provider.
         
         Args:
             phone_number (str): Recipient's phone number
             access_details (dict): Access code details including code, start and end times
             
         Returns:
-            bool: True if the SMS was sent successfully, False otherwise
+            str: Message ID for delivery status lookups (see sms_status)
+        """
+        body = (
+            f"Your smart lock access code is {access_details['code']}, "
+            f"valid from {self.format_datetime(access_details['starts_at'])} "
+            f"until {self.format_datetime(access_details['ends_at'])}."
+        )
+        return self.sms_service.send(phone_number, body)
+    
+    def notify_access_code(self, user, access_details):
+        """
+        Send a user their access code by every channel they have
+        
+        Args:
+            user (User): The user (email and/or phone)
+            access_details (dict): Access code details including code, start and end times
         """
-        # This is a placeholder for actual SMS sending logic
-        # You would typically integrate with an SMS service like Twilio here
-        print(f"SMS notification would be sent to {phone_number} with code {access_details['code']}")
-        return True
+        if user.email:
+            self.send_access_code_email(user.email, access_details)
+        
+        if user.phone:
+            self.send_access_code_sms(user.phone, access_details)
+    
+    def sms_status(self, message_id):
+        """
+        Get the delivery status of a queued SMS
+        
+        Args:
+            message_id (str): ID returned by send_access_code_sms
+            
+        Returns:
+            dict: Status (queued, sent, failed, dropped) and details, or None if unknown
+        """
+        return self.sms_service.get_status(message_id)
     
     def send_expiration_reminder(self, email, access_details, hours_before=24):
         """
@@ -117,40 +158,75 @@ class NotificationService:
         Returns:
             bool: True if the reminder was sent successfully, False otherwise
         """
+        return self.send_expiration_reminders([(email, access_details)], hours_before)[0]
+    
+    def send_expiration_reminders(self, reminders, hours_before=24):
+        """
+        Send several expiration reminders over a single SMTP connection
+        
+        Args:
+            reminders (list): (email, access_details) tuples
+            hours_before (int): Hours before expiration the reminders are sent
+            
+        Returns:
+            list: One bool per reminder, True if it was sent
+        """
+        if not reminders:
+            return []
+        
         if not self.email_config['smtp_username'] or not self.email_config['smtp_password']:
-            print("Email credentials not configured. Reminder not sent.")
-            return False
+            logger.warning("Email credentials not configured. Reminder not sent.", extra={'event': 'email.skipped'})
+            return [False] * len(reminders)
         
+        results = []
         try:
-            # Create the email message
-            msg = MIMEMultipart()
-            msg['Subject'] = 'Your Access Code Will Expire Soon'
-            msg['From'] = self.email_config['from_email']
-            msg['To'] = email
-            
-            # Format the email body
-            end_time = self.format_datetime(access_details['ends_at'])
-            
-            body = f"""
-            <html>
-            <body>
-                <h2>Access Code Expiration Reminder</h2>
-                <p>Your temporary access code <strong>{access_details['code']}</strong> for the smart lock will expire soon:</p>
-                <p><strong>Expiration time:</strong> {end_time}</p>
-                <p>This is an automated reminder.</p>
-            </body>
-            </html>
-            """
-            
-            msg.attach(MIMEText(body, 'html'))
-            
-            # Connect to the SMTP server and send the email
+            # Connect to the SMTP server once for the whole batch
             with smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port']) as server:
                 server.starttls()
                 server.login(self.email_config['smtp_username'], self.email_config['smtp_password'])
-                server.send_message(msg)
-            
-            return True
+                
+                for email, access_details in reminders:
+                    try:
+                        server.send_message(self._build_expiration_reminder(email, access_details))
+                        results.append(True)
+                    except Exception as e:
+                        logger.error("Failed to send reminder email to %s: %s", email, e,
+                                     extra={'event': 'email.failed', 'kind': 'expiration_reminder'})
+                        results.append(False)
         except Exception as e:
-            print(f"Failed to send reminder email: {str(e)}")
-            return False
+            logger.error("Failed to send reminder email: %s", e,
+                         extra={'event': 'email.failed', 'kind': 'expiration_reminder'})
+        
+        # Reminders not attempted because the connection failed count as unsent
+        return results + [False] * (len(reminders) - len(results))
+    
+    def _build_expiration_reminder(self, email, access_details):
+        """Create the reminder email message for one access code"""
+        msg = MIMEMultipart()
+        msg['Subject'] = 'Your Access Code Will Expire Soon'
+        msg['From'] = self.email_config['from_email']
+        msg['To'] = email
+        self._tag(msg)
+        
+        # Format the email body
+        end_time = self.format_datetime(access_details['ends_at'])
+        
+        body = f"""
+        <html>
+        <body>
+            <h2>Access Code Expiration Reminder</h2>
+            <p>Your temporary access code <strong>{access_details['code']}</strong> for the smart lock will expire soon:</p>
+            <p><strong>Expiration time:</strong> {end_time}</p>
+            <p>This is an automated reminder.</p>
+        </body>
+        </html>
+        """
+        
+        msg.attach(MIMEText(body, 'html'))
+        return msg
+    
+    def _tag(self, msg):
+        """Carry the current correlation id in an outgoing email's headers"""
+        correlation_id = get_correlation_id()
+        if correlation_id:
+            msg[REQUEST_ID_HEADER] = correlation_id
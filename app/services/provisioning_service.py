@@ -0,0 +1,337 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from app.utils.logging_config import correlation_context, get_correlation_id
+from app.utils.time_utils import get_current_utc_datetime, to_utc_datetime
+
+logger = logging.getLogger(__name__)
+
+# Job kind of an access code to create in the background
+PROVISION_JOB = 'provision_booking'
+
+# Default for POST /bookings: reserve and answer 202 instead of waiting on Seam
+ASYNC_PROVISIONING = os.getenv('ASYNC_PROVISIONING', 'False').lower() == 'true'
+
+# Access codes created at once per process
+PROVISION_WORKERS = int(os.getenv('PROVISION_WORKERS', 4))
+
+# Codes of bookings starting further ahead are held locally until they enter
+# this window (0 pushes every code as soon as the booking is made)
+PROVISION_HORIZON_HOURS = float(os.getenv('PROVISION_HORIZON_HOURS', 0))
+
+# Jobs claimed per batch when draining due jobs synchronously
+PROVISION_BATCH_SIZE = 50
+
+# Failed creates are retried this many times in total, further apart each time
+PROVISION_MAX_ATTEMPTS = 3
+PROVISION_RETRY_SECONDS = 30
+
+# How often an idle dispatcher looks for retries and jobs queued by other processes
+PROVISION_POLL_SECONDS = 5
+
+# A job running this long belongs to a process that died; it is queued again
+PROVISION_STALL_SECONDS = 300
+
+class ProvisioningService:
+    def __init__(self, booking_store, scheduler_service, notification_service, reminder_service,
+                 workers=PROVISION_WORKERS, background=True, horizon_hours=PROVISION_HORIZON_HOURS,
+                 capacity_service=None):
+        """
+        Initialize the provisioning service
+
+        Moves reserved bookings through pending -> provisioning -> active
+        (or failed) by creating their access codes off the request thread.
+        Work is queued as jobs in the booking store, so it survives restarts
+        and any process can pick it up; each process runs a dispatcher
+        thread feeding a fixed pool of workers, started on first use.
+
+        Bookings starting beyond the provisioning horizon are held as
+        "scheduled" with their job due when they enter the window, so locks
+        only carry the codes of the next horizon_hours. A one-off booking
+        whose lock has no free code slot when its job comes due waits for
+        one, without using up an attempt.
+
+        Args:
+            booking_store (BookingStore): Store holding bookings and the job queue
+            scheduler_service (SchedulerService): Service creating the access codes
+            notification_service (NotificationService): Service sending the codes to guests
+            reminder_service (ReminderService): Service scheduling expiration reminders
+            workers (int, optional): Codes created at once
+            background (bool, optional): Run queued jobs in this process
+                                         (otherwise only through dispatch_due)
+            horizon_hours (float, optional): How far ahead codes are pushed to locks
+            capacity_service (CapacityService, optional): Accounts for the code slots of locks
+        """
+        self.booking_store = booking_store
+        self.scheduler_service = scheduler_service
+        self.notification_service = notification_service
+        self.reminder_service = reminder_service
+        self.workers = workers
+        self.background = background
+        self.horizon_hours = horizon_hours
+        self.capacity_service = capacity_service
+        self._slots = threading.BoundedSemaphore(workers)
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def deferred_until(self, starts_at, now=None):
+        """
+        Get when the code of a booking should be pushed, if not right away
+
+        Args:
+            starts_at (str|datetime): Start of the booking
+            now (datetime, optional): Current time
+
+        Returns:
+            datetime: When the booking enters the provisioning window,
+                      or None if it already has (or there is no horizon)
+        """
+        if not self.horizon_hours:
+            return None
+        now = now or get_current_utc_datetime()
+        provision_at = to_utc_datetime(starts_at) - timedelta(hours=self.horizon_hours)
+        return provision_at if provision_at > now else None
+
+    def submit(self, booking, due_at=None):
+        """
+        Queue the access code of a pending or scheduled booking
+
+        Args:
+            booking (Booking): A booking saved with status "pending" or "scheduled"
+            due_at (datetime, optional): When to create the code (default: now)
+
+        Returns:
+            dict: The provisioning job
+        """
+        job = self.booking_store.enqueue_job(
+            PROVISION_JOB, due_at or get_current_utc_datetime(),
+            booking_id=booking.id, job_id=f"{PROVISION_JOB}:{booking.id}",
+            correlation_id=get_correlation_id()
+        )
+        if self.background:
+            self.start()
+            self._wakeup.set()
+        return job
+
+    def provision(self, job):
+        """
+        Create the access code(s) of a claimed job's booking
+
+        Runs under the correlation id of the request that queued the job.
+
+        Args:
+            job (dict): Job returned by BookingStore.claim_due_jobs
+
+        Returns:
+            str: Outcome: active, failed, retry, deferred, cancelled or skipped
+        """
+        with correlation_context(job.get('correlation_id') or job['id']):
+            outcome = self._provision(job)
+        return outcome
+
+    def _provision(self, job):
+        """Create a job's codes and move its booking on (see provision)"""
+        booking = self.booking_store.get_booking(job['booking_id'])
+        if booking is None or booking.status not in ('scheduled', 'pending', 'provisioning'):
+            self.booking_store.finish_jobs([job])
+            return 'skipped'
+
+        if self.capacity_service is not None and not booking.recurrence:
+            # A rejection still goes to Seam: the lock has the final say
+            admission = self.capacity_service.admit(
+                booking.device_id, booking.starts_at, booking.ends_at, exclude=booking.id
+            )
+            if admission['decision'] == 'defer':
+                return self._defer(job, booking, admission['provision_at'])
+
+        # Admission may have waited on Seam; the guest could have cancelled meanwhile
+        booking = self._mark_provisioning(job['booking_id'])
+        if booking is None:
+            self.booking_store.finish_jobs([job])
+            return 'skipped'
+
+        read_at = booking.updated_at
+        user = self.booking_store.get_user(booking.user_id)
+        user_name = user.name if user else booking.user_id
+
+        try:
+            if booking.recurrence:
+                # Codes created before a failure stay on the booking for the retry
+                provisioned = self.scheduler_service.provision_occurrences(booking, user_name)
+            else:
+                access_details = self.scheduler_service.schedule_access(
+                    booking.device_id, booking.starts_at, booking.ends_at, user_name
+                )
+                booking.access_code_id = access_details['access_code_id']
+                booking.code = access_details['code']
+                provisioned = [access_details]
+        except Exception as e:
+            logger.warning("Error provisioning booking %s (attempt %d): %s", booking.id, job['attempts'], e,
+                           extra={'booking_id': booking.id})
+            return self._failed(job, booking, str(e))
+
+        # The guest may have cancelled while the code was being created
+        active = self._mark_active(booking, read_at)
+        if active is None:
+            self._revoke(booking)
+            self.booking_store.finish_jobs([job])
+            logger.info("Booking %s was cancelled while provisioning", booking.id,
+                        extra={'event': 'provisioning.cancelled', 'booking_id': booking.id})
+            return 'cancelled'
+
+        booking = active
+        self.booking_store.finish_jobs([job])
+        logger.info("Booking %s is active", booking.id,
+                    extra={'event': 'provisioning.active', 'booking_id': booking.id})
+
+        self.reminder_service.schedule_reminder(booking)
+        if user:
+            for access_details in provisioned:
+                self.notification_service.notify_access_code(user, access_details)
+        return 'active'
+
+    def _mark_provisioning(self, booking_id):
+        """Move a freshly read booking to provisioning, or None if it is no longer due"""
+        while True:
+            booking = self.booking_store.get_booking(booking_id)
+            if booking is None or booking.status not in ('scheduled', 'pending', 'provisioning'):
+                return None
+            read_at = booking.updated_at
+            booking.status = 'provisioning'
+            if self.booking_store.update_booking_if_unchanged(booking, read_at):
+                return booking
+
+    def _mark_active(self, booking, read_at):
+        """Save a provisioned booking as active, or return None if it was cancelled meanwhile"""
+        while True:
+            booking.status = 'active'
+            booking.provisioning_error = None
+            if self.booking_store.update_booking_if_unchanged(booking, read_at):
+                return booking
+
+            current = self.booking_store.get_booking(booking.id)
+            if current is None or current.status == 'cancelled':
+                return None
+            # Saved by someone else (e.g. a webhook about the new code): keep our codes on their copy
+            current.access_code_id = booking.access_code_id
+            current.code = booking.code
+            current.occurrence_codes = booking.occurrence_codes
+            booking, read_at = current, current.updated_at
+
+    def _defer(self, job, booking, provision_at):
+        """Hold a booking's code until its lock has a free slot"""
+        if booking.status != 'scheduled':
+            read_at = booking.updated_at
+            booking.status = 'scheduled'
+            # A booking changed meanwhile is checked again when the job is retried
+            self.booking_store.update_booking_if_unchanged(booking, read_at)
+        # Waiting for a slot is not a failed attempt
+        self.booking_store.retry_job(dict(job, attempts=job['attempts'] - 1), provision_at)
+        logger.info("Booking %s waits for a free code slot until %s", booking.id, provision_at,
+                    extra={'event': 'provisioning.deferred', 'booking_id': booking.id})
+        return 'deferred'
+
+    def _failed(self, job, booking, error):
+        """Retry a failed job later, or mark its booking failed for good"""
+        booking.provisioning_error = error
+        if job['attempts'] < PROVISION_MAX_ATTEMPTS:
+            booking.status = 'pending'
+            self.booking_store.update_booking(booking)
+            delay = timedelta(seconds=PROVISION_RETRY_SECONDS * job['attempts'])
+            self.booking_store.retry_job(job, get_current_utc_datetime() + delay)
+            return 'retry'
+
+        booking.status = 'failed'
+        self.booking_store.update_booking(booking)
+        self.booking_store.finish_jobs([job], status='failed')
+        logger.error("Provisioning booking %s failed after %d attempts: %s", booking.id, job['attempts'], error,
+                     extra={'event': 'provisioning.failed', 'booking_id': booking.id})
+        return 'failed'
+
+    def _revoke(self, booking):
+        """Delete the codes created for a booking that was cancelled meanwhile"""
+        access_code_ids = [booking.access_code_id] if booking.access_code_id else []
+        access_code_ids += [details['access_code_id'] for details in booking.occurrence_codes.values()]
+        for access_code_id in access_code_ids:
+            try:
+                self.scheduler_service.seam_service.delete_access_code(access_code_id)
+            except Exception as e:
+                logger.error("Error deleting access code %s: %s", access_code_id, e,
+                             extra={'booking_id': booking.id})
+
+    def dispatch_due(self, now=None, batch_size=PROVISION_BATCH_SIZE):
+        """
+        Provision every due booking, in batches
+
+        Each batch of claimed jobs is spread over the worker pool; the call
+        returns once no due job is left.
+
+        Args:
+            now (datetime, optional): Current time
+            batch_size (int, optional): Jobs claimed at once
+
+        Returns:
+            dict: Number of jobs per outcome
+        """
+        now = now or get_current_utc_datetime()
+        counts = {}
+        while True:
+            jobs = self.booking_store.claim_due_jobs(now, limit=batch_size, kinds=(PROVISION_JOB,))
+            if not jobs:
+                return counts
+
+            if len(jobs) > 1 and self.workers > 1:
+                with ThreadPoolExecutor(max_workers=min(len(jobs), self.workers)) as pool:
+                    outcomes = list(pool.map(self.provision, jobs))
+            else:
+                outcomes = [self.provision(job) for job in jobs]
+
+            for outcome in outcomes:
+                counts[outcome] = counts.get(outcome, 0) + 1
+
+    def start(self):
+        """Start this process's dispatcher thread and worker pool once"""
+        if self._executor is not None:
+            return
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='provisioner')
+            threading.Thread(target=self._run, name='provision-dispatcher', daemon=True).start()
+
+    def _run(self):
+        """Dispatcher loop: claim one job per free worker"""
+        while True:
+            # Cleared first so a booking submitted while claiming still wakes us
+            self._wakeup.clear()
+            self._slots.acquire()
+            try:
+                jobs = self.booking_store.claim_due_jobs(
+                    get_current_utc_datetime(), limit=1, kinds=(PROVISION_JOB,)
+                )
+                if not jobs:
+                    self.booking_store.requeue_stalled_jobs(
+                        get_current_utc_datetime() - timedelta(seconds=PROVISION_STALL_SECONDS),
+                        kinds=(PROVISION_JOB,)
+                    )
+            except Exception as e:
+                logger.exception("Error claiming provisioning jobs: %s", e)
+                jobs = []
+
+            if not jobs:
+                self._slots.release()
+                self._wakeup.wait(PROVISION_POLL_SECONDS)
+                continue
+            self._executor.submit(self._run_job, jobs[0])
+
+    def _run_job(self, job):
+        try:
+            self.provision(job)
+        except Exception as e:
+            logger.exception("Error provisioning booking %s: %s", job.get('booking_id'), e,
+                             extra={'booking_id': job.get('booking_id')})
+        finally:
+            self._slots.release()
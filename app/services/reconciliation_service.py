@@ -0,0 +1,308 @@
+import logging
+import hashlib
+import os
+from datetime import timedelta
+from app.services.scheduler_service import HELD_STATUSES
+from app.utils.time_utils import to_utc_datetime, datetime_to_iso, get_current_utc_datetime
+
+logger = logging.getLogger(__name__)
+
+# Codes created by this application are named with this prefix (see
+# SchedulerService.schedule_access); other codes on a lock are never deleted
+MANAGED_CODE_PREFIX = 'Scheduled access for '
+
+# List a device's codes at least this often even when nothing changed locally
+RECONCILE_MAX_AGE_HOURS = int(os.getenv('RECONCILE_MAX_AGE_HOURS', 24))
+
+class ReconciliationService:
+    def __init__(self, booking_store, seam_service):
+        """
+        Initialize the reconciliation service
+
+        Args:
+            booking_store (BookingStore): Store holding the bookings and device state
+            seam_service (SeamService): Service used to list and repair lock codes
+        """
+        self.booking_store = booking_store
+        self.seam_service = seam_service
+
+    def expected_codes(self, device_id, now=None):
+        """
+        Get the codes local bookings say should be on a lock right now
+
+        Codes recorded on any held booking count, including one still being
+        provisioned (e.g. occurrence codes kept for a retry).
+
+        Args:
+            device_id (str): The ID of the lock device
+            now (datetime, optional): Current time
+
+        Returns:
+            dict: Access code ID -> {booking_id, occurrence, code, starts_at, ends_at}
+        """
+        now = now or get_current_utc_datetime()
+        expected = {}
+
+        for booking in self.booking_store.iter_bookings(device_id=device_id, status=HELD_STATUSES):
+            if booking.access_code_id and to_utc_datetime(booking.ends_at) > now:
+                expected[booking.access_code_id] = {
+                    'booking_id': booking.id,
+                    'occurrence': None,
+                    'code': booking.code,
+                    'starts_at': _normalize(booking.starts_at),
+                    'ends_at': _normalize(booking.ends_at)
+                }
+
+            for key, details in booking.occurrence_codes.items():
+                if to_utc_datetime(details['ends_at']) > now:
+                    expected[details['access_code_id']] = {
+                        'booking_id': booking.id,
+                        'occurrence': key,
+                        'code': details['code'],
+                        'starts_at': _normalize(key),
+                        'ends_at': _normalize(details['ends_at'])
+                    }
+
+        return expected
+
+    def lock_codes(self, device_id, now=None):
+        """
+        Get the unexpired time-bound codes currently on a lock
+
+        Args:
+            device_id (str): The ID of the lock device
+            now (datetime, optional): Current time
+
+        Returns:
+            dict: Access code ID -> {code, name, starts_at, ends_at}
+        """
+        now = now or get_current_utc_datetime()
+        codes = {}
+
+        for code in self.seam_service.get_access_codes(device_id):
+            if not getattr(code, 'starts_at', None) or not getattr(code, 'ends_at', None):
+                continue
+            if to_utc_datetime(code.ends_at) <= now:
+                continue
+            codes[code.access_code_id] = {
+                'code': getattr(code, 'code', None),
+                'name': getattr(code, 'name', '') or '',
+                'starts_at': _normalize(code.starts_at),
+                'ends_at': _normalize(code.ends_at)
+            }
+
+        return codes
+
+    def mark_dirty(self, device_id, event=None):
+        """
+        Make the next reconciliation re-list a device
+
+        Registered as a webhook listener so lock-side activity is checked.
+
+        Args:
+            device_id (str): The ID of the lock device
+            event (dict, optional): The event that touched the device
+        """
+        if device_id:
+            self.booking_store.update_device_state(device_id, dirty=True)
+
+    def reconcile_device(self, device_id, apply=False, force=False):
+        """
+        Compare a device's expected and actual codes and plan repairs
+
+        The lock is only listed when the local digest changed, a webhook
+        reported activity, the last check found drift or is older than
+        RECONCILE_MAX_AGE_HOURS. The lock digest only covers codes named with
+        MANAGED_CODE_PREFIX, and the code-by-code diff only runs when the
+        two digests differ.
+
+        Args:
+            device_id (str): The ID of the lock device
+            apply (bool, optional): Carry out the repair plan instead of a dry run
+            force (bool, optional): List the lock even if nothing seems to have changed
+
+        Returns:
+            dict: Report with device_id, status (skipped, in_sync, drift) and actions
+        """
+        now = get_current_utc_datetime()
+        expected = self.expected_codes(device_id, now)
+        expected_digest = digest(expected)
+        state = self.booking_store.get_device_state(device_id) or {}
+
+        if not force and self._is_settled(state, expected_digest, now):
+            return {'device_id': device_id, 'status': 'skipped', 'actions': []}
+
+        actual = self.lock_codes(device_id, now)
+        # Codes this application did not create are never repaired, so they
+        # must not count as drift either
+        lock_digest = digest({
+            code_id: code for code_id, code in actual.items()
+            if code['name'].startswith(MANAGED_CODE_PREFIX)
+        })
+
+        if lock_digest == expected_digest:
+            self.booking_store.update_device_state(
+                device_id, expected_digest=expected_digest, lock_digest=lock_digest,
+                reconciled_at=datetime_to_iso(now), dirty=False
+            )
+            return {'device_id': device_id, 'status': 'in_sync', 'actions': []}
+
+        in_flight = list(self.booking_store.iter_bookings(device_id=device_id, status='provisioning'))
+        actions = self.plan_repairs(device_id, expected, actual, in_flight)
+        if apply:
+            for action in actions:
+                self._apply(action)
+
+        # Re-list next time: either repairs changed the lock or drift remains
+        self.booking_store.update_device_state(
+            device_id, expected_digest=expected_digest, lock_digest=lock_digest,
+            reconciled_at=datetime_to_iso(now), dirty=True
+        )
+        return {'device_id': device_id, 'status': 'drift', 'actions': actions}
+
+    def reconcile(self, device_ids=None, apply=False, force=False):
+        """
+        Reconcile several devices
+
+        Args:
+            device_ids (list, optional): Devices to check (default: every device with bookings)
+            apply (bool, optional): Carry out repair plans instead of a dry run
+            force (bool, optional): List every lock even if nothing seems to have changed
+
+        Returns:
+            list: One report per device
+        """
+        reports = []
+        for device_id in device_ids or self.booking_store.device_ids():
+            try:
+                reports.append(self.reconcile_device(device_id, apply=apply, force=force))
+            except Exception as e:
+                logger.error("Error reconciling device %s: %s", device_id, e, extra={'device_id': device_id})
+                reports.append({'device_id': device_id, 'status': 'error', 'error': str(e), 'actions': []})
+        return reports
+
+    def _is_settled(self, state, expected_digest, now):
+        """Whether the last check found the lock in sync and nothing has happened since"""
+        if state.get('dirty') or not state.get('reconciled_at'):
+            return False
+        if state.get('expected_digest') != expected_digest or state.get('lock_digest') != expected_digest:
+            return False
+        return now - to_utc_datetime(state['reconciled_at']) < timedelta(hours=RECONCILE_MAX_AGE_HOURS)
+
+    def plan_repairs(self, device_id, expected, actual, in_flight=()):
+        """
+        Build the list of repairs that would bring a lock in line with its bookings
+
+        A booked code missing from the lock is relinked to a lock code with the
+        same value and window if one exists, otherwise recreated. Remaining
+        codes created by this application that no booking expects are deleted,
+        except those matching an occurrence of a booking being provisioned:
+        its code may be on the lock before it is recorded on the booking.
+
+        Args:
+            device_id (str): The ID of the lock device
+            expected (dict): Result of expected_codes
+            actual (dict): Result of lock_codes
+            in_flight (list, optional): Bookings of the device being provisioned
+
+        Returns:
+            list: Repair actions (dicts with an "action" of create, delete or relink)
+        """
+        orphans = {
+            code_id: code for code_id, code in actual.items()
+            if code_id not in expected and code['name'].startswith(MANAGED_CODE_PREFIX)
+            and not any(_is_occurrence(booking, code) for booking in in_flight)
+        }
+        by_window = {
+            (code['code'], code['starts_at'], code['ends_at']): code_id
+            for code_id, code in orphans.items()
+        }
+        actions = []
+
+        for code_id, entry in expected.items():
+            if code_id in actual:
+                continue
+
+            match = by_window.pop((entry['code'], entry['starts_at'], entry['ends_at']), None)
+            if match:
+                orphans.pop(match)
+                actions.append({
+                    'action': 'relink', 'device_id': device_id, 'booking_id': entry['booking_id'],
+                    'occurrence': entry['occurrence'], 'access_code_id': code_id,
+                    'new_access_code_id': match
+                })
+            else:
+                actions.append({
+                    'action': 'create', 'device_id': device_id, 'booking_id': entry['booking_id'],
+                    'occurrence': entry['occurrence'], 'access_code_id': code_id,
+                    'code': entry['code'], 'starts_at': entry['starts_at'], 'ends_at': entry['ends_at']
+                })
+
+        for code_id, code in orphans.items():
+            actions.append({
+                'action': 'delete', 'device_id': device_id, 'access_code_id': code_id,
+                'starts_at': code['starts_at'], 'ends_at': code['ends_at']
+            })
+
+        return actions
+
+    def _apply(self, action):
+        """Carry out one repair action, recording the outcome on it"""
+        try:
+            if action['action'] == 'delete':
+                self.seam_service.delete_access_code(action['access_code_id'])
+            elif action['action'] == 'create':
+                booking = self.booking_store.get_booking(action['booking_id'])
+                user = self.booking_store.get_user(booking.user_id)
+                # Recreate with the same code value so the guest's code keeps working
+                created = self.seam_service.create_access_code(
+                    device_id=action['device_id'],
+                    code=action['code'],
+                    name=f"{MANAGED_CODE_PREFIX}{user.name if user else booking.user_id}",
+                    starts_at=action['starts_at'],
+                    ends_at=action['ends_at']
+                )
+                self._relink(booking, action, created['access_code_id'])
+            elif action['action'] == 'relink':
+                booking = self.booking_store.get_booking(action['booking_id'])
+                self._relink(booking, action, action['new_access_code_id'])
+            action['result'] = 'applied'
+        except Exception as e:
+            action['result'] = 'error'
+            action['error'] = str(e)
+
+    def _relink(self, booking, action, access_code_id):
+        """Point a booking (or one of its occurrences) at a different lock code"""
+        if action['occurrence']:
+            details = booking.occurrence_codes[action['occurrence']]
+            details['access_code_id'] = access_code_id
+            details.pop('status', None)
+        else:
+            booking.access_code_id = access_code_id
+            booking.access_code_status = None
+        self.booking_store.update_booking(booking)
+
+def digest(codes):
+    """
+    Compute an order-independent digest of code IDs and their windows
+
+    Args:
+        codes (dict): Access code ID -> dict with starts_at and ends_at
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    lines = sorted(f"{code_id}|{code['starts_at']}|{code['ends_at']}" for code_id, code in codes.items())
+    return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
+
+def _is_occurrence(booking, code):
+    """Whether a lock code's window is exactly one occurrence (or the window) of a booking"""
+    series = booking.get_recurrence()
+    if series is None:
+        return (code['starts_at'], code['ends_at']) == (_normalize(booking.starts_at), _normalize(booking.ends_at))
+    occurrence = series.occurrence_at(code['starts_at'])
+    return occurrence is not None and tuple(map(datetime_to_iso, occurrence)) == (code['starts_at'], code['ends_at'])
+
+def _normalize(iso_string):
+    """Normalize an ISO8601 time so equal instants compare equal as strings"""
+    return datetime_to_iso(to_utc_datetime(iso_string))
@@ -0,0 +1,199 @@
+import logging
+import os
+import threading
+from datetime import timedelta
+from app.utils.time_utils import datetime_to_iso, get_current_utc_datetime, to_utc_datetime
+
+logger = logging.getLogger(__name__)
+
+# Job kind of an expiration reminder in the booking store's job queue
+REMINDER_JOB = 'expiration_reminder'
+
+# How long before a booking ends its guest is reminded
+REMINDER_HOURS_BEFORE = int(os.getenv('REMINDER_HOURS_BEFORE', 24))
+
+# Most reminders sent over one SMTP connection
+REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 50))
+
+# Longest the dispatcher sleeps, so jobs enqueued by other processes are noticed
+REMINDER_MAX_SLEEP_SECONDS = int(os.getenv('REMINDER_MAX_SLEEP_SECONDS', 300))
+
+# Failed sends are retried this many times in total, this far apart
+REMINDER_MAX_ATTEMPTS = 3
+REMINDER_RETRY_MINUTES = 10
+
+# A reminder running this long belongs to a process that died; it is queued again
+REMINDER_STALL_SECONDS = 900
+
+class ReminderService:
+    def __init__(self, booking_store, notification_service, hours_before=REMINDER_HOURS_BEFORE):
+        """
+        Initialize the reminder service
+
+        Args:
+            booking_store (BookingStore): Store holding bookings, users and the job queue
+            notification_service (NotificationService): Service used to send the reminders
+            hours_before (int, optional): Hours before a booking ends to remind its guest
+        """
+        self.booking_store = booking_store
+        self.notification_service = notification_service
+        self.hours_before = hours_before
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def reminder_due_at(self, booking):
+        """
+        Get when a booking's expiration reminder should be sent
+
+        Recurring series get no reminder: each occurrence has its own code.
+
+        Args:
+            booking (Booking): The booking
+
+        Returns:
+            datetime: Due time (never before the booking starts), or None
+        """
+        if booking.recurrence or not booking.code:
+            return None
+
+        due_at = to_utc_datetime(booking.ends_at) - timedelta(hours=self.hours_before)
+        return max(due_at, to_utc_datetime(booking.starts_at))
+
+    def schedule_reminder(self, booking):
+        """
+        Enqueue the expiration reminder of a new booking
+
+        Args:
+            booking (Booking): The booking
+
+        Returns:
+            dict: The reminder job, or None if the booking gets no reminder
+        """
+        due_at = self.reminder_due_at(booking)
+        if due_at is None:
+            return None
+
+        job = self.booking_store.enqueue_job(
+            REMINDER_JOB, due_at, booking_id=booking.id, job_id=f"{REMINDER_JOB}:{booking.id}"
+        )
+        # A dispatcher in this process may be sleeping past the new due time
+        self._wakeup.set()
+        return job
+
+    def cancel_reminders(self, booking_id):
+        """
+        Cancel the pending reminders of a booking
+
+        Args:
+            booking_id (str): The booking ID
+
+        Returns:
+            int: Number of reminders cancelled
+        """
+        return self.booking_store.cancel_jobs(booking_id)
+
+    def dispatch_due(self, now=None, batch_size=REMINDER_BATCH_SIZE):
+        """
+        Send every reminder that is due, in batches
+
+        Reminders left running by a dispatcher that died are queued again
+        first, so they are sent (at least once) rather than lost.
+
+        Args:
+            now (datetime, optional): Current time
+            batch_size (int, optional): Most reminders per SMTP connection
+
+        Returns:
+            dict: Counts of sent, skipped and failed reminders
+        """
+        now = now or get_current_utc_datetime()
+        counts = {'sent': 0, 'skipped': 0, 'failed': 0}
+        self.booking_store.requeue_stalled_jobs(
+            get_current_utc_datetime() - timedelta(seconds=REMINDER_STALL_SECONDS),
+            kinds=(REMINDER_JOB,)
+        )
+
+        while True:
+            jobs = self.booking_store.claim_due_jobs(now, limit=batch_size, kinds=(REMINDER_JOB,))
+            if not jobs:
+                return counts
+
+            batch, skipped = [], []
+            for job in jobs:
+                reminder = self._reminder_for(job)
+                if reminder:
+                    batch.append((job, reminder))
+                else:
+                    skipped.append(job)
+
+            self.booking_store.finish_jobs(skipped)
+            counts['skipped'] += len(skipped)
+
+            results = self.notification_service.send_expiration_reminders(
+                [reminder for _, reminder in batch], self.hours_before
+            )
+            sent = [job for (job, _), ok in zip(batch, results) if ok]
+            self.booking_store.finish_jobs(sent)
+            counts['sent'] += len(sent)
+
+            for (job, _), ok in zip(batch, results):
+                if ok:
+                    continue
+                counts['failed'] += 1
+                if job['attempts'] < REMINDER_MAX_ATTEMPTS:
+                    self.booking_store.retry_job(job, now + timedelta(minutes=REMINDER_RETRY_MINUTES))
+                else:
+                    self.booking_store.finish_jobs([job], status='failed')
+
+    def _reminder_for(self, job):
+        """Get the (email, access_details) to send for a job, or None if moot"""
+        booking = self.booking_store.get_booking(job['booking_id'])
+        if not booking or booking.status != 'active':
+            return None
+
+        user = self.booking_store.get_user(booking.user_id)
+        if not user or not user.email:
+            return None
+
+        return (user.email, {
+            'code': booking.code,
+            'starts_at': booking.starts_at,
+            'ends_at': datetime_to_iso(to_utc_datetime(booking.ends_at))
+        })
+
+    def seconds_until_next(self, now=None):
+        """
+        Get how long the dispatcher can sleep before the next reminder is due
+
+        Args:
+            now (datetime, optional): Current time
+
+        Returns:
+            float: Seconds, at most REMINDER_MAX_SLEEP_SECONDS
+        """
+        now = now or get_current_utc_datetime()
+        due_at = self.booking_store.next_job_due()
+        if due_at is None:
+            return REMINDER_MAX_SLEEP_SECONDS
+        return min(max((due_at - now).total_seconds(), 0), REMINDER_MAX_SLEEP_SECONDS)
+
+    def run(self):
+        """Dispatch reminders until stopped, sleeping until the next one is due"""
+        while not self._stopped.is_set():
+            # Cleared first so a reminder scheduled while dispatching still wakes us
+            self._wakeup.clear()
+            try:
+                counts = self.dispatch_due()
+                if any(counts.values()):
+                    logger.info("Reminders: %d sent, %d skipped, %d failed",
+                                counts['sent'], counts['skipped'], counts['failed'],
+                                extra=dict(counts, event='reminders.dispatched'))
+            except Exception as e:
+                logger.exception("Error dispatching reminders: %s", e)
+
+            self._wakeup.wait(self.seconds_until_next())
+
+    def stop(self):
+        """Make run() return after the current batch"""
+        self._stopped.set()
+        self._wakeup.set()
@@ -1,18 +1,46 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from app.utils.code_generator import generate_random_code
 from app.services.seam_service import SeamService
-from app.utils.time_utils import iso_to_datetime
+from app.utils.time_utils import iso_to_datetime, datetime_to_iso, get_current_utc_datetime, to_utc_datetime
+from app.utils.recurrence import Recurrence, occurrence_key
+from app.utils.intervals import merge_intervals, free_gaps, is_free
+
+logger = logging.getLogger(__name__)
+
+# How far ahead recurring bookings get their next occurrence codes pushed to the lock
+OCCURRENCE_LOOKAHEAD_HOURS = int(os.getenv('OCCURRENCE_LOOKAHEAD_HOURS', 24))
+
+# How far ahead booked periods include unprovisioned recurring occurrences by default
+BOOKED_PERIODS_DEFAULT_DAYS = 30
+
+# Bookings holding their time slot; only active ones have their code on the lock
+HELD_STATUSES = ('active', 'scheduled', 'pending', 'provisioning')
+RESERVED_STATUSES = ('scheduled', 'pending', 'provisioning')
+
+# Most devices whose lock codes are fetched from Seam at once for one request
+DEVICE_FETCH_WORKERS = int(os.getenv('DEVICE_FETCH_WORKERS', 8))
 
 class SchedulerService:
-    def __init__(self, seam_service=None):
+    def __init__(self, seam_service=None, booking_store=None, cache=None):
         """
         Initialize the scheduler service
         
         Args:
             seam_service (SeamService, optional): An instance of SeamService.
                                                  If not provided, a new one will be created.
+            booking_store (BookingStore, optional): Local booking store, used for
+                                                    recurring series that are not
+                                                    yet provisioned on the lock
+            cache (SharedCache, optional): Cache for lock codes and booked periods,
+                                           shared by every worker on the host
         """
         self.seam_service = seam_service or SeamService()
+        self.booking_store = booking_store
+        self.cache = cache
     
     def schedule_access(self, device_id, start_time, end_time, user_name):
         """
@@ -47,54 +75,430 @@ class SchedulerService:
         
         return access_details
     
-    def check_availability(self, device_id, start_time, end_time):
+    def get_lock_codes(self, device_id):
+        """
+        Get the time-bound codes on a lock, from the shared cache when possible
+        
+        Args:
+            device_id (str): The ID of the Schlage lock
+            
+        Returns:
+            list: Codes with access_code_id, name, starts_at and ends_at attributes
+        """
+        def fetch():
+            return [
+                {
+                    "access_code_id": code.access_code_id,
+                    "name": getattr(code, 'name', None),
+                    "starts_at": code.starts_at,
+                    "ends_at": code.ends_at
+                }
+                for code in self.seam_service.get_access_codes(device_id)
+                if getattr(code, 'starts_at', None) and getattr(code, 'ends_at', None)
+            ]
+        
+        if self.cache is None:
+            codes = fetch()
+        else:
+            codes = self.cache.get_or_compute(device_id, 'lock_codes', fetch)
+        
+        return [SimpleNamespace(**code) for code in codes]
+    
+    def get_device_series(self, device_id):
+        """
+        Get the recurring series booked on a device (active or being provisioned)
+        
+        Args:
+            device_id (str): The ID of the Schlage lock
+            
+        Returns:
+            list: (Booking, Recurrence) tuples
+        """
+        if self.booking_store is None:
+            return []
+        
+        return [
+            (booking, booking.get_recurrence())
+            for booking in self.booking_store.iter_bookings(
+                device_id=device_id, status=HELD_STATUSES, recurring=True
+            )
+        ]
+    
+    def get_reservations(self, device_id):
+        """
+        Get the one-off bookings on a device whose code is not on the lock yet
+        
+        These are bookings beyond the provisioning horizon and bookings whose
+        code is being created; only the local index knows about them.
+        
+        Args:
+            device_id (str): The ID of the Schlage lock
+            
+        Returns:
+            list: Booking objects
+        """
+        if self.booking_store is None:
+            return []
+        
+        return list(self.booking_store.iter_bookings(
+            device_id=device_id, status=RESERVED_STATUSES, recurring=False
+        ))
+    
+    def check_availability(self, device_id, start_time, end_time, recurrence=None):
         """
         Check if the specified time slot is available
         
+        Recurring series are tested arithmetically: no occurrences are expanded.
+        
         Args:
             device_id (str): The ID of the Schlage lock
-            start_time (str): ISO8601 formatted string for when access would begin
-            end_time (str): ISO8601 formatted string for when access would end
+            start_time (str|datetime): When access would begin (ISO8601 string or datetime)
+            end_time (str|datetime): When access would end (ISO8601 string or datetime)
+            recurrence (str, optional): RRULE-style rule if the proposed slot repeats,
+                                        in which case start/end are its first occurrence
             
         Returns:
             bool: True if the time slot is available, False otherwise
         """
-        codes = self.seam_service.get_access_codes(device_id)
-        proposed_start = iso_to_datetime(start_time)
-        proposed_end = iso_to_datetime(end_time)
+        codes = self.get_lock_codes(device_id)
+        proposed_start = to_utc_datetime(start_time)
+        proposed_end = to_utc_datetime(end_time)
+        proposed_series = Recurrence(recurrence, start_time, end_time) if recurrence else None
         
         for code in codes:
             if hasattr(code, 'starts_at') and hasattr(code, 'ends_at'):
-                code_start = iso_to_datetime(code.starts_at)
-                code_end = iso_to_datetime(code.ends_at)
+                if proposed_series:
+                    if proposed_series.overlaps(code.starts_at, code.ends_at):
+                        return False
+                    continue
+                
+                code_start = to_utc_datetime(code.starts_at)
+                code_end = to_utc_datetime(code.ends_at)
                 
                 # Check for overlap
                 if (proposed_start < code_end and proposed_end > code_start):
                     return False
         
+        # Series occurrences and reservations that are not on the lock yet only exist locally
+        for _, series in self.get_device_series(device_id):
+            if proposed_series:
+                if proposed_series.overlaps_series(series):
+                    return False
+            elif series.overlaps(start_time, end_time):
+                return False
+        
+        for booking in self.get_reservations(device_id):
+            if proposed_series:
+                if proposed_series.overlaps(booking.starts_at, booking.ends_at):
+                    return False
+            elif proposed_start < to_utc_datetime(booking.ends_at) and proposed_end > to_utc_datetime(booking.starts_at):
+                return False
+        
         return True
     
-    def get_booked_periods(self, device_id):
+    def check_availability_batch(self, slots):
+        """
+        Check many candidate slots, fetching each device's bookings only once
+        
+        Each device's busy intervals are loaded for the span its candidates
+        cover, then every candidate is tested by bisecting them.
+        
+        Args:
+            slots (list): (device_id, start, end) tuples with datetime bounds
+            
+        Returns:
+            list: One bool per slot, in the same order
+        """
+        spans = {}
+        for device_id, start, end in slots:
+            span = spans.get(device_id)
+            spans[device_id] = (min(span[0], start), max(span[1], end)) if span else (start, end)
+        
+        busy_by_device = {}
+        for device_id, (span_start, span_end) in spans.items():
+            busy = self.get_busy_intervals(device_id, span_start, span_end)
+            busy_by_device[device_id] = (busy, [start for start, _ in busy])
+        
+        return [
+            is_free(*busy_by_device[device_id], start, end)
+            for device_id, start, end in slots
+        ]
+    
+    def get_booked_periods(self, device_id, window_start=None, window_end=None):
         """
         Get all booked time periods for a device
         
         Args:
             device_id (str): The ID of the Schlage lock
+            window_start (str|datetime, optional): Start of the window in which to
+                                                   expand recurring series (default: now)
+            window_end (str|datetime, optional): End of that window
+                                                 (default: 30 days after window_start)
             
         Returns:
             list: List of booked time periods
         """
-        codes = self.seam_service.get_access_codes(device_id)
+        # Only explicit windows are cached; the default one moves with the clock
+        if self.cache is not None and window_start and window_end:
+            return self.cache.get_or_compute(
+                device_id,
+                _booked_periods_key(window_start, window_end),
+                lambda: self._get_booked_periods(device_id, window_start, window_end)
+            )
+        
+        return self._get_booked_periods(device_id, window_start, window_end)
+    
+    def get_booked_periods_for_devices(self, device_ids, window_start, window_end,
+                                       max_workers=DEVICE_FETCH_WORKERS):
+        """
+        Get the booked periods of several devices within one window
+        
+        Devices whose periods are cached are answered straight away; the
+        rest are fetched from Seam concurrently. A device that cannot be
+        fetched is reported instead of failing the others.
+        
+        Args:
+            device_ids (list): IDs of the locks
+            window_start (datetime): Start of the window
+            window_end (datetime): End of the window
+            max_workers (int, optional): Most concurrent Seam listings
+            
+        Returns:
+            tuple: (dict of device ID -> booked periods in the window, dict of device ID -> error message)
+        """
+        periods, errors = {}, {}
+        misses = []
+        
+        for device_id in device_ids:
+            cached = None
+            if self.cache is not None:
+                cached = self.cache.get(device_id, _booked_periods_key(window_start, window_end))
+            if cached is not None:
+                periods[device_id] = cached
+            else:
+                misses.append(device_id)
+        
+        def fetch(device_id):
+            try:
+                return self.get_booked_periods(device_id, window_start, window_end), None
+            except Exception as e:
+                logger.error("Error getting booked periods for %s: %s", device_id, e, extra={'device_id': device_id})
+                return None, str(e)
+        
+        if len(misses) > 1 and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=min(len(misses), max_workers)) as pool:
+                fetched = list(pool.map(fetch, misses))
+        else:
+            fetched = [fetch(device_id) for device_id in misses]
+        
+        for device_id, (device_periods, error) in zip(misses, fetched):
+            if error is None:
+                periods[device_id] = device_periods
+            else:
+                errors[device_id] = error
+        
+        # Lock codes are listed whatever their dates; keep those in the window
+        window_start, window_end = to_utc_datetime(window_start), to_utc_datetime(window_end)
+        return {
+            device_id: [
+                period for period in periods[device_id]
+                if to_utc_datetime(period['starts_at']) < window_end
+                and to_utc_datetime(period['ends_at']) > window_start
+            ]
+            for device_id in device_ids if device_id in periods
+        }, errors
+    
+    def _get_booked_periods(self, device_id, window_start, window_end):
+        codes = self.get_lock_codes(device_id)
         
         # Extract the time periods that are already booked
         booked_periods = [
-            {"starts_at": code.starts_at, "ends_at": code.ends_at, "name": code.name}
+            {"access_code_id": code.access_code_id, "starts_at": code.starts_at,
+             "ends_at": code.ends_at, "name": code.name}
             for code in codes
             if hasattr(code, 'starts_at') and hasattr(code, 'ends_at')
         ]
         
+        # Add recurring occurrences whose codes have not been provisioned yet
+        start = to_utc_datetime(window_start) if window_start else get_current_utc_datetime()
+        end = to_utc_datetime(window_end) if window_end else start + timedelta(days=BOOKED_PERIODS_DEFAULT_DAYS)
+        
+        for booking, series in self.get_device_series(device_id):
+            for occurrence_start, occurrence_end in series.occurrences(start, end):
+                if occurrence_key(occurrence_start) in booking.occurrence_codes:
+                    continue
+                booked_periods.append({
+                    "starts_at": datetime_to_iso(occurrence_start),
+                    "ends_at": datetime_to_iso(occurrence_end),
+                    "name": "Recurring booking"
+                })
+        
+        # Reserved bookings whose code is not on the lock yet
+        for booking in self.get_reservations(device_id):
+            if to_utc_datetime(booking.starts_at) >= end or to_utc_datetime(booking.ends_at) <= start:
+                continue
+            booked_periods.append({
+                "booking_id": booking.id,
+                "starts_at": booking.starts_at,
+                "ends_at": booking.ends_at,
+                "name": "Scheduled booking" if booking.status == 'scheduled' else "Pending booking"
+            })
+        
         return booked_periods
     
+    def get_busy_intervals(self, device_id, window_start, window_end):
+        """
+        Get the merged busy intervals of a device that touch a window
+        
+        Combines the codes on the lock with recurring occurrences and
+        reservations that are only known locally, then merges them with one
+        sweep.
+        
+        Args:
+            device_id (str): The ID of the Schlage lock
+            window_start (datetime): Start of the window
+            window_end (datetime): End of the window
+            
+        Returns:
+            list: Disjoint (start, end) datetime tuples sorted by start
+        """
+        intervals = []
+        
+        for code in self.get_lock_codes(device_id):
+            code_start = to_utc_datetime(code.starts_at)
+            code_end = to_utc_datetime(code.ends_at)
+            if code_start < window_end and code_end > window_start:
+                intervals.append((code_start, code_end))
+        
+        for _, series in self.get_device_series(device_id):
+            intervals.extend(series.occurrences(window_start, window_end))
+        
+        for booking in self.get_reservations(device_id):
+            reserved_start = to_utc_datetime(booking.starts_at)
+            reserved_end = to_utc_datetime(booking.ends_at)
+            if reserved_start < window_end and reserved_end > window_start:
+                intervals.append((reserved_start, reserved_end))
+        
+        return merge_intervals(intervals)
+    
+    def find_free_slots(self, device_ids, window_start, window_end, min_duration,
+                        granularity=None, at=None):
+        """
+        Find the free gaps on each device within a window
+        
+        Each device's busy intervals are fetched once and serve both the gap
+        search and the optional "first device free at a time" query.
+        
+        Args:
+            device_ids (list): IDs of the locks to search, in preference order
+            window_start (datetime): Start of the search window
+            window_end (datetime): End of the search window
+            min_duration (timedelta): Shortest gap worth returning
+            granularity (timedelta, optional): Snap gaps to this grid
+            at (datetime, optional): Also find the first device free for
+                                     min_duration from this time
+            
+        Returns:
+            tuple: (dict of device ID -> free (start, end) datetime tuples,
+                    first free device ID or None)
+        """
+        fetch_start, fetch_end = window_start, window_end
+        if at is not None:
+            fetch_start = min(fetch_start, at)
+            fetch_end = max(fetch_end, at + min_duration)
+        
+        free_slots = {}
+        first_free_device = None
+        
+        for device_id in device_ids:
+            busy = self.get_busy_intervals(device_id, fetch_start, fetch_end)
+            free_slots[device_id] = free_gaps(busy, window_start, window_end, min_duration, granularity)
+            
+            if at is not None and first_free_device is None:
+                if is_free(busy, [start for start, _ in busy], at, at + min_duration):
+                    first_free_device = device_id
+        
+        return free_slots, first_free_device
+    
+    def provision_occurrences(self, booking, user_name, lookahead_hours=OCCURRENCE_LOOKAHEAD_HOURS):
+        """
+        Create access codes for the occurrences of a series that are about to start
+        
+        Occurrences that have started or start within the lookahead window get a
+        code unless they already have one. Codes of finished occurrences are
+        dropped from the booking. The caller is responsible for saving it.
+        
+        Args:
+            booking (Booking): A recurring booking
+            user_name (str): Name of the user for reference
+            lookahead_hours (int, optional): How far ahead to provision
+            
+        Returns:
+            list: Access code details for each newly provisioned occurrence
+        """
+        series = booking.get_recurrence()
+        now = get_current_utc_datetime()
+        provisioned = []
+        
+        # Forget codes of occurrences that are over; the lock deletes them itself
+        booking.occurrence_codes = {
+            key: details for key, details in booking.occurrence_codes.items()
+            if iso_to_datetime(details['ends_at']) > now
+        }
+        
+        for occurrence_start, occurrence_end in series.occurrences(now, now + timedelta(hours=lookahead_hours)):
+            key = occurrence_key(occurrence_start)
+            if key in booking.occurrence_codes:
+                continue
+            
+            access_details = self.schedule_access(
+                booking.device_id,
+                datetime_to_iso(occurrence_start),
+                datetime_to_iso(occurrence_end),
+                user_name
+            )
+            booking.occurrence_codes[key] = {
+                "access_code_id": access_details['access_code_id'],
+                "code": access_details['code'],
+                "ends_at": access_details['ends_at']
+            }
+            provisioned.append(access_details)
+        
+        return provisioned
+    
+    def provision_upcoming_occurrences(self, lookahead_hours=OCCURRENCE_LOOKAHEAD_HOURS):
+        """
+        Provision codes for every active series with occurrences coming up
+        
+        Args:
+            lookahead_hours (int, optional): How far ahead to provision
+            
+        Returns:
+            list: (Booking, access_details) tuples for each new code
+        """
+        results = []
+        changed = []
+        
+        for booking in self.booking_store.iter_bookings(status='active', recurring=True):
+            user = self.booking_store.get_user(booking.user_id)
+            before = dict(booking.occurrence_codes)
+            try:
+                provisioned = self.provision_occurrences(
+                    booking, user.name if user else booking.user_id, lookahead_hours
+                )
+            except Exception as e:
+                # Keep whatever was created before the failure; retry the rest next run
+                logger.error("Error provisioning occurrences for booking %s: %s", booking.id, e,
+                             extra={'booking_id': booking.id})
+                provisioned = []
+            
+            if booking.occurrence_codes != before:
+                changed.append(booking)
+            results.extend((booking, details) for details in provisioned)
+        
+        self.booking_store.update_bookings(changed)
+        return results
+    
     def handle_consecutive_bookings(self, device_id):
         """
         Identify and handle consecutive bookings
@@ -141,3 +545,8 @@ class SchedulerService:
             consecutive_groups.append(current_group)
         
         return consecutive_groups
+
+def _booked_periods_key(window_start, window_end):
+    """Shared cache key of a device's booked periods within an explicit window"""
+    return (f"booked_periods|{datetime_to_iso(to_utc_datetime(window_start))}"
+            f"|{datetime_to_iso(to_utc_datetime(window_end))}")
@@ -1,7 +1,10 @@
-from seam import Seam
+import logging
+import time
 from datetime import datetime
 from app.utils.time_utils import get_current_utc_iso, is_in_past
 
+logger = logging.getLogger(__name__)
+
 class SeamService:
     def __init__(self, api_key=None):
         """
@@ -11,7 +14,57 @@ class SeamService:
             api_key (str, optional): Seam API key. If not provided, 
                                      it will be loaded from environment variables.
         """
-        self.client = Seam(api_key=api_key)
+        self.api_key = api_key
+        self._client = None
+    
+    @property
+    def client(self):
+        """
+        The Seam API client, created on first use
+        
+        The Seam SDK is slow to import and needs credentials, so neither
+        happens until a Seam call is actually made.
+        
+        Returns:
+            Seam: The Seam client
+        """
+        if self._client is None:
+            from seam import Seam
+            self._client = Seam(api_key=self.api_key)
+        return self._client
+    
+    def _call(self, operation, method, **kwargs):
+        """
+        Make a Seam API call, logging its outcome and duration
+        
+        Records carry the correlation id of the request or job making the
+        call (event "seam.call"; successful calls can be sampled).
+        
+        Args:
+            operation (str): Name of the call for the log
+            method (callable): SDK method to call
+            **kwargs: Arguments of the call
+            
+        Returns:
+            The SDK method's result
+        """
+        details = {
+            'event': 'seam.call',
+            'operation': operation,
+            'device_id': kwargs.get('device_id'),
+            'access_code_id': kwargs.get('access_code_id')
+        }
+        started = time.perf_counter()
+        try:
+            result = method(**kwargs)
+        except Exception as e:
+            details['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            logger.warning("Seam %s failed: %s", operation, e, extra=details)
+            raise
+        
+        details['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("Seam %s", operation, extra=details)
+        return result
     
     def create_access_code(self, device_id, code, name, starts_at, ends_at):
         """
@@ -27,7 +80,8 @@ class SeamService:
         Returns:
             dict: The created access code details
         """
-        access_code = self.client.access_codes.create(
+        access_code = self._call(
+            'access_codes.create', self.client.access_codes.create,
             device_id=device_id,
             code=code,
             name=name,
@@ -53,7 +107,7 @@ class SeamService:
         Returns:
             list: List of access codes
         """
-        return self.client.access_codes.list(device_id=device_id)
+        return self._call('access_codes.list', self.client.access_codes.list, device_id=device_id)
     
     def delete_access_code(self, access_code_id):
         """
@@ -65,7 +119,7 @@ class SeamService:
         Returns:
             bool: True if deletion was successful
         """
-        self.client.access_codes.delete(access_code_id=access_code_id)
+        self._call('access_codes.delete', self.client.access_codes.delete, access_code_id=access_code_id)
         return True
     
     def delete_expired_codes(self, device_id):
@@ -78,13 +132,13 @@ class SeamService:
         Returns:
             list: List of deleted access code IDs
         """
-        codes = self.client.access_codes.list(device_id=device_id)
+        codes = self.get_access_codes(device_id)
         now = get_current_utc_iso()
         deleted_codes = []
         
         for code in codes:
             if hasattr(code, 'ends_at') and is_in_past(code.ends_at):
-                self.client.access_codes.delete(access_code_id=code.access_code_id)
+                self.delete_access_code(code.access_code_id)
                 deleted_codes.append(code.access_code_id)
         
         return deleted_codes
@@ -99,4 +153,4 @@ class SeamService:
         Returns:
             dict: Device information
         """
-        return self.client.devices.get(device_id=device_id)
+        return self._call('devices.get', self.client.devices.get, device_id=device_id)
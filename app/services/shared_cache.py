@@ -0,0 +1,292 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; writes are then only thread-locked
+    fcntl = None
+
+# Opt-in: every worker on a host maps the same file under DATA_DIR
+SHARED_CACHE_ENABLED = os.getenv('SHARED_CACHE_ENABLED', 'False').lower() == 'true'
+
+# Entries older than this are ignored even if their device was not invalidated,
+# so lock-side changes the app never hears about still show up
+SHARED_CACHE_TTL_SECONDS = int(os.getenv('SHARED_CACHE_TTL_SECONDS', 60))
+
+# Default geometry: 4096 entries of 4 KiB plus 1024 device counters (~16 MiB)
+DEFAULT_ENTRY_SLOTS = 4096
+DEFAULT_ENTRY_SIZE = 4096
+DEFAULT_DEVICE_SLOTS = 1024
+
+_MAGIC = b'SLSC'
+_FORMAT_VERSION = 1
+
+# magic, format version, device slots, entry slots, entry size
+_HEADER = struct.Struct('<4sHIII')
+_HEADER_SIZE = 64
+
+# Device version counter
+_COUNTER = struct.Struct('<Q')
+
+# sequence, key digest, device version, stored at, payload length
+_ENTRY = struct.Struct('<I16sQdI')
+
+class SharedCache:
+    def __init__(self, path, entry_slots=DEFAULT_ENTRY_SLOTS, entry_size=DEFAULT_ENTRY_SIZE,
+                 device_slots=DEFAULT_DEVICE_SLOTS, ttl_seconds=SHARED_CACHE_TTL_SECONDS):
+        """
+        Initialize the shared cache
+
+        Entries live in a memory-mapped file with a fixed layout: a header,
+        a table of per-device version counters, then fixed-size entry slots
+        addressed by key hash. Every process mapping the same file sees the
+        same entries. An entry records the version of its device when it was
+        filled, so bumping that device's counter invalidates all of its
+        entries at once in every process.
+
+        Args:
+            path (str): Path of the cache file (created if missing)
+            entry_slots (int, optional): Number of entry slots
+            entry_size (int, optional): Bytes per entry slot, header included
+            device_slots (int, optional): Number of device version counters
+            ttl_seconds (int, optional): Maximum age of an entry
+        """
+        self.path = path
+        self.entry_slots = entry_slots
+        self.entry_size = entry_size
+        self.device_slots = device_slots
+        self.ttl_seconds = ttl_seconds
+        self.max_payload = entry_size - _ENTRY.size
+        self._entries_offset = _HEADER_SIZE + device_slots * _COUNTER.size
+        self._size = self._entries_offset + entry_slots * entry_size
+        self._mutex = threading.Lock()
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        """Map the cache file, replacing it with an empty one if its layout differs"""
+        if self._map is not None:
+            return self._map
+
+        with self._mutex:
+            if self._map is not None:
+                return self._map
+
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+
+            header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, self.device_slots,
+                                  self.entry_slots, self.entry_size)
+            self._fd = self._open_file(header)
+            self._map = mmap.mmap(self._fd, self._size)
+            return self._map
+
+    def _open_file(self, header):
+        """Open the cache file, replacing it with an empty one if its layout differs"""
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            keep = False
+            self._lock_file(fd)
+            try:
+                st = os.fstat(fd)
+                if st.st_ino != _inode(self.path):
+                    # Replaced by another process while we waited for the lock
+                    continue
+                if st.st_size == 0:
+                    # Nobody can have an empty file mapped: size it in place
+                    os.ftruncate(fd, self._size)
+                    os.pwrite(fd, header, 0)
+                elif st.st_size != self._size or os.pread(fd, _HEADER.size, 0) != header:
+                    # Different geometry. Other processes may still map this file and
+                    # shrinking it under them would crash them, so swap in a new one
+                    self._replace_file(header)
+                    continue
+                keep = True
+                return fd
+            finally:
+                self._unlock_file(fd)
+                if not keep:
+                    os.close(fd)
+
+    def _replace_file(self, header):
+        """Atomically put an empty cache file with this geometry at the path"""
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, self._size)
+            os.pwrite(fd, header, 0)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        """Unmap the cache file"""
+        with self._mutex:
+            if self._map is not None:
+                self._map.close()
+                os.close(self._fd)
+                self._map = None
+                self._fd = None
+
+    def _lock_file(self, fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(self, fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _counter_offset(self, device_id):
+        slot = _hash(device_id) % self.device_slots
+        return _HEADER_SIZE + slot * _COUNTER.size
+
+    def version(self, device_id):
+        """
+        Get the current version of a device
+
+        Read it before computing a value and pass it to set(), so a value
+        computed while the device changed is never served.
+
+        Args:
+            device_id (str): The ID of the lock device
+
+        Returns:
+            int: The device's version counter
+        """
+        data = self._open()
+        return _COUNTER.unpack_from(data, self._counter_offset(device_id))[0]
+
+    def invalidate(self, device_id):
+        """
+        Drop every entry of a device, in every process
+
+        Args:
+            device_id (str): The ID of the lock device
+        """
+        data = self._open()
+        offset = self._counter_offset(device_id)
+        with self._mutex:
+            self._lock_file(self._fd)
+            try:
+                current = _COUNTER.unpack_from(data, offset)[0]
+                _COUNTER.pack_into(data, offset, current + 1)
+            finally:
+                self._unlock_file(self._fd)
+
+    def get(self, device_id, key):
+        """
+        Get a cached value
+
+        Reads take no lock: a slot's sequence number is odd while it is being
+        written and changes on every write, so a torn read is detected (the
+        entry header is read again after the payload) and treated as a miss.
+
+        Args:
+            device_id (str): The device the value belongs to
+            key (str): Cache key (unique across devices)
+
+        Returns:
+            object: The cached value, or None on a miss
+        """
+        data = self._open()
+        digest = _key_digest(device_id, key)
+        offset = self._entry_offset(digest)
+
+        entry = _ENTRY.unpack_from(data, offset)
+        sequence, stored_digest, version, stored_at, length = entry
+        if sequence % 2 or stored_digest != digest or length > self.max_payload:
+            return None
+        if time.time() - stored_at > self.ttl_seconds or version != self.version(device_id):
+            return None
+
+        start = offset + _ENTRY.size
+        payload = data[start:start + length]
+        # Check the whole entry header, not just the sequence: one read while
+        # a writer was mid-way may mix old and new fields
+        if _ENTRY.unpack_from(data, offset) != entry:
+            return None
+
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def set(self, device_id, key, value, version):
+        """
+        Store a value for a device
+
+        Args:
+            device_id (str): The device the value belongs to
+            key (str): Cache key (unique across devices)
+            value (object): JSON-serializable value
+            version (int): Result of version() taken before computing the value
+
+        Returns:
+            bool: False if the value is too large for a slot and was not stored
+        """
+        payload = json.dumps(value, separators=(',', ':')).encode()
+        if len(payload) > self.max_payload:
+            return False
+
+        data = self._open()
+        digest = _key_digest(device_id, key)
+        offset = self._entry_offset(digest)
+
+        with self._mutex:
+            self._lock_file(self._fd)
+            try:
+                sequence = _ENTRY.unpack_from(data, offset)[0]
+                # Make the sequence odd while writing, then even again
+                sequence = ((sequence + 1) | 1) & 0xFFFFFFFF
+                struct.pack_into('<I', data, offset, sequence)
+                data[offset + _ENTRY.size:offset + _ENTRY.size + len(payload)] = payload
+                _ENTRY.pack_into(data, offset, (sequence + 1) & 0xFFFFFFFF, digest,
+                                 version, time.time(), len(payload))
+            finally:
+                self._unlock_file(self._fd)
+        return True
+
+    def get_or_compute(self, device_id, key, compute):
+        """
+        Get a cached value, computing and storing it on a miss
+
+        Args:
+            device_id (str): The device the value belongs to
+            key (str): Cache key (unique across devices)
+            compute (callable): Builds the JSON-serializable value
+
+        Returns:
+            object: The cached or freshly computed value
+        """
+        value = self.get(device_id, key)
+        if value is not None:
+            return value
+
+        version = self.version(device_id)
+        value = compute()
+        self.set(device_id, key, value, version)
+        return value
+
+    def _entry_offset(self, digest):
+        slot = int.from_bytes(digest[:8], 'little') % self.entry_slots
+        return self._entries_offset + slot * self.entry_size
+
+def _hash(device_id):
+    """Stable hash of a device ID (the built-in hash differs between processes)"""
+    return int.from_bytes(hashlib.blake2b(str(device_id).encode(), digest_size=8).digest(), 'little')
+
+def _inode(path):
+    """Inode of the file at a path, or None if there is none"""
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+def _key_digest(device_id, key):
+    return hashlib.blake2b(f"{device_id}\0{key}".encode(), digest_size=16).digest()
@@ -0,0 +1,310 @@
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from app.utils.logging_config import REQUEST_ID_HEADER, get_correlation_id
+
+logger = logging.getLogger(__name__)
+
+# Background senders per process and most messages handed to a provider at once
+SMS_WORKERS = int(os.getenv('SMS_WORKERS', 2))
+SMS_BATCH_SIZE = int(os.getenv('SMS_BATCH_SIZE', 20))
+
+# Messages waiting beyond this are dropped rather than blocking the request
+SMS_QUEUE_SIZE = int(os.getenv('SMS_QUEUE_SIZE', 1000))
+
+# Delivery statuses kept for lookups (oldest are forgotten first)
+SMS_STATUS_HISTORY = 10000
+
+class RateLimiter:
+    """Token bucket shared by every thread sending through one provider"""
+
+    def __init__(self, rate_per_second, burst=None):
+        """
+        Args:
+            rate_per_second (float): Sustained rate; 0 or less means unlimited
+            burst (int, optional): Bucket size (default: one second of traffic)
+        """
+        self.rate = rate_per_second
+        self.capacity = burst or max(1, int(rate_per_second))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one send is allowed"""
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class SMSProvider(ABC):
+    """
+    Interface of an SMS provider
+
+    Subclasses implement send_batch(); the rate limiter is applied by
+    SMSService before each message is handed over.
+    """
+
+    name = 'base'
+
+    def __init__(self, rate_per_second=0):
+        self.rate_limiter = RateLimiter(rate_per_second)
+
+    @abstractmethod
+    def send_batch(self, messages):
+        """
+        Send several messages
+
+        Args:
+            messages (list): Dicts with id, to and body
+
+        Returns:
+            list: One dict per message with status (sent, failed) and
+                  optionally provider_id or error
+        """
+
+class LocalSMSProvider(SMSProvider):
+    """Stand-in provider that keeps messages in memory instead of sending them"""
+
+    name = 'local'
+
+    def __init__(self, rate_per_second=0):
+        super().__init__(rate_per_second)
+        self.outbox = []
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        with self._lock:
+            self.outbox.extend(messages)
+        for message in messages:
+            logger.info("SMS notification would be sent to %s: %s", message['to'], message['body'],
+                        extra={'event': 'sms.local', 'correlation_id': message.get('correlation_id')})
+        return [{'status': 'sent', 'provider_id': message['id']} for message in messages]
+
+class HTTPSMSProvider(SMSProvider):
+    """
+    Provider with a JSON HTTP API, reached over a pooled keep-alive session
+
+    The API takes one message per request, so a batch is sent as one POST
+    per message over the same connection; batching only bounds how many
+    messages a sender thread takes from the queue at a time.
+    """
+
+    name = 'http'
+
+    def __init__(self, api_url, api_key, from_number, rate_per_second=10, pool_size=SMS_WORKERS, timeout=10):
+        """
+        Args:
+            api_url (str): Endpoint accepting POSTed {"from", "to", "body"} messages
+            api_key (str): Bearer token for the API
+            from_number (str): Sender number
+            rate_per_second (float, optional): Most messages per second
+            pool_size (int, optional): Connections kept open to the API
+            timeout (int, optional): Request timeout in seconds
+        """
+        super().__init__(rate_per_second)
+        self.api_url = api_url
+        self.from_number = from_number
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {api_key}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def send_batch(self, messages):
+        results = []
+        for message in messages:
+            try:
+                response = self.session.post(self.api_url, json={
+                    'from': self.from_number,
+                    'to': message['to'],
+                    'body': message['body']
+                }, headers=_correlation_headers(message), timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json() if response.content else {}
+                results.append({'status': 'sent', 'provider_id': data.get('id')})
+            except Exception as e:
+                results.append({'status': 'failed', 'error': str(e)})
+        return results
+
+def _correlation_headers(message):
+    """Request headers carrying the correlation id a message was queued under"""
+    if message.get('correlation_id'):
+        return {REQUEST_ID_HEADER: message['correlation_id']}
+    return {}
+
+def build_sms_provider(sms_config=None):
+    """
+    Create the SMS provider named in the configuration
+
+    Args:
+        sms_config (dict, optional): provider ("local" or "http"), api_url,
+                                     api_key, from_number, rate_per_second.
+                                     Defaults come from the SMS_* environment
+                                     variables.
+
+    Returns:
+        SMSProvider: The provider
+    """
+    config = {
+        'provider': os.getenv('SMS_PROVIDER', 'local'),
+        'api_url': os.getenv('SMS_API_URL', ''),
+        'api_key': os.getenv('SMS_API_KEY', ''),
+        'from_number': os.getenv('SMS_FROM_NUMBER', ''),
+        'rate_per_second': float(os.getenv('SMS_RATE_PER_SECOND', 10)),
+    }
+    config.update(sms_config or {})
+
+    if config['provider'] == 'http':
+        return HTTPSMSProvider(
+            config['api_url'], config['api_key'], config['from_number'],
+            rate_per_second=config['rate_per_second']
+        )
+    if config['provider'] == 'local':
+        return LocalSMSProvider(rate_per_second=config['rate_per_second'])
+    raise ValueError(f"Unknown SMS provider: {config['provider']}")
+
+class SMSService:
+    def __init__(self, provider, workers=SMS_WORKERS, batch_size=SMS_BATCH_SIZE, queue_size=SMS_QUEUE_SIZE):
+        """
+        Initialize the SMS service
+
+        Messages are queued and sent in the background by a fixed pool of
+        threads, each taking up to batch_size queued messages at a time, so
+        a request never waits on the provider. The pool starts on the first
+        message.
+
+        Args:
+            provider (SMSProvider): Provider used to send the messages
+            workers (int, optional): Sender threads
+            batch_size (int, optional): Most messages per provider call
+            queue_size (int, optional): Most messages waiting to be sent
+        """
+        self.provider = provider
+        self.workers = workers
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def send(self, to, body):
+        """
+        Queue a message for sending
+
+        Args:
+            to (str): Recipient phone number
+            body (str): Message text
+
+        Returns:
+            str: Message ID for status lookups
+        """
+        # The correlation id travels with the message to the sender thread
+        message = {'id': f"sms_{uuid.uuid4().hex}", 'to': to, 'body': body,
+                   'correlation_id': get_correlation_id()}
+        self._start()
+
+        # Recorded first: a sender thread may finish the message before put returns
+        self._set_status(message['id'], {'status': 'queued', 'to': to})
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            logger.warning("SMS queue full. Message to %s dropped.", to, extra={'event': 'sms.dropped'})
+            self._set_status(message['id'], {'status': 'dropped', 'to': to})
+
+        return message['id']
+
+    def get_status(self, message_id):
+        """
+        Get the delivery status of a message
+
+        Args:
+            message_id (str): ID returned by send()
+
+        Returns:
+            dict: Status (queued, sent, failed, dropped) and details, or None if unknown
+        """
+        with self._lock:
+            status = self._statuses.get(message_id)
+            return dict(status) if status else None
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message has been handed to the provider
+
+        Args:
+            timeout (float, optional): Seconds to wait at most
+
+        Returns:
+            bool: True if the queue drained in time
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _set_status(self, message_id, status):
+        with self._lock:
+            self._statuses[message_id] = status
+            self._statuses.move_to_end(message_id)
+            while len(self._statuses) > SMS_STATUS_HISTORY:
+                self._statuses.popitem(last=False)
+
+    def _start(self):
+        """Start the sender threads once"""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"sms-sender-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        """Sender loop: take a batch, rate-limit it, send it, record the outcome"""
+        while True:
+            batch = [self._queue.get()]
+            for _ in range(self.batch_size - 1):
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                for _ in batch:
+                    self.provider.rate_limiter.acquire()
+                results = self.provider.send_batch(batch)
+            except Exception as e:
+                results = [{'status': 'failed', 'error': str(e)}] * len(batch)
+
+            for message, result in zip(batch, results):
+                if result.get('status') == 'failed':
+                    logger.error("Failed to send SMS to %s: %s", message['to'], result.get('error'),
+                                 extra={'event': 'sms.failed', 'correlation_id': message.get('correlation_id')})
+                self._set_status(message['id'], dict(result, to=message['to'], provider=self.provider.name))
+
+            for _ in batch:
+                self._queue.task_done()
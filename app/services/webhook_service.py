@@ -0,0 +1,184 @@
+import base64
+import hashlib
+import hmac
+import os
+from app.utils.time_utils import get_current_utc_datetime
+
+# Seam delivers webhooks through Svix; reject signatures older than this
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+# Lock-side access code state for each access code event type
+ACCESS_CODE_STATUSES = {
+    'access_code.set_on_device': 'set',
+    'access_code.removed_from_device': 'removed',
+    'access_code.deleted': 'removed',
+    'access_code.failed_to_set_on_device': 'failed',
+}
+
+# Device state for each device event type
+DEVICE_STATUSES = {
+    'device.connected': 'online',
+    'device.disconnected': 'offline',
+}
+
+class WebhookSignatureError(Exception):
+    """Raised when a webhook request is not signed with the configured secret"""
+
+class WebhookService:
+    def __init__(self, booking_store, secret=None):
+        """
+        Initialize the webhook service
+
+        Args:
+            booking_store (BookingStore): Store holding bookings, events and device state
+            secret (str, optional): Seam webhook signing secret ("whsec_..."). If not
+                                    provided, it will be loaded from SEAM_WEBHOOK_SECRET.
+        """
+        self.booking_store = booking_store
+        self.secret = secret if secret is not None else os.getenv('SEAM_WEBHOOK_SECRET', '')
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """
+        Register a callback run after an event changes local state
+
+        Callbacks receive (device_id, event) and are where caches for the
+        device should be invalidated.
+
+        Args:
+            callback (callable): The callback
+        """
+        self.listeners.append(callback)
+
+    def _key(self):
+        """Decode the signing key from the secret"""
+        if self.secret.startswith('whsec_'):
+            return base64.b64decode(self.secret[len('whsec_'):])
+        return self.secret.encode()
+
+    def sign(self, message_id, timestamp, body):
+        """
+        Compute the signature header value for a payload
+
+        Args:
+            message_id (str): Webhook message ID (svix-id header)
+            timestamp (int): Unix timestamp (svix-timestamp header)
+            body (bytes): Raw request body
+
+        Returns:
+            str: Value for the svix-signature header
+        """
+        signed = f"{message_id}.{timestamp}.".encode() + body
+        digest = hmac.new(self._key(), signed, hashlib.sha256).digest()
+        return 'v1,' + base64.b64encode(digest).decode()
+
+    def verify_signature(self, headers, body):
+        """
+        Verify a webhook request signature
+
+        Args:
+            headers (Mapping): Request headers
+            body (bytes): Raw request body
+
+        Raises:
+            WebhookSignatureError: If the signature is missing, stale or wrong
+        """
+        message_id = headers.get('svix-id')
+        timestamp = headers.get('svix-timestamp')
+        signatures = headers.get('svix-signature')
+
+        if not message_id or not timestamp or not signatures:
+            raise WebhookSignatureError("Missing signature headers")
+
+        try:
+            timestamp = int(timestamp)
+        except ValueError:
+            raise WebhookSignatureError("Invalid signature timestamp")
+
+        if abs(get_current_utc_datetime().timestamp() - timestamp) > SIGNATURE_TOLERANCE_SECONDS:
+            raise WebhookSignatureError("Signature timestamp outside tolerance")
+
+        expected = self.sign(message_id, timestamp, body)
+        for signature in signatures.split():
+            if hmac.compare_digest(signature, expected):
+                return
+
+        raise WebhookSignatureError("Invalid signature")
+
+    def ingest(self, event_id, event):
+        """
+        Apply an event and log it, unless it was already received
+
+        The event is only logged once it has been applied, so an event
+        whose application fails is applied again when Seam retries it.
+        Two deliveries racing each other may both apply it, which is
+        harmless since applying is idempotent.
+
+        Args:
+            event_id (str): Seam's event ID
+            event (dict): The event payload
+
+        Returns:
+            str: "processed", "duplicate" or "ignored" (unhandled event type)
+        """
+        if self.booking_store.has_event(event_id):
+            return 'duplicate'
+
+        handled = self.apply_event(event)
+        self.booking_store.record_event(event_id, event)
+        return 'processed' if handled else 'ignored'
+
+    def apply_event(self, event):
+        """
+        Update local booking, code and device state from one event
+
+        Applying an event twice leaves the same state, so the event log can
+        be replayed.
+
+        Args:
+            event (dict): The event payload
+
+        Returns:
+            bool: True if the event type is handled
+        """
+        event_type = event.get('event_type')
+        device_id = event.get('device_id')
+
+        if event_type in ACCESS_CODE_STATUSES:
+            booking = self.booking_store.find_booking_by_access_code(event.get('access_code_id'))
+            if booking:
+                self._set_code_status(booking, event['access_code_id'], ACCESS_CODE_STATUSES[event_type])
+                device_id = device_id or booking.device_id
+        elif event_type in DEVICE_STATUSES and device_id:
+            self.booking_store.set_device_state(device_id, DEVICE_STATUSES[event_type])
+        else:
+            return False
+
+        for listener in self.listeners:
+            listener(device_id, event)
+
+        return True
+
+    def _set_code_status(self, booking, access_code_id, status):
+        """Record the lock-side status of one of a booking's codes"""
+        if booking.access_code_id == access_code_id:
+            booking.access_code_status = status
+        else:
+            for details in booking.occurrence_codes.values():
+                if details['access_code_id'] == access_code_id:
+                    details['status'] = status
+
+        self.booking_store.update_booking(booking)
+
+    def replay(self):
+        """
+        Re-apply every logged event in the order received
+
+        Returns:
+            int: Number of events replayed
+        """
+        count = 0
+        for row in self.booking_store.iter_events():
+            self.apply_event(row['event'])
+            count += 1
+        return count
@@ -0,0 +1,212 @@
+import bisect
+import hashlib
+import json
+import os
+import socket
+import threading
+from app.utils.time_utils import get_current_utc_datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; the lease file is then only thread-locked
+    fcntl = None
+
+# How long a member stays in the group without renewing its lease
+WORKER_LEASE_SECONDS = float(os.getenv('WORKER_LEASE_SECONDS', 90))
+
+# Points per member on the hash ring; more spread devices more evenly
+HASH_RING_REPLICAS = 64
+
+MEMBERS_FILE = 'members.json'
+
+def default_member_id():
+    """
+    Get an ID for this process that no other live worker uses
+
+    Returns:
+        str: WORKER_ID if set, otherwise "<host>-<pid>"
+    """
+    return os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+class HashRing:
+    def __init__(self, members, replicas=HASH_RING_REPLICAS):
+        """
+        Initialize a consistent hash ring
+
+        Each member is placed at `replicas` points on the ring and a key
+        belongs to the member at the first point after the key's hash. When
+        a member joins or leaves, only the keys next to its points move.
+
+        Args:
+            members (iterable): Member IDs
+            replicas (int, optional): Points per member
+        """
+        self.members = sorted(set(members))
+        self._points = []
+        self._owners = {}
+        for member in self.members:
+            for replica in range(replicas):
+                point = _hash(f"{member}#{replica}")
+                self._points.append(point)
+                self._owners[point] = member
+        self._points.sort()
+
+    def owner(self, key):
+        """
+        Get the member a key belongs to
+
+        Args:
+            key (str): The key (e.g. a device ID)
+
+        Returns:
+            str: The member ID, or None if the ring is empty
+        """
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+class WorkerMembership:
+    def __init__(self, directory, member_id=None, lease_seconds=WORKER_LEASE_SECONDS):
+        """
+        Initialize this worker's membership in a group of workers
+
+        Members hold leases in a JSON file guarded by an exclusive file lock,
+        so every worker sharing the directory sees the same group. A member
+        that stops renewing its lease (it died or hung) drops out once the
+        lease expires, and the others take over its share at their next
+        renewal. The member that joined first is the leader.
+
+        Args:
+            directory (str): Directory of the lease file, shared by the group
+            member_id (str, optional): This worker's ID (default: default_member_id())
+            lease_seconds (float, optional): Lease length; renew well within it
+        """
+        self.directory = directory
+        self.member_id = member_id or default_member_id()
+        self.lease_seconds = lease_seconds
+        self.path = os.path.join(directory, MEMBERS_FILE)
+        self.members = []
+        self.leader = None
+        self._ring = HashRing([])
+        self._joined_at = None
+        self._mutex = threading.Lock()
+
+    def renew(self):
+        """
+        Renew this worker's lease and refresh the view of the group
+
+        Returns:
+            list: IDs of the live members, this one included
+        """
+        now = get_current_utc_datetime().timestamp()
+        with self._locked():
+            leases = {
+                member_id: lease for member_id, lease in self._read().items()
+                if lease['expires_at'] > now
+            }
+            if self.member_id in leases:
+                self._joined_at = leases[self.member_id]['joined_at']
+            elif self._joined_at is None:
+                self._joined_at = now
+            leases[self.member_id] = {'joined_at': self._joined_at, 'expires_at': now + self.lease_seconds}
+            self._write(leases)
+
+        self._update(leases)
+        return self.members
+
+    def leave(self):
+        """Give up this worker's lease so the others take over at once"""
+        with self._locked():
+            leases = self._read()
+            leases.pop(self.member_id, None)
+            self._write(leases)
+        self._joined_at = None
+        self._update({})
+
+    def owns(self, key):
+        """
+        Check whether a key (e.g. a device ID) belongs to this worker
+
+        Args:
+            key (str): The key
+
+        Returns:
+            bool: True if this worker's share includes the key, as of the last renewal
+        """
+        return self._ring.owner(key) == self.member_id
+
+    def share(self, keys):
+        """
+        Get the keys that belong to this worker
+
+        Args:
+            keys (iterable): Keys to split across the group
+
+        Returns:
+            list: This worker's keys, in their original order
+        """
+        return [key for key in keys if self.owns(key)]
+
+    def is_leader(self):
+        """
+        Check whether this worker leads the group (runs the group-wide tasks)
+
+        Returns:
+            bool: True if this worker joined first among the live members
+        """
+        return self.leader == self.member_id
+
+    def _update(self, leases):
+        self.members = sorted(leases)
+        self.leader = min(leases, key=lambda member_id: (leases[member_id]['joined_at'], member_id)) if leases else None
+        self._ring = HashRing(self.members)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self, leases):
+        # Written aside and renamed, so a crash never leaves a torn file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(leases, f)
+        os.replace(tmp_path, self.path)
+
+    def _locked(self):
+        return _LeaseLock(os.path.join(self.directory, MEMBERS_FILE + '.lock'), self._mutex)
+
+class _LeaseLock:
+    """Exclusive lock on the lease file, across threads and processes"""
+
+    def __init__(self, path, mutex):
+        self.path = path
+        self._mutex = mutex
+        self._fd = None
+
+    def __enter__(self):
+        self._mutex.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = open(self.path, 'a')
+            if fcntl is not None:
+                fcntl.flock(self._fd.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            self._mutex.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd.fileno(), fcntl.LOCK_UN)
+            self._fd.close()
+            self._fd = None
+        finally:
+            self._mutex.release()
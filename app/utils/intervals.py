@@ -0,0 +1,91 @@
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def merge_intervals(intervals):
+    """
+    Merge overlapping or touching intervals with a single sweep
+
+    Args:
+        intervals (iterable): (start, end) tuples in any order
+
+    Returns:
+        list: Disjoint (start, end) tuples sorted by start
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def free_gaps(busy, window_start, window_end, min_duration=timedelta(0), granularity=None):
+    """
+    Get the complement of merged busy intervals within a window
+
+    Args:
+        busy (list): Disjoint, sorted (start, end) tuples from merge_intervals
+        window_start (datetime): Start of the search window
+        window_end (datetime): End of the search window
+        min_duration (timedelta, optional): Drop gaps shorter than this
+        granularity (timedelta, optional): Snap gap starts up and ends down
+                                           to multiples of this (from the epoch)
+
+    Returns:
+        list: (start, end) tuples of free time, sorted by start
+    """
+    gaps = []
+    cursor = window_start
+
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= window_end:
+            break
+        if start > cursor:
+            gaps.append((cursor, start))
+        cursor = max(cursor, end)
+
+    if cursor < window_end:
+        gaps.append((cursor, window_end))
+
+    result = []
+    for start, end in gaps:
+        if granularity:
+            start = snap_up(start, granularity)
+            end = snap_down(end, granularity)
+        if end - start >= max(min_duration, timedelta.resolution):
+            result.append((start, end))
+    return result
+
+def is_free(busy, starts, start, end):
+    """
+    Check that [start, end) does not overlap any merged busy interval
+
+    Args:
+        busy (list): Disjoint, sorted (start, end) tuples from merge_intervals
+        starts (list): The start of each busy interval, for bisection
+        start (datetime): Start of the candidate interval
+        end (datetime): End of the candidate interval
+
+    Returns:
+        bool: True if the candidate interval is entirely free
+    """
+    # Only the last busy interval starting before `end` can overlap, since
+    # merged intervals are disjoint and sorted
+    index = bisect_right(starts, end) - 1
+    while index >= 0 and busy[index][0] >= end:
+        index -= 1
+    return index < 0 or busy[index][1] <= start
+
+def snap_up(moment, granularity):
+    """Round a datetime up to the next multiple of granularity since the epoch"""
+    remainder = (moment - _EPOCH) % granularity
+    return moment if not remainder else moment + (granularity - remainder)
+
+def snap_down(moment, granularity):
+    """Round a datetime down to the previous multiple of granularity since the epoch"""
+    return moment - (moment - _EPOCH) % granularity
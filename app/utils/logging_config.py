@@ -0,0 +1,269 @@
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+
+# Share of records kept per high-volume event, e.g. "seam.call=0.1,http.request=0.5".
+# Warnings and errors are always kept.
+LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+
+# Records waiting for the writer thread; beyond this new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+# Header carrying the correlation id between the worker, the API and its callers
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Incoming ids are only trusted if they look like an id (they end up in logs)
+_REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._:-]{1,128}')
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_correlation_id = contextvars.ContextVar('correlation_id', default=None)
+
+_listener = None
+_queue_handler = None
+_configure_lock = threading.Lock()
+
+def new_correlation_id():
+    """
+    Create a correlation id
+
+    Returns:
+        str: A random 32-character hex id
+    """
+    return uuid.uuid4().hex
+
+def get_correlation_id():
+    """
+    Get the correlation id of the current request or job
+
+    Returns:
+        str: The id, or None outside of a request or job
+    """
+    return _correlation_id.get()
+
+def set_correlation_id(correlation_id):
+    """
+    Make an id the current correlation id
+
+    Args:
+        correlation_id (str): The id
+
+    Returns:
+        Token: Token for reset_correlation_id
+    """
+    return _correlation_id.set(correlation_id)
+
+def reset_correlation_id(token):
+    """
+    Restore the correlation id in effect before set_correlation_id
+
+    Args:
+        token (Token): Token returned by set_correlation_id
+    """
+    try:
+        _correlation_id.reset(token)
+    except ValueError:
+        # Set in another context (e.g. a streamed response); nothing to restore here
+        pass
+
+@contextlib.contextmanager
+def correlation_context(correlation_id=None):
+    """
+    Run a block under a correlation id
+
+    Args:
+        correlation_id (str, optional): The id (default: a new one)
+
+    Yields:
+        str: The id in effect
+    """
+    correlation_id = correlation_id or new_correlation_id()
+    token = set_correlation_id(correlation_id)
+    try:
+        yield correlation_id
+    finally:
+        reset_correlation_id(token)
+
+def request_correlation_id(header_value):
+    """
+    Get the correlation id to use for an incoming request
+
+    Args:
+        header_value (str): The request's X-Request-ID header, if any
+
+    Returns:
+        str: The caller's id if it is well-formed, otherwise a new one
+    """
+    if header_value and _REQUEST_ID_PATTERN.fullmatch(header_value):
+        return header_value
+    return new_correlation_id()
+
+def parse_sample_rates(spec):
+    """
+    Parse "event=rate,..." into a dict
+
+    Args:
+        spec (str): Comma-separated event=rate pairs, rates between 0 and 1
+
+    Returns:
+        dict: Rate per event name
+    """
+    rates = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        event, rate = item.split('=', 1)
+        rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the correlation id of the thread that logged them"""
+
+    def filter(self, record):
+        if getattr(record, 'correlation_id', None) is None:
+            record.correlation_id = get_correlation_id()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records of high-volume events (below WARNING)"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'event', None))
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and value is not None:
+                entry[key] = value
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that drops records when the queue is full
+
+    Messages and tracebacks are rendered on the logging thread (the writer
+    thread cannot see the arguments' later state), but JSON encoding and
+    the write itself happen on the writer thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _StdoutHandler(logging.StreamHandler):
+    """Stream handler writing to whatever sys.stdout is at the time"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+def configure_logging(level=LOG_LEVEL, sample_rates=None, handler=None):
+    """
+    Send this process's logs through a queue to a JSON writer thread
+
+    Logging calls only stamp the correlation id, apply sampling and
+    enqueue the record, so request threads never block on output. Safe to
+    call more than once; only the first call has an effect.
+
+    Args:
+        level (str, optional): Root log level
+        sample_rates (dict, optional): Share of records kept per event
+                                       (default: LOG_SAMPLE_RATES)
+        handler (logging.Handler, optional): Where records are written
+                                             (default: JSON lines on stdout)
+
+    Returns:
+        QueueListener: The writer
+    """
+    global _listener, _queue_handler
+
+    with _configure_lock:
+        if _listener is not None:
+            return _listener
+
+        if handler is None:
+            handler = _StdoutHandler()
+            handler.setFormatter(JsonFormatter())
+
+        _queue_handler = _QueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        _queue_handler.addFilter(ContextFilter())
+        _queue_handler.addFilter(SamplingFilter(
+            parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates
+        ))
+
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, handler)
+        _listener.start()
+
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        atexit.register(shutdown_logging)
+        return _listener
+
+def shutdown_logging():
+    """Write out the queued records and detach the queue handler"""
+    global _listener, _queue_handler
+
+    with _configure_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        _listener = None
+        _queue_handler = None
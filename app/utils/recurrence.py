@@ -0,0 +1,258 @@
+from datetime import timedelta
+from math import gcd
+from app.utils.time_utils import LATEST_DATETIME, datetime_to_iso, to_utc_datetime
+
+# Supported RRULE frequencies. Only fixed-length periods are allowed so that
+# occurrence tests stay pure arithmetic on UTC timestamps.
+FREQUENCIES = {
+    'DAILY': timedelta(days=1),
+    'WEEKLY': timedelta(weeks=1),
+}
+
+# Largest INTERVAL and COUNT accepted, so occurrence arithmetic stays in datetime's range
+MAX_INTERVAL = 366
+MAX_COUNT = 10000
+
+def parse_rrule(rule):
+    """
+    Parse an RRULE-style string such as "FREQ=WEEKLY;INTERVAL=2;COUNT=10"
+
+    Supported parts are FREQ (DAILY or WEEKLY), INTERVAL, COUNT and UNTIL.
+    A leading "RRULE:" is ignored.
+
+    Args:
+        rule (str): The recurrence rule
+
+    Returns:
+        dict: Parsed rule with keys freq, interval, count and until
+
+    Raises:
+        ValueError: If the rule is malformed or uses unsupported parts
+    """
+    if not isinstance(rule, str) or not rule.strip():
+        raise ValueError("Recurrence rule must be a non-empty string")
+
+    rule = rule.strip()
+    if rule.upper().startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+
+    parts = {}
+    for part in rule.split(';'):
+        if not part:
+            continue
+        key, sep, value = part.partition('=')
+        if not sep or not value:
+            raise ValueError(f"Invalid recurrence rule part: {part}")
+        parts[key.strip().upper()] = value.strip()
+
+    unknown = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL'}
+    if unknown:
+        raise ValueError(f"Unsupported recurrence rule parts: {', '.join(sorted(unknown))}")
+
+    freq = parts.get('FREQ', '').upper()
+    if freq not in FREQUENCIES:
+        raise ValueError("Recurrence FREQ must be DAILY or WEEKLY")
+
+    try:
+        interval = int(parts.get('INTERVAL', 1))
+        count = int(parts['COUNT']) if 'COUNT' in parts else None
+    except ValueError:
+        raise ValueError("Recurrence INTERVAL and COUNT must be integers")
+
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError("Recurrence INTERVAL and COUNT must be positive")
+    if interval > MAX_INTERVAL or (count is not None and count > MAX_COUNT):
+        raise ValueError(f"Recurrence INTERVAL cannot exceed {MAX_INTERVAL} and COUNT {MAX_COUNT}")
+    if count is not None and 'UNTIL' in parts:
+        raise ValueError("Recurrence rule cannot have both COUNT and UNTIL")
+
+    until = None
+    if 'UNTIL' in parts:
+        until = to_utc_datetime(parts['UNTIL'])
+
+    return {'freq': freq, 'interval': interval, 'count': count, 'until': until}
+
+class Recurrence:
+    def __init__(self, rule, first_start, first_end):
+        """
+        Initialize a recurring series
+
+        Occurrence i spans [first_start + i * period, first_end + i * period).
+        Nothing is materialized; every query is answered arithmetically.
+
+        Args:
+            rule (str): RRULE-style string, see parse_rrule
+            first_start (str|datetime): Start of the first occurrence
+            first_end (str|datetime): End of the first occurrence
+
+        Raises:
+            ValueError: If the rule is invalid or the series ends after LATEST_DATETIME
+        """
+        parsed = parse_rrule(rule)
+        self.rule = rule
+        self.period = FREQUENCIES[parsed['freq']] * parsed['interval']
+        self.first_start = to_utc_datetime(first_start)
+        self.duration = to_utc_datetime(first_end) - self.first_start
+
+        if self.duration <= timedelta(0):
+            raise ValueError("End time must be after start time.")
+
+        # Index of the last occurrence, or None for an unbounded series
+        if parsed['count'] is not None:
+            self.last_index = parsed['count'] - 1
+        elif parsed['until'] is not None:
+            self.last_index = (parsed['until'] - self.first_start) // self.period
+        else:
+            self.last_index = None
+
+        try:
+            last_end = self.last_end()
+        except OverflowError:
+            last_end = LATEST_DATETIME
+        if last_end is not None and last_end >= LATEST_DATETIME:
+            raise ValueError("Recurring series must end before the year 9000")
+
+    def occurrence(self, index):
+        """
+        Get one occurrence by index
+
+        Args:
+            index (int): Zero-based occurrence index
+
+        Returns:
+            tuple: (start, end) datetimes, or None if the series has no such occurrence
+        """
+        if index < 0 or (self.last_index is not None and index > self.last_index):
+            return None
+        start = self.first_start + self.period * index
+        return start, start + self.duration
+
+    def last_end(self):
+        """
+        Get the end of the final occurrence
+
+        Returns:
+            datetime: End of the last occurrence, or None if the series is unbounded
+        """
+        if self.last_index is None:
+            return None
+        if self.last_index < 0:
+            return self.first_start
+        return self.occurrence(self.last_index)[1]
+
+    def _first_index_ending_after(self, moment):
+        """Smallest index whose occurrence ends after the given moment"""
+        return max(0, (moment - self.first_start - self.duration) // self.period + 1)
+
+    def occurrence_at(self, moment):
+        """
+        Find the occurrence in progress at a moment in constant time
+
+        Args:
+            moment (str|datetime): The moment to check
+
+        Returns:
+            tuple: (start, end) of the occurrence, or None if none is in progress
+        """
+        moment = to_utc_datetime(moment)
+        occurrence = self.occurrence(self._first_index_ending_after(moment))
+        if occurrence and occurrence[0] <= moment:
+            return occurrence
+        return None
+
+    def first_overlapping(self, start, end):
+        """
+        Find the first occurrence overlapping [start, end) in constant time
+
+        Args:
+            start (str|datetime): Start of the interval
+            end (str|datetime): End of the interval
+
+        Returns:
+            tuple: (start, end) of the occurrence, or None if nothing overlaps
+        """
+        start = to_utc_datetime(start)
+        end = to_utc_datetime(end)
+
+        occurrence = self.occurrence(self._first_index_ending_after(start))
+        if occurrence and occurrence[0] < end:
+            return occurrence
+        return None
+
+    def overlaps(self, start, end):
+        """
+        Check whether any occurrence overlaps [start, end)
+
+        Args:
+            start (str|datetime): Start of the interval
+            end (str|datetime): End of the interval
+
+        Returns:
+            bool: True if an occurrence overlaps the interval
+        """
+        return self.first_overlapping(start, end) is not None
+
+    def occurrences(self, start=None, end=None):
+        """
+        Lazily yield the occurrences overlapping [start, end)
+
+        Args:
+            start (str|datetime, optional): Start of the window (default: first occurrence)
+            end (str|datetime, optional): End of the window (default: unbounded)
+
+        Returns:
+            generator: (start, end) datetime tuples in chronological order
+        """
+        index = self._first_index_ending_after(to_utc_datetime(start)) if start is not None else 0
+        end = to_utc_datetime(end) if end is not None else None
+
+        while True:
+            occurrence = self.occurrence(index)
+            if occurrence is None or (end is not None and occurrence[0] >= end):
+                return
+            yield occurrence
+            index += 1
+
+    def overlaps_series(self, other):
+        """
+        Check whether any occurrence of this series overlaps one of another series
+
+        Both series repeat their relative alignment every lcm(period, other.period),
+        so any overlap can be shifted back to one involving an occurrence in the
+        first cycle of either series. Only those occurrences are tested, and
+        none starting after LATEST_DATETIME, where the cycle may outrun datetime.
+
+        Args:
+            other (Recurrence): The other series
+
+        Returns:
+            bool: True if the two series ever overlap
+        """
+        cycle_seconds = _lcm(int(self.period.total_seconds()), int(other.period.total_seconds()))
+
+        for series, against in ((self, other), (other, self)):
+            period_seconds = int(series.period.total_seconds())
+            in_range = max(0, (LATEST_DATETIME - series.first_start) // series.period + 1)
+            for index in range(min(cycle_seconds // period_seconds, in_range)):
+                occurrence = series.occurrence(index)
+                if occurrence is None:
+                    break
+                if against.overlaps(*occurrence):
+                    return True
+
+        return False
+
+def occurrence_key(start):
+    """
+    Get the key identifying an occurrence within its series
+
+    Args:
+        start (datetime): Start of the occurrence
+
+    Returns:
+        str: ISO8601 string of the occurrence start
+    """
+    return datetime_to_iso(start)
+
+def _lcm(a, b):
+    return a * b // gcd(a, b)
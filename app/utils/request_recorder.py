@@ -0,0 +1,186 @@
+import hashlib
+import hmac
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from flask import g, request
+
+# Record anonymized traces of API requests for load-test replays
+REQUEST_RECORDING = os.getenv('REQUEST_RECORDING', 'False').lower() == 'true'
+
+# Trace files (default: DATA_DIR/traces), rotated at this size, keeping this many old ones
+REQUEST_RECORDING_DIR = os.getenv('REQUEST_RECORDING_DIR', '')
+REQUEST_RECORDING_MAX_BYTES = int(os.getenv('REQUEST_RECORDING_MAX_BYTES', 10 * 1024 * 1024))
+REQUEST_RECORDING_BACKUPS = int(os.getenv('REQUEST_RECORDING_BACKUPS', 5))
+
+TRACE_FILE = 'requests.ndjson'
+
+# Long-lived streams cannot be replayed request by request
+UNRECORDED_ENDPOINTS = ('api.stream',)
+
+# Fields that identify a person; replaced by fakes of the same shape
+PERSONAL_FIELDS = ('user_name', 'user_email', 'user_phone', 'name', 'email', 'phone', 'code')
+
+# Fields naming records of ours; replaced by stable pseudonyms so a replay can relate them
+ID_FIELDS = ('booking_id', 'booking_ids', 'user_id', 'access_code_id', 'id')
+
+# Fields that only make sense against the recorded instance
+DROPPED_FIELDS = ('cursor',)
+
+class RequestRecorder:
+    def __init__(self, trace_dir, secret, max_bytes=REQUEST_RECORDING_MAX_BYTES,
+                 backups=REQUEST_RECORDING_BACKUPS):
+        """
+        Initialize the request recorder
+
+        Writes one JSON line per API request: time, method, route, the
+        anonymized path, query and JSON body, response status and duration.
+        Names, emails, phone numbers and codes are replaced by fakes of the
+        same shape and record IDs by keyed hashes, so the same booking keeps
+        the same pseudonym across requests (and workers sharing the secret)
+        while the real values cannot be recovered from the traces. Lines are
+        queued and written by a background thread to size-rotated files.
+
+        Args:
+            trace_dir (str): Directory of the trace files
+            secret (str): Key of the pseudonyms (e.g. the app's SECRET_KEY)
+            max_bytes (int, optional): Size at which the trace file is rotated
+            backups (int, optional): Rotated files kept
+        """
+        self.trace_dir = trace_dir
+        self._secret = secret.encode()
+        if not os.path.exists(trace_dir):
+            os.makedirs(trace_dir)
+
+        handler = logging.handlers.RotatingFileHandler(
+            os.path.join(trace_dir, TRACE_FILE), maxBytes=max_bytes, backupCount=backups
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        trace_queue = queue.Queue()
+        self._listener = logging.handlers.QueueListener(trace_queue, handler)
+        self._listener.start()
+
+        # A private logger: traces never reach the application log
+        self._logger = logging.getLogger(f"request_trace.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._queue_handler = logging.handlers.QueueHandler(trace_queue)
+        self._logger.addHandler(self._queue_handler)
+
+    def init_app(self, app):
+        """
+        Record the requests of a Flask app
+
+        Args:
+            app (Flask): The application
+        """
+        app.before_request(self._start)
+        app.after_request(self._record)
+        app.extensions['request_recorder'] = self
+
+    def close(self):
+        """Write out the queued traces and stop the writer thread"""
+        self._logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+
+    def _start(self):
+        g.trace_started = time.perf_counter()
+        g.trace_time = time.time()
+
+    def _record(self, response):
+        if request.blueprint != 'api' or request.endpoint in UNRECORDED_ENDPOINTS or 'trace_started' not in g:
+            return response
+
+        try:
+            trace = self.build_trace(response)
+        except Exception:
+            # Recording must never break the request
+            return response
+        self._logger.info(json.dumps(trace))
+        return response
+
+    def build_trace(self, response):
+        """
+        Describe the current request and its response
+
+        Args:
+            response (Response): The response about to be sent
+
+        Returns:
+            dict: The anonymized trace
+        """
+        path = request.path
+        view_args = {}
+        for name, value in (request.view_args or {}).items():
+            view_args[name] = self.anonymize(name, value)
+            path = path.replace(f"/{value}", f"/{view_args[name]}")
+
+        trace = {
+            'ts': round(g.trace_time, 3),
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': path,
+            'query': self.anonymize(None, request.args.to_dict(flat=False)),
+            'body': self.anonymize(None, request.get_json(silent=True)) if request.is_json else None,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - g.trace_started) * 1000, 2)
+        }
+
+        # Lets a replay map later references to the booking to the one it creates
+        if response.is_json and not response.is_streamed:
+            booking = (response.get_json(silent=True) or {}).get('booking')
+            if isinstance(booking, dict) and booking.get('id'):
+                trace['created'] = self.pseudonym(booking['id'])
+        return trace
+
+    def anonymize(self, field, value):
+        """
+        Anonymize a value according to the field holding it
+
+        Args:
+            field (str): Name of the field (None for a whole document)
+            value: The value (dicts and lists are walked)
+
+        Returns:
+            The anonymized value
+        """
+        if isinstance(value, dict):
+            return {
+                key: self.anonymize(key, item)
+                for key, item in value.items() if key not in DROPPED_FIELDS
+            }
+        if isinstance(value, list):
+            return [self.anonymize(field, item) for item in value]
+        if value is None or not isinstance(value, str):
+            return value
+
+        if field in ID_FIELDS:
+            return self.pseudonym(value)
+        if field in PERSONAL_FIELDS:
+            digest = self._digest(value)
+            if 'email' in field:
+                return f"user-{digest[:10]}@example.com"
+            if 'phone' in field:
+                return '+1555' + str(int(digest[:12], 16))[-7:].rjust(7, '0')
+            if field == 'code':
+                return str(int(digest[:12], 16))[-len(value):].rjust(len(value), '0')
+            return f"Guest {digest[:8]}"
+        return value
+
+    def pseudonym(self, value):
+        """
+        Get the stable pseudonym of a record ID
+
+        Args:
+            value (str): The real ID
+
+        Returns:
+            str: "anon-" followed by a keyed hash of the ID
+        """
+        return f"anon-{self._digest(value)[:16]}"
+
+    def _digest(self, value):
+        return hmac.new(self._secret, str(value).encode(), hashlib.sha256).hexdigest()
@@ -1,18 +1,127 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+import contextlib
+import threading
+import time
 import pytz
 import os
 
 # Try to get the timezone from environment variables, or default to UTC
 DEFAULT_TIMEZONE = os.getenv('TIMEZONE', 'UTC')
 
+# Times the application accepts; the margin keeps window and horizon arithmetic
+# (e.g. start + 7 days) clear of datetime's limits
+EARLIEST_DATETIME = datetime(1970, 1, 1, tzinfo=timezone.utc)
+LATEST_DATETIME = datetime(9000, 1, 1, tzinfo=timezone.utc)
+
+class SystemClock:
+    """The real clock"""
+    
+    def now(self):
+        return datetime.now(timezone.utc)
+    
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class VirtualClock:
+    """A clock that only moves when told to; sleeping advances it instantly"""
+    
+    def __init__(self, start):
+        """
+        Args:
+            start (str|datetime): Initial time (naive values are assumed UTC)
+        """
+        self._now = to_utc_datetime(start)
+        self._lock = threading.Lock()
+    
+    def now(self):
+        with self._lock:
+            return self._now
+    
+    def sleep(self, seconds):
+        self.advance(seconds)
+    
+    def advance(self, seconds):
+        """
+        Move the clock forward
+        
+        Args:
+            seconds (float|timedelta): How far
+        """
+        if not isinstance(seconds, timedelta):
+            seconds = timedelta(seconds=seconds)
+        with self._lock:
+            self._now += seconds
+    
+    def set(self, value):
+        """
+        Move the clock to a time (never backwards)
+        
+        Args:
+            value (str|datetime): The new time
+        """
+        value = to_utc_datetime(value)
+        with self._lock:
+            self._now = max(self._now, value)
+
+_clock = SystemClock()
+
+def get_clock():
+    """
+    Get the clock every time helper reads
+    
+    Returns:
+        SystemClock|VirtualClock: The process-wide clock
+    """
+    return _clock
+
+def set_clock(clock):
+    """
+    Replace the process-wide clock (e.g. with a VirtualClock in simulations)
+    
+    Args:
+        clock: Object with now() (aware UTC datetime) and sleep(seconds)
+        
+    Returns:
+        The previous clock
+    """
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+@contextlib.contextmanager
+def use_clock(clock):
+    """
+    Use a clock within a block, restoring the previous one afterwards
+    
+    Args:
+        clock: The clock to use
+        
+    Yields:
+        The clock
+    """
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
+
+def sleep(seconds):
+    """
+    Wait on the process-wide clock (instant on a virtual clock)
+    
+    Args:
+        seconds (float): How long
+    """
+    _clock.sleep(seconds)
+
 def get_current_utc_datetime():
     """
-    Get the current UTC datetime
+    Get the current UTC datetime from the process-wide clock
     
     Returns:
         datetime: Current time in UTC
     """
-    return datetime.now(timezone.utc)
+    return _clock.now()
 
 def get_current_utc_iso():
     """
@@ -33,10 +142,10 @@ def get_current_local_datetime():
     try:
         # Try to use the configured timezone
         local_tz = pytz.timezone(DEFAULT_TIMEZONE)
-        return datetime.now(local_tz)
+        return get_current_utc_datetime().astimezone(local_tz)
     except Exception:
         # Fall back to the system's local time if there's an issue
-        return datetime.now()
+        return get_current_utc_datetime().astimezone().replace(tzinfo=None)
 
 def iso_to_datetime(iso_string):
     """
@@ -68,6 +177,22 @@ def datetime_to_iso(dt):
         dt = dt.replace(tzinfo=timezone.utc)
     return dt.isoformat().replace('+00:00', 'Z')
 
+def to_utc_datetime(value):
+    """
+    Convert an ISO 8601 string or datetime to a timezone-aware UTC datetime
+    
+    Args:
+        value (str/datetime): ISO 8601 string or datetime (naive values are assumed UTC)
+        
+    Returns:
+        datetime: Datetime object in UTC
+    """
+    if isinstance(value, str):
+        value = iso_to_datetime(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
 def format_datetime_for_display(iso_string, format_str=None):
     """
     Format an ISO datetime string for human-readable display
@@ -117,7 +242,7 @@ def add_hours_to_time(iso_string, hours):
         str: New ISO 8601 formatted string
     """
     dt = iso_to_datetime(iso_string)
-    new_dt = dt + timezone.timedelta(hours=hours)
+    new_dt = dt + timedelta(hours=hours)
     return datetime_to_iso(new_dt)
 
 def is_in_past(iso_string):
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start time of the web app and the cleanup worker
+
+Each measurement runs in a fresh interpreter so module caches don't hide
+import costs. Reports the median of several runs and whether the Seam SDK
+was imported during startup.
+
+Examples:
+    python scripts/benchmark_startup.py
+    python scripts/benchmark_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Snippets to time; each ends with the work a process does before serving
+SCENARIOS = {
+    'import routes': "import app.api.routes",
+    'create_app()': "from app import create_app; create_app()",
+    'first request': (
+        "import tempfile\n"
+        "from app import create_app\n"
+        "app = create_app({'DATA_DIR': tempfile.mkdtemp()})\n"
+        "app.test_client().get('/api/bookings')"
+    ),
+    'cleanup worker': (
+        "sys.path.insert(0, 'workers')\n"
+        "from cleanup_worker import CleanupWorker\n"
+        "CleanupWorker()"
+    ),
+}
+
+TIMER = """
+import sys, time, json
+started = time.perf_counter()
+{snippet}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'seam_imported': 'seam' in sys.modules}}))
+"""
+
+def run_once(snippet):
+    """Time one snippet in a fresh interpreter"""
+    env = dict(os.environ)
+    # Startup must not depend on credentials; a dummy key keeps older trees runnable
+    env.setdefault('SEAM_API_KEY', 'seam_benchmark_key')
+    output = subprocess.run(
+        [sys.executable, '-c', TIMER.format(snippet=snippet)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Runs per scenario')
+    args = parser.parse_args()
+
+    for name, snippet in SCENARIOS.items():
+        results = [run_once(snippet) for _ in range(args.runs)]
+        median = statistics.median(r['seconds'] for r in results)
+        seam = 'yes' if any(r['seam_imported'] for r in results) else 'no'
+        print(f"{name:<16} median {median * 1000:8.1f} ms   seam imported: {seam}")
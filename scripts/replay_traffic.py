@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Replay recorded API traffic and report throughput, latency and errors
+
+Reads the trace files written by the request recorder (REQUEST_RECORDING=True)
+and sends the requests with their recorded spacing, divided by --speed
+(0 sends them as fast as --concurrency allows). Times in the requests are
+shifted by how long ago they were recorded, and bookings created during
+the replay stand in for the recorded ones in later requests (cancellations,
+lookups).
+
+Without --url a private instance is started in this process, on a
+temporary data directory and a fake Seam, so no lock is touched.
+
+Examples:
+    python scripts/replay_traffic.py data/traces/requests.ndjson*
+    python scripts/replay_traffic.py --speed 10 --concurrency 16 data/traces/*
+    python scripts/replay_traffic.py --speed 0 --url http://localhost:5000 traces.ndjson
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+# Add the parent directory to the Python path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from app.utils.time_utils import datetime_to_iso, iso_to_datetime
+
+_ISO_DATETIME = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}')
+
+PERCENTILES = (50, 90, 99)
+
+def load_traces(paths):
+    """Load the traces of several (possibly rotated) files, oldest first"""
+    traces = []
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    traces.append(json.loads(line))
+    return sorted(traces, key=lambda trace: trace['ts'])
+
+def rewrite(value, delta, ids):
+    """Shift ISO datetimes by delta and swap recorded booking pseudonyms for replayed IDs"""
+    if isinstance(value, dict):
+        return {key: rewrite(item, delta, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rewrite(item, delta, ids) for item in value]
+    if not isinstance(value, str):
+        return value
+    if value in ids:
+        return ids[value]
+    if _ISO_DATETIME.match(value):
+        try:
+            return datetime_to_iso(iso_to_datetime(value) + delta)
+        except ValueError:
+            return value
+    return value
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+class TrafficReplayer:
+    def __init__(self, base_url, speed=1.0, concurrency=8, timeout=30):
+        """
+        Initialize the replayer
+
+        Args:
+            base_url (str): Root URL of the instance (without /api)
+            speed (float, optional): Replay speed; 1 keeps the recorded
+                                     pacing, 0 sends without pauses
+            concurrency (int, optional): Requests in flight at most
+            timeout (float, optional): Per-request timeout in seconds
+        """
+        self.base_url = base_url.rstrip('/')
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.results = []
+        self._ids = {}
+        self._lock = threading.Lock()
+        self._sessions = threading.local()
+
+    def replay(self, traces):
+        """
+        Send the traces and wait for every response
+
+        Args:
+            traces (list): Traces, oldest first
+
+        Returns:
+            dict: Summary (see summarize)
+        """
+        if not traces:
+            return summarize([], 0)
+
+        first_ts = traces[0]['ts']
+        delta = timedelta(seconds=time.time() - first_ts)
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for trace in traces:
+                if self.speed:
+                    wait = started + (trace['ts'] - first_ts) / self.speed - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                pool.submit(self._send, trace, delta)
+
+        return summarize(self.results, time.monotonic() - started)
+
+    def _session(self):
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+        return session
+
+    def _send(self, trace, delta):
+        with self._lock:
+            ids = dict(self._ids)
+
+        path = '/'.join(ids.get(part, part) for part in trace['path'].split('/'))
+        kwargs = {'params': rewrite(trace.get('query') or {}, delta, ids), 'timeout': self.timeout}
+        if trace.get('body') is not None:
+            kwargs['json'] = rewrite(trace['body'], delta, ids)
+
+        sent = time.perf_counter()
+        try:
+            response = self._session().request(trace['method'], self.base_url + path, **kwargs)
+            status, error = response.status_code, None
+        except Exception as e:
+            response, status, error = None, None, str(e)
+        latency_ms = (time.perf_counter() - sent) * 1000
+
+        if trace.get('created') and response is not None and response.ok:
+            booking = (response.json() or {}).get('booking') or {}
+            if booking.get('id'):
+                with self._lock:
+                    self._ids[trace['created']] = booking['id']
+
+        with self._lock:
+            self.results.append({
+                'route': f"{trace['method']} {trace.get('route') or trace['path']}",
+                'status': status,
+                'recorded_status': trace.get('status'),
+                'latency_ms': latency_ms,
+                'error': error
+            })
+
+def summarize(results, wall_seconds):
+    """
+    Aggregate replay results overall and per route
+
+    Errors are failed requests and 5xx responses; 4xx responses are
+    counted separately, as are responses whose status differs from the
+    recorded one.
+
+    Returns:
+        dict: requests, seconds, throughput (requests/s), and per group
+              count, errors, error_rate, client_errors, status_mismatches
+              and latency percentiles in milliseconds
+    """
+    def group(rows):
+        latencies = sorted(row['latency_ms'] for row in rows)
+        errors = sum(1 for row in rows if row['status'] is None or row['status'] >= 500)
+        stats = {
+            'count': len(rows),
+            'errors': errors,
+            'error_rate': round(errors / len(rows), 4) if rows else 0,
+            'client_errors': sum(1 for row in rows if row['status'] and 400 <= row['status'] < 500),
+            'status_mismatches': sum(1 for row in rows if row['status'] != row['recorded_status']),
+        }
+        for pct in PERCENTILES:
+            value = percentile(latencies, pct)
+            stats[f"p{pct}_ms"] = round(value, 2) if value is not None else None
+        stats['max_ms'] = round(latencies[-1], 2) if latencies else None
+        return stats
+
+    by_route = {}
+    for row in results:
+        by_route.setdefault(row['route'], []).append(row)
+
+    return {
+        'requests': len(results),
+        'seconds': round(wall_seconds, 3),
+        'throughput': round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        'overall': group(results),
+        'routes': {route: group(rows) for route, rows in sorted(by_route.items())}
+    }
+
+def start_local_instance(seam_latency_ms=0):
+    """
+    Serve a private app instance with a fake Seam on a free local port
+
+    Returns:
+        str: Base URL of the instance
+    """
+    from werkzeug.serving import make_server
+    from app import create_app
+    from app.services.container import ServiceContainer
+    from app.services.fake_seam_service import FakeSeamService
+    from app.services.notification_service import NotificationService
+
+    data_dir = tempfile.mkdtemp(prefix='replay-')
+    services = ServiceContainer(
+        data_dir=data_dir,
+        seam_service=FakeSeamService(latency_ms=seam_latency_ms),
+        # No SMTP credentials and an in-memory SMS outbox: nobody is messaged
+        notification_service=NotificationService(email_config={
+            'smtp_server': '', 'smtp_port': 0, 'smtp_username': '',
+            'smtp_password': '', 'from_email': ''
+        }, sms_config={'provider': 'local'})
+    )
+    app = create_app({'DATA_DIR': data_dir, 'REQUEST_RECORDING': False}, services=services)
+
+    # The replay reports latencies itself; skip the per-request access log
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def print_report(summary):
+    """Print a summary as a table"""
+    print(f"{summary['requests']} requests in {summary['seconds']} s "
+          f"({summary['throughput']} req/s)")
+    header = f"{'route':<48} {'count':>6} {'err%':>6} {'4xx':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print('-' * len(header))
+    rows = list(summary['routes'].items()) + [('overall', summary['overall'])]
+    for route, stats in rows:
+        print(f"{route[:48]:<48} {stats['count']:>6} {stats['error_rate'] * 100:>5.1f}% "
+              f"{stats['client_errors']:>5} {stats['p50_ms'] or 0:>8.1f} {stats['p90_ms'] or 0:>8.1f} "
+              f"{stats['p99_ms'] or 0:>8.1f} {stats['max_ms'] or 0:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+', help='Trace files written by the request recorder')
+    parser.add_argument('--url', help='Instance to replay against (default: a private local one)')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed (1 = recorded pace, 0 = no pauses)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at most')
+    parser.add_argument('--seam-latency-ms', type=float, default=0, help='Delay of each fake Seam call')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+
+    if args.speed < 0:
+        parser.error("--speed must be 0 or more")
+
+    base_url = args.url
+    if not base_url:
+        # Only errors of the local instance reach the console
+        from app.utils.logging_config import configure_logging
+        configure_logging(level='ERROR')
+        base_url = start_local_instance(args.seam_latency_ms)
+
+    summary = TrafficReplayer(base_url, speed=args.speed, concurrency=args.concurrency).replay(
+        load_traces(args.files)
+    )
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Simulate months of bookings on a virtual clock and report how fast codes expire
+
+Generates synthetic bookings (random lead times, lengths and cancellations)
+and plays them against a private app instance on a temporary data directory
+and a fake Seam, with --workers cleanup workers (splitting the devices
+between them) running every --check-minutes. All
+of it runs on a VirtualClock, so a year of traffic takes seconds to minutes
+instead of a year.
+
+Reports:
+    - expiry lag: how long codes stayed on the lock, and bookings stayed
+      active, after they ended
+    - Seam calls per operation
+    - booking store writes (rows, bytes, compactions) per log
+
+Examples:
+    python scripts/simulate_expiry.py
+    python scripts/simulate_expiry.py --days 30 --bookings-per-day 50 --devices 10
+    python scripts/simulate_expiry.py --check-minutes 15 --horizon-hours 24 --json
+    python scripts/simulate_expiry.py --days 30 --workers 3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+# Add the parent directory to the Python path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.time_utils import VirtualClock, datetime_to_iso, to_utc_datetime, use_clock
+from scripts.replay_traffic import PERCENTILES, percentile
+
+DEFAULT_START = '2030-01-01T00:00:00Z'
+
+class SimulatedNotifier:
+    """Notification service that only counts what it would have sent"""
+
+    def __init__(self):
+        self.sent = {'access_codes': 0, 'reminders': 0}
+
+    def notify_access_code(self, user, access_details):
+        self.sent['access_codes'] += 1
+        return True
+
+    def send_expiration_reminders(self, reminders, hours_before=24):
+        self.sent['reminders'] += len(reminders)
+        return [True] * len(reminders)
+
+class _Response:
+    """The parts of a requests.Response the cleanup worker uses"""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self._json = response.get_json(silent=True)
+
+    def json(self):
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+class AppClientHttp:
+    """Sends the cleanup worker's API calls to an app's test client"""
+
+    def __init__(self, client, base_url):
+        self.client = client
+        self.base_url = base_url
+
+    def request(self, method, url, params=None, json=None, headers=None, **kwargs):
+        path = url[len(self.base_url):] if url.startswith(self.base_url) else url
+        return _Response(self.client.open(
+            '/api' + path, method=method, query_string=params, json=json, headers=headers
+        ))
+
+def generate_bookings(rng, start, days, bookings_per_day, devices, max_lead_days=30, cancel_rate=0.1):
+    """
+    Generate synthetic bookings over a period
+
+    Args:
+        rng (random.Random): Random source
+        start (datetime): Start of the period
+        days (int): Length of the period
+        bookings_per_day (float): Mean bookings created per day
+        devices (list): Device IDs to book
+        max_lead_days (float, optional): Longest time between booking and start
+        cancel_rate (float, optional): Share of bookings cancelled before they start
+
+    Returns:
+        list: Dicts with created_at, starts_at, ends_at, device_id and
+              cancel_at (None if the booking is kept)
+    """
+    bookings = []
+    for _ in range(int(days * bookings_per_day)):
+        created_at = start + timedelta(seconds=rng.uniform(0, days * 86400))
+        # Booked from an hour to max_lead_days ahead, for an hour to three days
+        starts_at = created_at + timedelta(hours=rng.uniform(1, max(max_lead_days * 24, 1)))
+        ends_at = starts_at + timedelta(hours=rng.uniform(1, 72))
+        cancel_at = None
+        if rng.random() < cancel_rate:
+            cancel_at = created_at + (starts_at - created_at) * rng.uniform(0.1, 0.9)
+        bookings.append({
+            'created_at': created_at,
+            'starts_at': starts_at.replace(microsecond=0),
+            'ends_at': ends_at.replace(microsecond=0),
+            'device_id': rng.choice(devices),
+            'cancel_at': cancel_at
+        })
+    return sorted(bookings, key=lambda booking: booking['created_at'])
+
+def _lag_stats(lags):
+    """Percentiles and max of lags in seconds, reported in minutes"""
+    lags = sorted(lags)
+    stats = {'count': len(lags)}
+    for pct in PERCENTILES:
+        value = percentile(lags, pct)
+        stats[f"p{pct}_minutes"] = round(value / 60, 1) if value is not None else None
+    stats['max_minutes'] = round(lags[-1] / 60, 1) if lags else None
+    return stats
+
+def simulate(days=365, bookings_per_day=20, devices=20, check_minutes=60, horizon_hours=0,
+             max_lead_days=30, workers=1, seed=0, start=DEFAULT_START, data_dir=None):
+    """
+    Run a simulation
+
+    Args:
+        days (int, optional): Simulated period
+        bookings_per_day (float, optional): Mean bookings created per day
+        devices (int, optional): Number of locks
+        check_minutes (float, optional): Cleanup worker interval
+        horizon_hours (float, optional): Provisioning horizon (0: codes are
+                                         pushed when the booking is made)
+        max_lead_days (float, optional): Longest time between booking and start
+        workers (int, optional): Cleanup workers sharing the devices
+        seed (int, optional): Random seed
+        start (str, optional): Simulated start time
+        data_dir (str, optional): Booking store directory (default: a temporary one)
+
+    Returns:
+        dict: The report
+    """
+    from app import create_app
+    from app.services.booking_store import BookingStore
+    from app.services.container import ServiceContainer
+    from app.services.fake_seam_service import FakeSeamService
+    from app.services.provisioning_service import ProvisioningService
+    from app.services.reminder_service import ReminderService
+    from app.services.scheduler_service import SchedulerService
+    from app.services.worker_membership import WorkerMembership
+    from workers.cleanup_worker import CleanupWorker
+
+    rng = random.Random(seed)
+    start = to_utc_datetime(start)
+    end = start + timedelta(days=days)
+    device_ids = [f"sim-device-{n:03d}" for n in range(1, devices + 1)]
+    planned = generate_bookings(rng, start, days, bookings_per_day, device_ids, max_lead_days)
+    wall_started = time.perf_counter()
+
+    with use_clock(VirtualClock(start)) as clock:
+        data_dir = data_dir or tempfile.mkdtemp(prefix='simulation-')
+        store = BookingStore(data_dir=data_dir)
+        seam = FakeSeamService()
+        notifier = SimulatedNotifier()
+        scheduler = SchedulerService(seam_service=seam, booking_store=store)
+        reminders = ReminderService(store, notifier)
+        services = ServiceContainer(
+            data_dir=data_dir,
+            booking_store=store,
+            seam_service=seam,
+            scheduler_service=scheduler,
+            notification_service=notifier,
+            reminder_service=reminders,
+            provisioning_service=ProvisioningService(
+                store, scheduler, notifier, reminders,
+                workers=1, background=False, horizon_hours=horizon_hours
+            )
+        )
+        app = create_app({'DATA_DIR': data_dir, 'REQUEST_RECORDING': False}, services=services)
+        client = app.test_client()
+
+        base_url = 'http://simulation/api'
+        cleanup_workers = []
+        for n in range(workers):
+            membership = None
+            if workers > 1:
+                # Leases outlive a check interval: workers only renew when they run a check here
+                membership = WorkerMembership(os.path.join(data_dir, 'workers'), member_id=f"sim-worker-{n}",
+                                              lease_seconds=check_minutes * 60 * 2)
+                membership.renew()
+            cleanup_workers.append(CleanupWorker(config={
+                'check_interval_seconds': check_minutes * 60,
+                'api_base_url': base_url,
+                'devices': device_ids,
+                'reconcile_mode': None,
+                'archive_retention_days': None
+            }, seam_service=seam, http=AppClientHttp(client, base_url), membership=membership))
+
+        # Creations and cancellations, in time order
+        actions = [(booking['created_at'], 'create', n) for n, booking in enumerate(planned)]
+        actions += [(booking['cancel_at'], 'cancel', n) for n, booking in enumerate(planned) if booking['cancel_at']]
+        actions.sort(key=lambda action: (action[0], action[1] == 'cancel'))
+
+        counts = {'planned': len(planned), 'created': 0, 'rejected': 0, 'cancelled': 0}
+        booking_ids = {}
+        peak_stale_codes = 0
+        checks = 0
+        interval = timedelta(minutes=check_minutes)
+        next_check = start + interval
+        position = 0
+
+        while next_check <= end:
+            while position < len(actions) and actions[position][0] <= next_check:
+                at, kind, n = actions[position]
+                position += 1
+                clock.set(at)
+                booking = planned[n]
+                if kind == 'create':
+                    response = client.post('/api/bookings', json={
+                        'device_id': booking['device_id'],
+                        'user_name': f"Guest {n}",
+                        'user_email': f"guest{n}@example.com",
+                        'user_phone': '+15550000000',
+                        'starts_at': datetime_to_iso(booking['starts_at']),
+                        'ends_at': datetime_to_iso(booking['ends_at'])
+                    })
+                    if response.status_code in (201, 202):
+                        booking_ids[n] = response.get_json()['booking']['id']
+                        counts['created'] += 1
+                    else:
+                        counts['rejected'] += 1
+                elif n in booking_ids:
+                    if client.delete(f"/api/bookings/{booking_ids[n]}").status_code == 200:
+                        counts['cancelled'] += 1
+
+            clock.set(next_check)
+            now = clock.now()
+            stale = sum(1 for code in list(seam.codes.values()) if to_utc_datetime(code.ends_at) < now)
+            peak_stale_codes = max(peak_stale_codes, stale)
+            for worker in cleanup_workers:
+                worker.run_check()
+            reminders.dispatch_due()
+            checks += 1
+            next_check += interval
+
+        now = clock.now()
+        code_lags = [
+            (code.deleted_at - to_utc_datetime(code.ends_at)).total_seconds()
+            for code in seam.deleted if code.deleted_at >= to_utc_datetime(code.ends_at)
+        ]
+        expired = list(store.iter_bookings(status='expired'))
+        expired += list(store.archive.iter_bookings(status='expired'))
+        status_lags = [
+            (to_utc_datetime(booking.updated_at) - booking.final_ends_at()).total_seconds()
+            for booking in expired
+        ]
+
+        return {
+            'simulated_days': days,
+            'workers': workers,
+            'checks': checks,
+            'check_minutes': check_minutes,
+            'bookings': counts,
+            'code_expiry_lag': _lag_stats(code_lags),
+            'status_expiry_lag': _lag_stats(status_lags),
+            'stale_codes': {
+                'peak': peak_stale_codes,
+                'at_end': sum(1 for code in seam.codes.values() if to_utc_datetime(code.ends_at) < now)
+            },
+            'seam_calls': dict(sorted(seam.call_counts.items())),
+            'store_writes': store.write_stats(),
+            'notifications': dict(notifier.sent),
+            'wall_seconds': round(time.perf_counter() - wall_started, 2)
+        }
+
+def print_report(report):
+    """Print a report as text"""
+    bookings = report['bookings']
+    print(f"{report['simulated_days']} days simulated in {report['wall_seconds']} s "
+          f"({report['checks']} checks every {report['check_minutes']} min, {report['workers']} workers)")
+    print(f"bookings: {bookings['created']} created, {bookings['rejected']} rejected, "
+          f"{bookings['cancelled']} cancelled (of {bookings['planned']} planned)")
+    for name in ('code_expiry_lag', 'status_expiry_lag'):
+        lag = report[name]
+        print(f"{name}: n={lag['count']} " + ' '.join(
+            f"p{pct}={lag[f'p{pct}_minutes']}" for pct in PERCENTILES
+        ) + f" max={lag['max_minutes']} (minutes)")
+    print(f"stale codes on locks: peak {report['stale_codes']['peak']}, at end {report['stale_codes']['at_end']}")
+    print("seam calls: " + ', '.join(f"{op}={count}" for op, count in report['seam_calls'].items()))
+    for log, stats in report['store_writes'].items():
+        print(f"store {log:<9} {stats['rows']:>8} rows {stats['bytes']:>12} bytes {stats['compactions']:>4} compactions")
+    print(f"notifications: {report['notifications']['access_codes']} access codes, "
+          f"{report['notifications']['reminders']} reminders")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=365, help='Simulated period in days')
+    parser.add_argument('--bookings-per-day', type=float, default=20, help='Mean bookings created per day')
+    parser.add_argument('--devices', type=int, default=20, help='Number of locks')
+    parser.add_argument('--check-minutes', type=float, default=60, help='Cleanup worker interval in minutes')
+    parser.add_argument('--horizon-hours', type=float, default=0, help='Provisioning horizon (0: push codes at once)')
+    parser.add_argument('--max-lead-days', type=float, default=30, help='Longest time between booking and start')
+    parser.add_argument('--workers', type=int, default=1, help='Cleanup workers sharing the devices')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--start', default=DEFAULT_START, help='Simulated start time (ISO 8601)')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    if args.days < 1 or args.devices < 1 or args.workers < 1 or args.check_minutes <= 0:
+        parser.error("--days, --devices, --workers and --check-minutes must be positive")
+
+    # Only errors of the simulated instance reach the console
+    from app.utils.logging_config import configure_logging
+    configure_logging(level='ERROR')
+
+    report = simulate(days=args.days, bookings_per_day=args.bookings_per_day, devices=args.devices,
+                      check_minutes=args.check_minutes, horizon_hours=args.horizon_hours,
+                      max_lead_days=args.max_lead_days, workers=args.workers, seed=args.seed, start=args.start)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
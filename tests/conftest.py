@@ -0,0 +1,68 @@
+import itertools
+from types import SimpleNamespace
+import pytest
+from app import create_app
+from app.services.booking_store import BookingStore
+from app.services.container import ServiceContainer
+from app.services.notification_service import NotificationService
+
+class FakeSeamService:
+    """In-memory stand-in for SeamService that records every call"""
+
+    def __init__(self):
+        self.codes = {}
+        self.calls = []
+        self._ids = itertools.count(1)
+
+    def create_access_code(self, device_id, code, name, starts_at, ends_at):
+        self.calls.append(('create', device_id))
+        access_code_id = f"ac_{next(self._ids)}"
+        self.codes[access_code_id] = SimpleNamespace(
+            access_code_id=access_code_id, device_id=device_id, code=code,
+            name=name, starts_at=starts_at, ends_at=ends_at
+        )
+        return {
+            "access_code_id": access_code_id,
+            "code": code,
+            "starts_at": starts_at,
+            "ends_at": ends_at,
+            "name": name
+        }
+
+    def get_access_codes(self, device_id):
+        self.calls.append(('list', device_id))
+        return [c for c in self.codes.values() if c.device_id == device_id]
+
+    def delete_access_code(self, access_code_id):
+        self.calls.append(('delete', access_code_id))
+        self.codes.pop(access_code_id, None)
+        return True
+
+    def delete_expired_codes(self, device_id):
+        self.calls.append(('delete_expired', device_id))
+        return []
+
+@pytest.fixture
+def store(tmp_path):
+    return BookingStore(data_dir=str(tmp_path / 'data'))
+
+@pytest.fixture
+def fake_seam():
+    return FakeSeamService()
+
+@pytest.fixture
+def services(store, fake_seam):
+    # No SMTP credentials, so emails are skipped; SMS stays in memory
+    notification_service = NotificationService(email_config={
+        'smtp_server': '', 'smtp_port': 0, 'smtp_username': '',
+        'smtp_password': '', 'from_email': ''
+    }, sms_config={'provider': 'local'})
+    return ServiceContainer(
+        booking_store=store,
+        seam_service=fake_seam,
+        notification_service=notification_service
+    )
+
+@pytest.fixture
+def app(services):
+    return create_app({'TESTING': True}, services=services)
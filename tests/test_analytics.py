@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from app.models.booking import Booking
+from app.services.analytics_service import UtilizationService, _FenwickTree
+from app.services.booking_store import BookingStore
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+def make_booking(starts_at, ends_at, device_id='lock-1', recurrence=None):
+    return Booking(device_id=device_id, starts_at=starts_at, ends_at=ends_at, recurrence=recurrence)
+
+def test_fenwick_tree_range_sums():
+    """Test prefix and range sums over sparse indexes"""
+    tree = _FenwickTree()
+    tree.add(5, 2.0)
+    tree.add(400000, 3.0)
+    tree.add(5, -0.5)
+    assert tree.range_sum(0, 6) == 1.5
+    assert tree.range_sum(6, 400000) == 0
+    assert tree.range_sum(0, 400001) == 4.5
+
+def test_counters_follow_booking_changes(store):
+    """Test that counters are built from the store and updated on later writes"""
+    first = make_booking('2030-01-01T10:30:00Z', '2030-01-01T12:00:00Z')
+    store.add_booking(first)
+
+    service = UtilizationService(store)
+    store.add_change_listener(service.record_booking_row)
+
+    report = service.utilization(['lock-1'], utc(2030, 1, 1), utc(2030, 1, 2), 'day')
+    assert report['devices']['lock-1']['booked_hours'] == 1.5
+    assert report['devices']['lock-1']['peak_concurrent'] == 1
+
+    # An overlapping booking, then a cancellation
+    second = make_booking('2030-01-01T11:00:00Z', '2030-01-01T13:00:00Z')
+    store.add_booking(second)
+    hourly = service.utilization(['lock-1'], utc(2030, 1, 1, 10), utc(2030, 1, 1, 13), 'hour')
+    assert [b['booked_hours'] for b in hourly['devices']['lock-1']['buckets']] == [0.5, 2, 1]
+    assert hourly['devices']['lock-1']['peak_concurrent'] == 2
+
+    first.status = 'cancelled'
+    store.update_booking(first)
+    report = service.utilization(['lock-1'], utc(2030, 1, 1), utc(2030, 1, 2), 'day')
+    assert report['devices']['lock-1']['booked_hours'] == 2
+    assert report['devices']['lock-1']['utilization'] == round(2 / 24, 4)
+    assert service.device_ids() == ['lock-1']
+
+def test_recurring_and_archived_bookings_count(store):
+    """Test that series occurrences and archived bookings are included"""
+    old = make_booking('2020-01-01T10:00:00Z', '2020-01-01T11:00:00Z')
+    old.status = 'expired'
+    store.add_booking(old)
+    store.archive_finished(utc(2021, 1, 1))
+    store.add_booking(make_booking('2030-01-01T10:00:00Z', '2030-01-01T11:00:00Z',
+                                   device_id='lock-2', recurrence='FREQ=DAILY;COUNT=3'))
+
+    service = UtilizationService(store)
+    assert service.utilization(['lock-1'], utc(2020, 1, 1), utc(2020, 1, 2))['devices']['lock-1']['booked_hours'] == 1
+    weekly = service.utilization(['lock-2'], utc(2030, 1, 1), utc(2030, 1, 8), 'week')
+    assert weekly['devices']['lock-2']['booked_hours'] == 3
+
+def test_utilization_api(client, store):
+    """Test GET /api/analytics/utilization"""
+    store.add_booking(make_booking('2030-01-01T10:00:00Z', '2030-01-01T14:00:00Z'))
+
+    body = client.get('/api/analytics/utilization?start=2030-01-01T00:00:00Z'
+                      '&end=2030-01-03T00:00:00Z&granularity=day').get_json()
+    assert body['granularity'] == 'day'
+    assert [b['booked_hours'] for b in body['devices']['lock-1']['buckets']] == [4, 0]
+
+    assert client.get('/api/analytics/utilization?granularity=month').status_code == 400
+    assert client.get('/api/analytics/utilization?start=2020-01-01T00:00:00Z'
+                      '&end=2030-01-01T00:00:00Z&granularity=hour').status_code == 400
+
+def test_counters_resync_after_another_process_compacts(store):
+    """Test that rows another process wrote and compacted away before we tailed them are counted"""
+    store.add_booking(make_booking('2030-01-01T10:00:00Z', '2030-01-01T11:00:00Z'))
+    service = UtilizationService(store)
+    store.add_change_listener(service.record_booking_row)
+    store.add_reset_listener(service.resync)
+    assert service.utilization(['lock-1'], utc(2020, 1, 1), utc(2020, 1, 2))['devices']['lock-1']['booked_hours'] == 0
+
+    other = BookingStore(data_dir=store.data_dir)
+    old = make_booking('2020-01-01T10:00:00Z', '2020-01-01T12:00:00Z')
+    old.status = 'expired'
+    other.add_booking(old)
+    other.archive_finished(utc(2021, 1, 1))
+
+    store.refresh()
+    assert service.utilization(['lock-1'], utc(2020, 1, 1), utc(2020, 1, 2))['devices']['lock-1']['booked_hours'] == 2
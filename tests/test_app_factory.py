@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_create_app_without_credentials_defers_seam(tmp_path):
+    # A fresh interpreter, so modules imported by other tests don't count
+    env = {k: v for k, v in os.environ.items() if k != 'SEAM_API_KEY'}
+    script = (
+        "import sys\n"
+        "from app import create_app\n"
+        f"app = create_app({{'DATA_DIR': {str(tmp_path)!r}}})\n"
+        "response = app.test_client().get('/api/bookings')\n"
+        "assert response.status_code == 200, response.status_code\n"
+        "assert 'seam' not in sys.modules\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=str(tmp_path), env=dict(env, PYTHONPATH=PROJECT_ROOT),
+        capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+def test_services_are_built_on_first_use(app, services):
+    assert 'reconciliation_service' not in services._services
+    with app.test_client() as client:
+        client.post('/api/reconcile', json={})
+    assert 'reconciliation_service' in services._services
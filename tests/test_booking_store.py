@@ -0,0 +1,178 @@
+import json
+import os
+import pytest
+from datetime import datetime, timezone
+from app.models.booking import Booking
+from app.models.user import User
+from app.services.booking_store import BookingStore
+
+def test_migrates_legacy_bookings_file(tmp_path):
+    """Test that an old bookings.json array is converted on first use"""
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    legacy = Booking(device_id='lock-1', starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z')
+    (data_dir / 'bookings.json').write_text(json.dumps([legacy.to_dict()]))
+
+    store = BookingStore(data_dir=str(data_dir))
+    assert [b.id for b in store.iter_bookings()] == [legacy.id]
+    assert os.path.exists(store.bookings_file)
+
+def test_created_at_round_trips(tmp_path):
+    """Test that saving a loaded booking keeps a parseable created_at"""
+    store = BookingStore(data_dir=str(tmp_path))
+    booking = Booking(device_id='lock-1', starts_at='2030-01-01T10:00:00Z',
+                      ends_at='2030-01-01T12:00:00Z', created_at=datetime(2024, 1, 1))
+    store.add_booking(booking)
+
+    loaded = store.get_booking(booking.id)
+    loaded.status = 'cancelled'
+    store.update_booking(loaded)
+
+    reloaded = store.get_booking(booking.id)
+    assert reloaded.status == 'cancelled'
+    assert reloaded.to_dict()['created_at'] == '2024-01-01T00:00:00Z'
+    assert reloaded.updated_at > reloaded.created_at
+
+def test_indexes_follow_writes_from_another_process(tmp_path):
+    """Test that a second store on the same files catches up incrementally"""
+    writer = BookingStore(data_dir=str(tmp_path))
+    reader = BookingStore(data_dir=str(tmp_path))
+    assert reader.get_booking('missing') is None
+
+    booking = Booking(device_id='lock-1', user_id='user-1',
+                      starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z')
+    writer.add_booking(booking)
+    assert reader.booking_ids_for_device('lock-1') == [booking.id]
+    assert reader.booking_ids_for_user('user-1') == [booking.id]
+
+    booking.status = 'cancelled'
+    writer.update_booking(booking)
+    assert reader.get_booking(booking.id).status == 'cancelled'
+    assert [b.id for b in reader.iter_bookings(device_id='lock-1')] == [booking.id]
+
+def test_find_user_by_email(tmp_path):
+    """Test that users are found through the email index"""
+    store = BookingStore(data_dir=str(tmp_path))
+    store.add_user(User(id='user-1', name='Ann', email='ann@example.com'))
+    store.add_user(User(id='user-2', name='Bob', email='bob@example.com'))
+
+    assert store.find_user_by_email('bob@example.com').id == 'user-2'
+    assert store.find_user_by_email('nobody@example.com') is None
+    assert store.get_user('user-1').name == 'Ann'
+
+def test_compaction_drops_superseded_rows(tmp_path, monkeypatch):
+    """Test that the log is rewritten once most of it is stale"""
+    monkeypatch.setattr('app.services.booking_store.COMPACT_MIN_STALE_ROWS', 3)
+    store = BookingStore(data_dir=str(tmp_path))
+    booking = Booking(device_id='lock-1', starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z')
+    store.add_booking(booking)
+    for _ in range(3):
+        store.update_booking(booking)
+
+    with open(store.bookings_file) as f:
+        assert len(f.readlines()) == 1
+    assert store.get_booking(booking.id).id == booking.id
+    assert BookingStore(data_dir=str(tmp_path)).booking_ids_for_device('lock-1') == [booking.id]
+
+def test_reads_by_stale_offset_refresh_after_another_process_compacts(tmp_path, monkeypatch):
+    """Test that a record read with an offset from before a rewrite is read again, not mixed up"""
+    monkeypatch.setattr('app.services.booking_store.COMPACT_MIN_STALE_ROWS', 3)
+    writer = BookingStore(data_dir=str(tmp_path))
+    bookings = [
+        Booking(device_id=f"lock-{n}", starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z')
+        for n in range(3)
+    ]
+    writer.add_booking(bookings[0])
+    writer.update_booking(bookings[0])
+    writer.add_booking(bookings[1])
+    writer.add_booking(bookings[2])
+    reader = BookingStore(data_dir=str(tmp_path))
+    assert reader.get_booking(bookings[1].id).device_id == 'lock-1'
+
+    # Enough stale rows for the writer to rewrite the log, moving every line
+    for _ in range(3):
+        writer.update_booking(bookings[0])
+
+    # Read straight from the log, as a reader racing the rewrite would
+    assert [reader._bookings.get(b.id)['device_id'] for b in bookings] == ['lock-0', 'lock-1', 'lock-2']
+
+def test_row_that_cannot_be_encoded_is_not_written(tmp_path, monkeypatch):
+    """Test that a failure describing a row leaves nothing behind in the log"""
+    store = BookingStore(data_dir=str(tmp_path))
+    kept = Booking(device_id='lock-1', starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z')
+    store.add_booking(kept)
+
+    def fail(row, log_offset, length):
+        raise OverflowError('date value out of range')
+    monkeypatch.setattr('app.services.booking_store.encode_record', fail)
+    with pytest.raises(OverflowError):
+        store.add_booking(Booking(device_id='lock-1', starts_at='2030-01-02T10:00:00Z',
+                                  ends_at='2030-01-02T12:00:00Z'))
+    monkeypatch.undo()
+
+    assert [b.id for b in BookingStore(data_dir=str(tmp_path)).iter_bookings()] == [kept.id]
+
+def add_sample_bookings(store):
+    """Add bookings covering the fields the record filters look at"""
+    bookings = [
+        Booking(device_id='lock-1', user_id='user-1', status='active',
+                starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z'),
+        Booking(device_id='lock-2', user_id='user-1', status='expired',
+                starts_at='2030-01-02T10:00:00Z', ends_at='2030-01-02T12:00:00Z'),
+        Booking(device_id='lock-1', user_id='user-2', status='active', recurrence='FREQ=DAILY;COUNT=3',
+                starts_at='2030-01-03T10:00:00Z', ends_at='2030-01-03T12:00:00Z',
+                occurrence_codes={'2030-01-03T10:00:00Z': {'access_code_id': 'ac_series', 'code': '1234'}}),
+        Booking(device_id='x' * 100, user_id='user-3', status='active',
+                starts_at='2030-01-04T10:00:00Z', ends_at='2030-01-04T12:00:00Z'),
+    ]
+    for booking in bookings:
+        store.add_booking(booking)
+    bookings[1].status = 'cancelled'
+    store.update_booking(bookings[1])
+    return bookings
+
+def test_record_file_matches_json_filters(tmp_path, monkeypatch):
+    """Test that filtering on booking records gives the same bookings as reading every row"""
+    monkeypatch.setattr('app.services.booking_store.BOOKING_RECORDS_ENABLED', True)
+    add_sample_bookings(BookingStore(data_dir=str(tmp_path)))
+    with_records = BookingStore(data_dir=str(tmp_path))
+    monkeypatch.setattr('app.services.booking_store.BOOKING_RECORDS_ENABLED', False)
+    without_records = BookingStore(data_dir=str(tmp_path))
+
+    filters = [
+        {}, {'status': 'active'}, {'status': ('cancelled', 'expired')}, {'device_id': 'lock-1'},
+        {'user_id': 'user-1', 'status': 'active'}, {'device_id': 'x' * 100}, {'recurring': True},
+        {'start': datetime(2030, 1, 2, tzinfo=timezone.utc)},
+        {'end': datetime(2030, 1, 3, tzinfo=timezone.utc)},
+        {'end': datetime(2030, 1, 6, tzinfo=timezone.utc), 'status': 'active'},
+    ]
+    for kwargs in filters:
+        assert ([b.id for b in with_records.iter_bookings(**kwargs)]
+                == [b.id for b in without_records.iter_bookings(**kwargs)]), kwargs
+
+    # The loaded indexes came from the records, including the series' occurrence code
+    assert len(with_records._bookings.record_numbers) == 4
+    assert with_records.find_booking_by_access_code('ac_series').recurrence == 'FREQ=DAILY;COUNT=3'
+
+def test_record_file_is_rebuilt_when_missing_or_stale(tmp_path, monkeypatch):
+    """Test that a lost or outdated record file is ignored and then rewritten"""
+    monkeypatch.setattr('app.services.booking_store.BOOKING_RECORDS_ENABLED', True)
+    store = BookingStore(data_dir=str(tmp_path))
+    bookings = add_sample_bookings(store)
+    os.remove(store.booking_records_file)
+
+    reader = BookingStore(data_dir=str(tmp_path))
+    assert [b.id for b in reader.iter_bookings(status='active')] == [bookings[0].id, bookings[2].id, bookings[3].id]
+    assert reader._bookings.record_numbers == {}
+
+    # The next write describes the whole log again, and the reader picks the records up
+    store.update_booking(bookings[0])
+    assert [b.id for b in reader.iter_bookings(status='cancelled')] == [bookings[1].id]
+    assert len(reader._bookings.record_numbers) == 4
+
+    # Compaction moves the records along with the rows
+    monkeypatch.setattr('app.services.booking_store.COMPACT_MIN_STALE_ROWS', 1)
+    store.update_booking(bookings[0])
+    fresh = BookingStore(data_dir=str(tmp_path))
+    assert [b.id for b in fresh.iter_bookings(device_id='lock-1')] == [bookings[0].id, bookings[2].id]
+    assert len(fresh._bookings.record_numbers) == 4
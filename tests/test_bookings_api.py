@@ -0,0 +1,253 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from app.models.booking import Booking
+
+def make_booking(device_id='lock-1', user_id='user-1', status='active', days=1, created_offset=0):
+    """Build a booking starting `days` from now and lasting two hours"""
+    start = datetime.utcnow() + timedelta(days=days)
+    return Booking(
+        device_id=device_id,
+        user_id=user_id,
+        starts_at=start.isoformat() + 'Z',
+        ends_at=(start + timedelta(hours=2)).isoformat() + 'Z',
+        created_at=datetime(2024, 1, 1) + timedelta(seconds=created_offset),
+        status=status
+    )
+
+def test_get_bookings_paginates_with_cursor(client, store):
+    """Test that pages follow next_cursor without repeats or gaps"""
+    ids = []
+    for i in range(5):
+        booking = make_booking(created_offset=i)
+        store.add_booking(booking)
+        ids.append(booking.id)
+
+    seen = []
+    url = '/api/bookings?limit=2'
+    while url:
+        body = client.get(url).get_json()
+        seen.extend(b['id'] for b in body['bookings'])
+        url = f"/api/bookings?limit=2&cursor={body['next_cursor']}" if body['next_cursor'] else None
+
+    assert seen == ids
+
+def test_cursor_pages_follow_creation_time_not_log_order(client, store):
+    """Test that a booking written after later-created ones is not skipped by the cursor"""
+    bookings = [make_booking(created_offset=offset) for offset in (0, 2, 3, 1)]
+    for booking in bookings:
+        store.add_booking(booking)
+
+    body = client.get('/api/bookings?limit=2').get_json()
+    seen = [b['id'] for b in body['bookings']]
+    body = client.get(f"/api/bookings?limit=2&cursor={body['next_cursor']}").get_json()
+    seen += [b['id'] for b in body['bookings']]
+
+    assert seen == [bookings[i].id for i in (0, 3, 1, 2)]
+    assert body['next_cursor'] is None
+
+def test_cleanup_expires_only_the_given_device(client, store):
+    """Test that cleaning up one lock leaves finished bookings on other locks alone"""
+    on_lock = make_booking(device_id='lock-1', days=-3)
+    elsewhere = make_booking(device_id='lock-2', days=-3)
+    store.add_booking(on_lock)
+    store.add_booking(elsewhere)
+
+    assert client.post('/api/cleanup-expired-codes', json={'device_id': 'lock-1'}).status_code == 200
+    assert store.get_booking(on_lock.id).status == 'expired'
+    assert store.get_booking(elsewhere.id).status == 'active'
+
+def test_get_bookings_filters(client, store):
+    """Test that device, status and time filters are applied server-side"""
+    store.add_booking(make_booking(device_id='lock-1', created_offset=0))
+    store.add_booking(make_booking(device_id='lock-2', created_offset=1))
+    store.add_booking(make_booking(device_id='lock-1', status='cancelled', created_offset=2))
+    store.add_booking(make_booking(device_id='lock-1', days=-3, created_offset=3))
+
+    body = client.get('/api/bookings?device_id=lock-1&status=active').get_json()
+    assert len(body['bookings']) == 2
+
+    now = datetime.utcnow().isoformat() + 'Z'
+    body = client.get(f'/api/bookings?status=active&end={now}').get_json()
+    assert len(body['bookings']) == 1
+    assert body['next_cursor'] is None
+
+def test_get_bookings_ndjson_stream(client, store):
+    """Test that format=ndjson streams one booking per line"""
+    for i in range(3):
+        store.add_booking(make_booking(created_offset=i))
+
+    response = client.get('/api/bookings?format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 3
+
+@pytest.mark.parametrize('query', ['cursor=not-a-cursor', 'start=yesterday', 'limit=0'])
+def test_get_bookings_rejects_bad_parameters(client, query):
+    """Test that malformed query parameters are a 400, not a 500"""
+    assert client.get(f'/api/bookings?{query}').status_code == 400
+
+def test_cancel_booking_updates_single_row(client, store):
+    """Test that cancelling rewrites only the cancelled booking's status"""
+    keep = make_booking(created_offset=0)
+    cancel = make_booking(created_offset=1)
+    store.add_booking(keep)
+    store.add_booking(cancel)
+
+    response = client.delete(f'/api/bookings/{cancel.id}')
+    assert response.status_code == 200
+
+    assert store.get_booking(cancel.id).status == 'cancelled'
+    assert store.get_booking(keep.id).status == 'active'
+
+def test_bulk_cancel_by_device(client, store, fake_seam):
+    """Test that a filter cancels matching bookings, revokes their codes and skips active ones"""
+    code = fake_seam.create_access_code('lock-1', '1234', 'booking', None, None)
+    future = make_booking(status='scheduled', created_offset=0)
+    future.access_code_id = code['access_code_id']
+    active = make_booking(status='active', days=0, created_offset=1)
+    other = make_booking(device_id='lock-2', status='scheduled', created_offset=2)
+    for booking in (future, active, other):
+        store.add_booking(booking)
+
+    response = client.post('/api/bookings/cancel', json={'device_id': 'lock-1'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['cancelled'], body['skipped'], body['pending_revocation']) == (1, 1, 0)
+    results = {result['booking_id']: result for result in body['results']}
+    assert results[future.id]['revoked'] == [code['access_code_id']]
+    assert results[active.id]['reason'] == "Cannot cancel an active booking"
+
+    assert store.get_booking(future.id).status == 'cancelled'
+    assert store.get_booking(active.id).status == 'active'
+    assert store.get_booking(other.id).status == 'scheduled'
+    assert not fake_seam.codes
+
+def test_bulk_cancel_reports_codes_pending_revocation(client, store, fake_seam, services, monkeypatch):
+    """Test that codes the lock refuses to delete are retried, then reported"""
+    def refuse(access_code_id):
+        fake_seam.calls.append(('delete', access_code_id))
+        raise RuntimeError("lock offline")
+    monkeypatch.setattr(fake_seam, 'delete_access_code', refuse)
+    services.cancellation_service.retry_seconds = 0
+
+    booking = make_booking(status='scheduled')
+    booking.access_code_id = 'ac_offline'
+    store.add_booking(booking)
+
+    response = client.post('/api/bookings/cancel', json={'booking_ids': [booking.id, 'missing']})
+    body = response.get_json()
+    assert body['pending_revocation'] == 1
+    assert body['not_found'] == 1
+    result = body['results'][0]
+    assert result['pending_revocation'] == [{'access_code_id': 'ac_offline', 'error': 'lock offline'}]
+    assert fake_seam.calls.count(('delete', 'ac_offline')) == 3
+    assert store.get_booking(booking.id).status == 'cancelled'
+
+def test_bulk_cancel_requires_a_filter(client):
+    """Test that an empty body does not cancel everything"""
+    assert client.post('/api/bookings/cancel', json={}).status_code == 400
+
+def test_recurring_booking_is_stored_once_and_provisioned_lazily(client, store, fake_seam):
+    """Test that a weekly series creates one row and only codes for imminent occurrences"""
+    start = datetime.utcnow() + timedelta(hours=2)
+    response = client.post('/api/bookings', json={
+        'device_id': 'lock-1',
+        'starts_at': start.isoformat() + 'Z',
+        'ends_at': (start + timedelta(hours=1)).isoformat() + 'Z',
+        'user_name': 'Cleaner',
+        'user_email': 'cleaner@example.com',
+        'recurrence': 'FREQ=WEEKLY;COUNT=52'
+    })
+    assert response.status_code == 201
+    booking = response.get_json()['booking']
+    assert len(list(store.iter_bookings())) == 1
+    assert len(booking['occurrence_codes']) == 1
+    assert len(fake_seam.codes) == 1
+
+    # The same slot three weeks later clashes with the series, a day later does not
+    later = start + timedelta(weeks=3)
+    query = f"device_id=lock-1&starts_at={later.isoformat()}Z&ends_at={(later + timedelta(minutes=30)).isoformat()}Z"
+    assert client.get(f'/api/check-availability?{query}').get_json()['is_available'] is False
+    later += timedelta(days=1)
+    query = f"device_id=lock-1&starts_at={later.isoformat()}Z&ends_at={(later + timedelta(minutes=30)).isoformat()}Z"
+    assert client.get(f'/api/check-availability?{query}').get_json()['is_available'] is True
+
+    occurrences = client.get(f"/api/bookings/{booking['id']}/occurrences?limit=3").get_json()['occurrences']
+    assert [o['provisioned'] for o in occurrences] == [True, False, False]
+
+def test_recurring_booking_rejects_bad_rule(client):
+    """Test that an unsupported recurrence rule is a 400"""
+    start = datetime.utcnow() + timedelta(days=1)
+    response = client.post('/api/bookings', json={
+        'device_id': 'lock-1',
+        'starts_at': start.isoformat() + 'Z',
+        'ends_at': (start + timedelta(hours=1)).isoformat() + 'Z',
+        'user_name': 'Cleaner',
+        'user_email': 'cleaner@example.com',
+        'recurrence': 'FREQ=MONTHLY'
+    })
+    assert response.status_code == 400
+
+def test_free_slots_across_devices(client, fake_seam):
+    """Test free gaps per device and the first device free at a given time"""
+    fake_seam.create_access_code('lock-1', '1111', 'a', '2030-01-01T09:00:00Z', '2030-01-01T12:00:00Z')
+    fake_seam.create_access_code('lock-2', '2222', 'b', '2030-01-01T10:00:00Z', '2030-01-01T11:00:00Z')
+    fake_seam.calls.clear()
+
+    response = client.get('/api/free-slots?device_id=lock-1,lock-2&start=2030-01-01T08:00:00Z'
+                          '&end=2030-01-01T13:00:00Z&min_duration=60&at=2030-01-01T11:00:00Z')
+    body = response.get_json()
+
+    assert body['free_slots']['lock-1'] == [
+        {'starts_at': '2030-01-01T08:00:00Z', 'ends_at': '2030-01-01T09:00:00Z'},
+        {'starts_at': '2030-01-01T12:00:00Z', 'ends_at': '2030-01-01T13:00:00Z'},
+    ]
+    assert len(body['free_slots']['lock-2']) == 2
+    assert body['first_free_device'] == 'lock-2'
+    # One lock listing per device for the whole query
+    assert fake_seam.calls == [('list', 'lock-1'), ('list', 'lock-2')]
+
+def test_check_availability_batch(client, fake_seam):
+    """Test many candidates with one lock listing per device and per-slot errors"""
+    fake_seam.create_access_code('lock-1', '1111', 'a', '2030-01-01T09:00:00Z', '2030-01-01T12:00:00Z')
+    fake_seam.calls.clear()
+
+    response = client.post('/api/check-availability/batch', json={'slots': [
+        {'device_id': 'lock-1', 'starts_at': '2030-01-01T08:00:00Z', 'ends_at': '2030-01-01T09:00:00Z'},
+        {'device_id': 'lock-1', 'starts_at': '2030-01-01T11:00:00Z', 'ends_at': '2030-01-01T13:00:00Z'},
+        {'device_id': 'lock-2', 'starts_at': '2030-01-01T11:00:00Z', 'ends_at': '2030-01-01T13:00:00Z'},
+        {'device_id': 'lock-1', 'starts_at': 'soon', 'ends_at': '2030-01-01T13:00:00Z'},
+    ]})
+    results = response.get_json()['results']
+
+    assert [r['is_available'] for r in results] == [True, False, True, False]
+    assert 'error' in results[3]
+    assert fake_seam.calls == [('list', 'lock-1'), ('list', 'lock-2')]
+
+def test_scheduler_view_returns_devices_and_periods(client, fake_seam):
+    """Test one request for the device list and several devices' bookings, with per-device errors"""
+    fake_seam.create_access_code('lock-1', '1111', 'a', '2030-01-01T09:00:00Z', '2030-01-01T12:00:00Z')
+    fake_seam.create_access_code('lock-2', '2222', 'b', '2030-01-02T09:00:00Z', '2030-01-02T10:00:00Z')
+    fake_seam.create_access_code('lock-2', '3333', 'c', '2030-03-01T09:00:00Z', '2030-03-01T10:00:00Z')
+
+    response = client.get('/api/scheduler-view?device_id=lock-1,lock-2'
+                          '&start=2030-01-01T00:00:00Z&end=2030-01-08T00:00:00Z')
+    body = response.get_json()
+
+    assert body['devices'][0]['device_id'] == 'mock-device-001'
+    assert [p['access_code_id'] for p in body['booked_periods']['lock-1']] == ['ac_1']
+    # The March code on lock-2 is outside the window
+    assert [p['access_code_id'] for p in body['booked_periods']['lock-2']] == ['ac_2']
+    assert body['change_token']
+    assert 'errors' not in body
+
+    def failing_list(device_id):
+        raise RuntimeError('Seam unavailable')
+    fake_seam.get_access_codes = failing_list
+    body = client.get('/api/scheduler-view?device_id=lock-1').get_json()
+    assert body['booked_periods'] == {}
+    assert body['errors'] == {'lock-1': 'Seam unavailable'}
+
+    assert client.get('/api/scheduler-view?start=2030-01-01T00:00:00Z'
+                      '&end=2030-06-01T00:00:00Z').status_code == 400
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from app.models.booking import Booking
+from app.services.capacity_service import CapacityService
+from app.services.provisioning_service import PROVISION_JOB, ProvisioningService
+from app.services.reminder_service import ReminderService
+from app.services.scheduler_service import SchedulerService
+from app.utils.time_utils import VirtualClock, use_clock
+
+class SilentNotifier:
+    """Stand-in for NotificationService that sends nothing"""
+
+    def notify_access_code(self, user, access_details):
+        pass
+
+def iso(moment):
+    return moment.isoformat() + 'Z'
+
+def add_booking(store, starts_at, ends_at, status='active'):
+    booking = Booking(device_id='lock-1', user_id='user-1', status=status,
+                      starts_at=iso(starts_at), ends_at=iso(ends_at))
+    store.add_booking(booking)
+    return booking
+
+def test_full_lock_defers_or_rejects_bookings(client, store, services):
+    """Test that a full lock defers codes that can wait for a slot and rejects the rest"""
+    services.capacity_service.default_slots = 2
+    now = datetime.utcnow()
+    first = add_booking(store, now - timedelta(hours=1), now + timedelta(hours=3))
+    add_booking(store, now + timedelta(days=1), now + timedelta(days=1, hours=2))
+
+    def book(starts_at, ends_at):
+        return client.post('/api/bookings', json={
+            'device_id': 'lock-1', 'starts_at': iso(starts_at), 'ends_at': iso(ends_at),
+            'user_name': 'Guest', 'user_email': 'guest@example.com'
+        })
+
+    # A slot frees up when the first booking ends, before this one starts
+    response = book(now + timedelta(days=2), now + timedelta(days=2, hours=2))
+    assert response.status_code == 201
+    body = response.get_json()
+    assert body['booking']['status'] == 'scheduled'
+    assert body['provision_at'] == first.ends_at
+    job = store.get_job(f"{PROVISION_JOB}:{body['booking']['id']}")
+    assert job['due_at'] == body['provision_at']
+
+    # No slot frees up before this one ends
+    soon = (now + timedelta(hours=1), now + timedelta(hours=2))
+    assert book(*soon).status_code == 409
+    response = client.post('/api/check-availability/batch', json={'slots': [
+        {'device_id': 'lock-1', 'starts_at': iso(soon[0]), 'ends_at': iso(soon[1])},
+        {'device_id': 'lock-2', 'starts_at': iso(soon[0]), 'ends_at': iso(soon[1])},
+    ]})
+    results = response.get_json()['results']
+    assert results[0]['is_available'] is False
+    assert results[0]['reason'] == "No free access code slot on the lock"
+    assert results[1]['is_available'] is True
+
+    response = client.get(f"/api/capacity?device_id=lock-1&end={iso(now + timedelta(days=3))}&granularity=day")
+    device = response.get_json()['devices']['lock-1']
+    assert (device['slots'], device['source'], device['peak_used'], device['pressure']) == (2, 'default', 2, 1.0)
+    assert [bucket['peak_used'] for bucket in device['buckets']] == [2, 2, 1]
+
+def test_capacity_prefers_model_configuration_over_device(store, fake_seam):
+    """Test that configured model capacities win over what the lock reports"""
+    fake_seam.get_device_info = lambda device_id: {
+        'device_type': 'schlage_lock', 'properties': {'max_active_codes_supported': 5}
+    }
+    reported = CapacityService(store, fake_seam, model_slots={}, discovery=True)
+    configured = CapacityService(store, fake_seam, model_slots={'schlage_lock': 3}, discovery=True)
+    unknown = CapacityService(store, object(), default_slots=7, model_slots={}, discovery=True)
+
+    assert reported.capacity('lock-1') == {'slots': 5, 'model': 'schlage_lock', 'source': 'device'}
+    assert configured.capacity('lock-1') == {'slots': 3, 'model': 'schlage_lock', 'source': 'model'}
+    assert unknown.capacity('lock-1') == {'slots': 7, 'model': None, 'source': 'default'}
+
+def test_unconfigured_capacity_does_not_ask_seam(store, fake_seam):
+    """Test that without model capacities or discovery no device lookup is made"""
+    lookups = []
+    fake_seam.get_device_info = lambda device_id: lookups.append(device_id) or {
+        'device_type': 'schlage_lock', 'properties': {'max_active_codes_supported': 5}
+    }
+    service = CapacityService(store, fake_seam, default_slots=0, model_slots={}, discovery=False)
+
+    assert service.capacity('lock-1') == {'slots': 0, 'model': None, 'source': 'default'}
+    assert service.admit('lock-1', '2030-01-01T10:00:00Z', '2030-01-01T12:00:00Z')['decision'] == 'admit'
+    assert lookups == []
+
+    ignored = CapacityService(store, fake_seam, model_slots={'yale_lock': 3}, discovery=False)
+    assert ignored.capacity('lock-1') == {'slots': 0, 'model': 'schlage_lock', 'source': 'default'}
+    assert lookups == ['lock-1']
+
+def test_provisioning_waits_for_a_free_slot(store, fake_seam):
+    """Test that a due code on a full lock is retried once a slot frees up, without using an attempt"""
+    with use_clock(VirtualClock('2030-01-01T08:00:00Z')) as clock:
+        capacity = CapacityService(store, fake_seam, default_slots=1)
+        scheduler = SchedulerService(fake_seam, store)
+        notifier = SilentNotifier()
+        service = ProvisioningService(store, scheduler, notifier, ReminderService(store, notifier),
+                                      background=False, capacity_service=capacity)
+
+        add_booking(store, datetime(2030, 1, 1, 7), datetime(2030, 1, 1, 9))
+        booking = add_booking(store, datetime(2030, 1, 1, 10), datetime(2030, 1, 1, 12), status='pending')
+        service.submit(booking)
+
+        assert service.dispatch_due() == {'deferred': 1}
+        job = store.get_job(f"{PROVISION_JOB}:{booking.id}")
+        assert (job['due_at'], job['attempts']) == ('2030-01-01T09:00:00Z', 0)
+        assert store.get_booking(booking.id).status == 'scheduled'
+
+        clock.advance(3600)
+        assert service.dispatch_due() == {'active': 1}
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+from app.models.booking import Booking
+from app.utils import time_utils
+from app.utils.time_utils import VirtualClock, get_current_utc_iso, is_in_past, use_clock
+from scripts.simulate_expiry import simulate
+
+START = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+def test_virtual_clock_drives_time_helpers():
+    """Test that helpers and models read the installed clock, and sleeping advances it"""
+    real_clock = time_utils.get_clock()
+    with use_clock(VirtualClock('2030-01-01T00:00:00Z')) as clock:
+        assert get_current_utc_iso() == '2030-01-01T00:00:00Z'
+        assert Booking(device_id='lock-1').created_at == START
+        assert not is_in_past('2030-01-01T00:30:00Z')
+
+        time_utils.sleep(3600)
+        assert is_in_past('2030-01-01T00:30:00Z')
+
+        # Never moves backwards
+        clock.set(START)
+        assert clock.now() == START + timedelta(hours=1)
+    assert time_utils.get_clock() is real_clock
+
+def test_store_write_stats(store):
+    """Test that the store counts what it appends per log"""
+    store.add_booking(Booking(device_id='lock-1'))
+    stats = store.write_stats()
+    assert stats['bookings']['rows'] == 1
+    assert stats['bookings']['bytes'] > 0
+    assert stats['users']['rows'] == 0
+
+def test_simulation_expires_codes_within_a_check(tmp_path):
+    """Test that a short simulation expires every code within one check interval"""
+    report = simulate(days=3, bookings_per_day=10, devices=3, check_minutes=30, max_lead_days=1,
+                      data_dir=str(tmp_path), start='2030-01-01T00:00:00Z')
+
+    assert report['checks'] == 3 * 48
+    assert report['bookings']['created'] > 0
+    assert report['code_expiry_lag']['count'] > 0
+    assert report['code_expiry_lag']['max_minutes'] <= 30
+    assert report['status_expiry_lag']['max_minutes'] <= 30
+    assert report['stale_codes']['at_end'] == 0
+    assert report['seam_calls']['access_codes.create'] == report['bookings']['created']
+    assert report['store_writes']['bookings']['rows'] >= report['bookings']['created']
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta, timezone
+from app.utils.intervals import merge_intervals, free_gaps, is_free
+
+def at(hour, minute=0):
+    return datetime(2030, 1, 1, hour, minute, tzinfo=timezone.utc)
+
+def test_merge_intervals_joins_overlapping_and_touching():
+    """Test that overlapping and back-to-back intervals collapse into one"""
+    merged = merge_intervals([(at(13), at(14)), (at(9), at(10)), (at(10), at(11)), (at(9, 30), at(10, 30))])
+    assert merged == [(at(9), at(11)), (at(13), at(14))]
+
+def test_free_gaps_is_complement_within_window():
+    """Test that gaps cover the window minus busy time, honouring min duration"""
+    busy = merge_intervals([(at(8), at(10)), (at(12), at(12, 20)), (at(12, 40), at(13))])
+    gaps = free_gaps(busy, at(9), at(14), min_duration=timedelta(minutes=30))
+    assert gaps == [(at(10), at(12)), (at(13), at(14))]
+
+def test_free_gaps_snaps_to_granularity():
+    """Test that gap edges are rounded inwards to the slot grid"""
+    busy = [(at(9), at(10, 10))]
+    gaps = free_gaps(busy, at(9), at(11, 50), granularity=timedelta(minutes=30))
+    assert gaps == [(at(10, 30), at(11, 30))]
+
+def test_is_free():
+    """Test the bisection-based point query"""
+    busy = merge_intervals([(at(9), at(10)), (at(12), at(13))])
+    starts = [start for start, _ in busy]
+    assert is_free(busy, starts, at(10), at(12))
+    assert not is_free(busy, starts, at(11), at(12, 1))
+    assert not is_free(busy, starts, at(8), at(14))
+    assert is_free(busy, starts, at(13), at(15))
@@ -0,0 +1,87 @@
+import json
+import logging
+import queue
+from email.mime.multipart import MIMEMultipart
+from types import SimpleNamespace
+from app.services.notification_service import NotificationService
+from app.services.seam_service import SeamService
+from app.utils.logging_config import (
+    ContextFilter, JsonFormatter, SamplingFilter, _QueueHandler, correlation_context,
+    get_correlation_id, parse_sample_rates
+)
+
+class ListHandler(logging.Handler):
+    """Handler keeping the records it is given"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def make_record(message='hello', level=logging.INFO, **extra):
+    record = logging.LogRecord('app.test', level, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_lines_carry_the_correlation_id():
+    """Test that records are stamped and rendered as one JSON object"""
+    record = make_record(event='seam.call', device_id='lock-1')
+    with correlation_context('req-1'):
+        ContextFilter().filter(record)
+    assert get_correlation_id() is None
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'hello'
+    assert entry['level'] == 'INFO'
+    assert entry['correlation_id'] == 'req-1'
+    assert entry['event'] == 'seam.call'
+    assert entry['device_id'] == 'lock-1'
+
+def test_sampling_and_bounded_queue():
+    """Test that sampling spares warnings and a full queue drops instead of blocking"""
+    sampling = SamplingFilter(parse_sample_rates('seam.call=0, http.request=1'))
+    assert not sampling.filter(make_record(event='seam.call'))
+    assert sampling.filter(make_record(event='seam.call', level=logging.WARNING))
+    assert sampling.filter(make_record(event='http.request'))
+    assert sampling.filter(make_record())
+
+    handler = _QueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record('%s and %s', args=('this', 'that')))
+    handler.handle(make_record())
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().msg == 'this and that'
+
+def test_seam_calls_and_emails_are_tagged():
+    """Test that Seam calls log under the caller's correlation id and emails carry it"""
+    seam = SeamService(api_key='test')
+    seam._client = SimpleNamespace(access_codes=SimpleNamespace(list=lambda device_id: ['code']))
+    handler = ListHandler()
+    handler.addFilter(ContextFilter())
+    seam_logger = logging.getLogger('app.services.seam_service')
+    seam_logger.addHandler(handler)
+    seam_logger.setLevel(logging.INFO)
+    try:
+        with correlation_context('req-2'):
+            assert seam.get_access_codes('lock-1') == ['code']
+    finally:
+        seam_logger.removeHandler(handler)
+        seam_logger.setLevel(logging.NOTSET)
+
+    [record] = handler.records
+    assert (record.event, record.operation, record.device_id) == ('seam.call', 'access_codes.list', 'lock-1')
+    assert record.correlation_id == 'req-2'
+
+    msg = MIMEMultipart()
+    with correlation_context('req-3'):
+        NotificationService(sms_config={'provider': 'local'})._tag(msg)
+    assert msg['X-Request-ID'] == 'req-3'
+
+def test_requests_get_an_id(client):
+    """Test that request ids are echoed, or generated when missing or malformed"""
+    response = client.get('/api/devices', headers={'X-Request-ID': 'edge-42'})
+    assert response.headers['X-Request-ID'] == 'edge-42'
+
+    generated = client.get('/api/devices', headers={'X-Request-ID': 'bad id <script>'}).headers['X-Request-ID']
+    assert len(generated) == 32 and generated != client.get('/api/devices').headers['X-Request-ID']
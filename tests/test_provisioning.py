@@ -0,0 +1,220 @@
+import time
+from datetime import datetime, timedelta, timezone
+from app.models.booking import Booking
+from app.services.provisioning_service import PROVISION_JOB, PROVISION_MAX_ATTEMPTS, ProvisioningService
+from app.services.reminder_service import REMINDER_JOB, ReminderService
+from app.services.scheduler_service import SchedulerService
+
+class RecordingNotifier:
+    """Stand-in for NotificationService that records the codes sent"""
+
+    def __init__(self):
+        self.sent = []
+
+    def notify_access_code(self, user, access_details):
+        self.sent.append((user.id, access_details['access_code_id']))
+
+class FailingSeamService:
+    """Seam stand-in whose code creation always fails"""
+
+    def create_access_code(self, device_id, code, name, starts_at, ends_at):
+        raise RuntimeError('lock offline')
+
+    def get_access_codes(self, device_id):
+        return []
+
+def make_service(store, seam):
+    notifier = RecordingNotifier()
+    service = ProvisioningService(
+        store, SchedulerService(seam, store), notifier,
+        ReminderService(store, notifier), background=False
+    )
+    return service, notifier
+
+def reserve(store, starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z'):
+    booking = Booking(device_id='lock-1', user_id='user-1', status='pending',
+                      starts_at=starts_at, ends_at=ends_at)
+    store.add_booking(booking)
+    return booking
+
+def test_async_booking_api(client, store):
+    """Test that an async booking answers 202 and becomes active in the background"""
+    response = client.post('/api/bookings', json={
+        'device_id': 'lock-1', 'user_name': 'Guest', 'user_email': 'guest@example.com', 'async': True,
+        'starts_at': '2030-01-01T10:00:00Z', 'ends_at': '2030-01-01T12:00:00Z'
+    })
+    assert response.status_code == 202
+    booking = response.get_json()['booking']
+    assert booking['status'] == 'pending'
+    assert response.headers['Location'].endswith(f"/api/bookings/{booking['id']}")
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        booking = client.get(f"/api/bookings/{booking['id']}").get_json()
+        if booking['status'] == 'active':
+            break
+        time.sleep(0.05)
+    assert booking['status'] == 'active'
+    assert booking['access_code_id']
+
+def test_pending_booking_becomes_active(store, fake_seam):
+    """Test the pending -> active path and that reservations hold their slot"""
+    service, notifier = make_service(store, fake_seam)
+    booking = reserve(store)
+
+    scheduler = service.scheduler_service
+    assert not scheduler.check_availability('lock-1', '2030-01-01T11:00:00Z', '2030-01-01T13:00:00Z')
+    assert scheduler.check_availability('lock-1', '2030-01-01T12:00:00Z', '2030-01-01T13:00:00Z')
+
+    service.submit(booking)
+    assert service.dispatch_due() == {'active': 1}
+    booking = store.get_booking(booking.id)
+    assert booking.status == 'active'
+    assert booking.access_code_id in fake_seam.codes
+    # The slot is now held by the code on the lock rather than the reservation
+    assert scheduler.get_reservations('lock-1') == []
+    assert not scheduler.check_availability('lock-1', '2030-01-01T11:00:00Z', '2030-01-01T13:00:00Z')
+
+def test_failed_provisioning_retries_then_fails(store):
+    """Test that failed creates are retried with backoff, then marked failed"""
+    service, notifier = make_service(store, FailingSeamService())
+    booking = reserve(store)
+    service.submit(booking)
+
+    now = datetime.now(timezone.utc)
+    assert service.dispatch_due(now) == {'retry': 1}
+    assert store.get_booking(booking.id).status == 'pending'
+    assert store.get_booking(booking.id).provisioning_error == 'lock offline'
+    # Not due again until the backoff has passed
+    assert service.dispatch_due(now) == {}
+
+    for _ in range(PROVISION_MAX_ATTEMPTS - 1):
+        now += timedelta(hours=1)
+        service.dispatch_due(now)
+    assert store.get_booking(booking.id).status == 'failed'
+    assert notifier.sent == []
+    assert service.dispatch_due(now + timedelta(hours=1)) == {}
+
+def test_claims_by_kind_and_stalled_jobs(store):
+    """Test that claims leave other kinds queued and stalled jobs are requeued"""
+    now = datetime.now(timezone.utc)
+    store.enqueue_job(REMINDER_JOB, now - timedelta(minutes=1), booking_id='b-1')
+    store.enqueue_job(PROVISION_JOB, now, booking_id='b-2')
+
+    claimed = store.claim_due_jobs(now, kinds=(PROVISION_JOB,))
+    assert [job['booking_id'] for job in claimed] == ['b-2']
+    assert store.claim_due_jobs(now, kinds=(PROVISION_JOB,)) == []
+
+    assert store.requeue_stalled_jobs(now - timedelta(minutes=5)) == 0
+    assert store.requeue_stalled_jobs(now + timedelta(minutes=5), kinds=(PROVISION_JOB,)) == 1
+    later = now + timedelta(minutes=10)
+    assert sorted(job['kind'] for job in store.claim_due_jobs(later)) == sorted([PROVISION_JOB, REMINDER_JOB])
+
+def test_far_bookings_wait_for_the_provisioning_window(store, fake_seam):
+    """Test that codes beyond the horizon are held locally, then pushed in a batch"""
+    service, notifier = make_service(store, fake_seam)
+    service.horizon_hours = 48
+    now = datetime.now(timezone.utc)
+    starts_at = now + timedelta(days=10)
+
+    assert service.deferred_until(now + timedelta(hours=24), now) is None
+    provision_at = service.deferred_until(starts_at, now)
+    assert provision_at == starts_at - timedelta(hours=48)
+
+    bookings = []
+    for hour in (0, 3):
+        booking = reserve(store, (starts_at + timedelta(hours=hour)).isoformat(),
+                          (starts_at + timedelta(hours=hour + 2)).isoformat())
+        booking.status = 'scheduled'
+        store.update_booking(booking)
+        service.submit(booking, due_at=provision_at)
+        bookings.append(booking)
+
+    # Nothing on the lock yet, but the slots are taken
+    assert service.dispatch_due(now) == {}
+    assert fake_seam.codes == {}
+    scheduler = service.scheduler_service
+    assert not scheduler.check_availability('lock-1', starts_at + timedelta(hours=1), starts_at + timedelta(hours=4))
+    assert scheduler.check_availability('lock-1', starts_at + timedelta(hours=2), starts_at + timedelta(hours=3))
+
+    assert service.dispatch_due(provision_at) == {'active': 2}
+    assert all(store.get_booking(b.id).status == 'active' for b in bookings)
+    assert len(fake_seam.codes) == 2
+
+def test_scheduled_booking_api(client, services, fake_seam):
+    """Test that a booking beyond the horizon is created as scheduled"""
+    services.provisioning_service.horizon_hours = 48
+    services.provisioning_service.background = False
+
+    response = client.post('/api/bookings', json={
+        'device_id': 'lock-1', 'user_name': 'Guest', 'user_email': 'guest@example.com',
+        'starts_at': '2030-01-01T10:00:00Z', 'ends_at': '2030-01-01T12:00:00Z'
+    })
+    assert response.status_code == 201
+    assert response.get_json()['booking']['status'] == 'scheduled'
+    assert fake_seam.codes == {}
+
+    assert client.post('/api/bookings', json={
+        'device_id': 'lock-1', 'user_name': 'Guest', 'user_email': 'guest@example.com',
+        'starts_at': '2030-01-01T11:00:00Z', 'ends_at': '2030-01-01T13:00:00Z'
+    }).status_code == 409
+    assert client.post('/api/provision-due-bookings').get_json()['outcomes'] == {}
+
+def test_cancellation_during_admission_is_not_overwritten(store, fake_seam):
+    """Test that a booking cancelled while capacity is checked stays cancelled"""
+    class CancellingCapacity:
+        def admit(self, device_id, starts_at, ends_at, exclude=None):
+            cancelled = store.get_booking(exclude)
+            cancelled.status = 'cancelled'
+            store.update_booking(cancelled)
+            return {'decision': 'admit', 'provision_at': None, 'slots': 0, 'peak_used': 0}
+
+    service, notifier = make_service(store, fake_seam)
+    service.capacity_service = CancellingCapacity()
+    booking = reserve(store)
+
+    service.submit(booking)
+    assert service.dispatch_due() == {'skipped': 1}
+    assert store.get_booking(booking.id).status == 'cancelled'
+    assert fake_seam.codes == {}
+    assert notifier.sent == []
+
+def test_cancellation_while_the_code_is_created_revokes_it(store, fake_seam):
+    """Test that a booking cancelled after its code was created is not saved back as active"""
+    service, notifier = make_service(store, fake_seam)
+    booking = reserve(store)
+    create = fake_seam.create_access_code
+
+    def create_then_cancel(**kwargs):
+        details = create(**kwargs)
+        cancelled = store.get_booking(booking.id)
+        cancelled.status = 'cancelled'
+        store.update_booking(cancelled)
+        return details
+    fake_seam.create_access_code = create_then_cancel
+
+    service.submit(booking)
+    assert service.dispatch_due() == {'cancelled': 1}
+    assert store.get_booking(booking.id).status == 'cancelled'
+    assert fake_seam.codes == {}
+    assert notifier.sent == []
+
+def test_booking_saved_while_provisioning_still_becomes_active(store, fake_seam):
+    """Test that another save during provisioning is kept rather than treated as a cancellation"""
+    service, notifier = make_service(store, fake_seam)
+    booking = reserve(store)
+    create = fake_seam.create_access_code
+
+    def create_then_touch(**kwargs):
+        details = create(**kwargs)
+        touched = store.get_booking(booking.id)
+        touched.access_code_status = 'set'
+        store.update_booking(touched)
+        return details
+    fake_seam.create_access_code = create_then_touch
+
+    service.submit(booking)
+    assert service.dispatch_due() == {'active': 1}
+    saved = store.get_booking(booking.id)
+    assert (saved.status, saved.access_code_status) == ('active', 'set')
+    assert saved.access_code_id in fake_seam.codes
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from app.models.booking import Booking
+from app.models.user import User
+
+def future(hours):
+    return (datetime.utcnow() + timedelta(hours=hours)).replace(microsecond=0).isoformat() + 'Z'
+
+def add_booking(store, fake_seam, with_code=True):
+    """Add a booking whose code is (optionally) present on the fake lock"""
+    store.add_user(User(id='user-1', name='Ann', email='ann@example.com'))
+    details = fake_seam.create_access_code('lock-1', '123456', 'Scheduled access for Ann', future(1), future(3))
+    if not with_code:
+        fake_seam.codes.clear()
+    booking = Booking(device_id='lock-1', user_id='user-1', access_code_id=details['access_code_id'],
+                      code='123456', starts_at=details['starts_at'], ends_at=details['ends_at'])
+    store.add_booking(booking)
+    return booking
+
+def test_in_sync_device_is_skipped_next_time(client, store, fake_seam):
+    """Test that a matching digest is remembered and the lock not re-listed"""
+    add_booking(store, fake_seam)
+
+    first = client.post('/api/reconcile', json={}).get_json()['devices']
+    assert first == [{'device_id': 'lock-1', 'status': 'in_sync', 'actions': []}]
+
+    fake_seam.calls.clear()
+    second = client.post('/api/reconcile', json={}).get_json()['devices']
+    assert second[0]['status'] == 'skipped'
+    assert fake_seam.calls == []
+
+def test_dry_run_then_apply_repairs_drift(client, store, fake_seam):
+    """Test that a missing code and an orphan code produce a plan that apply carries out"""
+    booking = add_booking(store, fake_seam, with_code=False)
+    orphan = fake_seam.create_access_code('lock-1', '999999', 'Scheduled access for Bob', future(5), future(6))
+
+    report = client.post('/api/reconcile', json={}).get_json()
+    assert report['dry_run'] is True
+    actions = {a['action']: a for a in report['devices'][0]['actions']}
+    assert set(actions) == {'create', 'delete'}
+    assert orphan['access_code_id'] in fake_seam.codes
+
+    report = client.post('/api/reconcile', json={'apply': True}).get_json()
+    assert all(a['result'] == 'applied' for a in report['devices'][0]['actions'])
+    assert orphan['access_code_id'] not in fake_seam.codes
+
+    repaired = store.get_booking(booking.id)
+    assert repaired.access_code_id in fake_seam.codes
+    assert fake_seam.codes[repaired.access_code_id].code == '123456'
+
+    report = client.post('/api/reconcile', json={}).get_json()
+    assert report['devices'][0]['status'] == 'in_sync'
+
+def test_relinks_code_recreated_outside_the_app(client, store, fake_seam):
+    """Test that a booking is pointed at an identical code instead of creating another"""
+    booking = add_booking(store, fake_seam, with_code=False)
+    twin = fake_seam.create_access_code('lock-1', '123456', 'Scheduled access for Ann',
+                                        booking.starts_at, booking.ends_at)
+
+    report = client.post('/api/reconcile', json={'apply': True}).get_json()
+    assert [a['action'] for a in report['devices'][0]['actions']] == ['relink']
+    assert store.get_booking(booking.id).access_code_id == twin['access_code_id']
+
+def test_unmanaged_codes_on_the_lock_are_not_drift(client, store, fake_seam):
+    """Test that a code created outside the app does not keep the device drifting"""
+    add_booking(store, fake_seam)
+    other = fake_seam.create_access_code('lock-1', '555555', 'Cleaner', future(2), future(4))
+
+    report = client.post('/api/reconcile', json={'apply': True}).get_json()
+    assert report['devices'] == [{'device_id': 'lock-1', 'status': 'in_sync', 'actions': []}]
+    assert other['access_code_id'] in fake_seam.codes
+
+    fake_seam.calls.clear()
+    assert client.post('/api/reconcile', json={}).get_json()['devices'][0]['status'] == 'skipped'
+    assert fake_seam.calls == []
+
+def test_codes_of_bookings_being_provisioned_are_kept(client, store, fake_seam):
+    """Test that apply never deletes a code pushed for a booking not yet marked active"""
+    recorded = add_booking(store, fake_seam)
+    recorded.status = 'provisioning'
+    store.update_booking(recorded)
+
+    starts_at, ends_at = future(5), future(7)
+    pushed = fake_seam.create_access_code('lock-1', '654321', 'Scheduled access for Ann', starts_at, ends_at)
+    store.add_booking(Booking(device_id='lock-1', user_id='user-1', status='provisioning',
+                              starts_at=starts_at, ends_at=ends_at))
+
+    report = client.post('/api/reconcile', json={'apply': True}).get_json()
+    assert report['devices'][0]['actions'] == []
+    assert {recorded.access_code_id, pushed['access_code_id']} <= set(fake_seam.codes)
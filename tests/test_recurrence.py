@@ -0,0 +1,65 @@
+import pytest
+from datetime import datetime, timezone
+from app.utils.recurrence import Recurrence, parse_rrule
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+def test_parse_rrule():
+    """Test that supported rule parts are parsed and others rejected"""
+    rule = parse_rrule('RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=10')
+    assert rule['freq'] == 'WEEKLY'
+    assert rule['interval'] == 2
+    assert rule['count'] == 10
+
+    for bad in ['FREQ=MONTHLY', 'FREQ=DAILY;BYDAY=MO', 'FREQ=DAILY;COUNT=0', 'COUNT=3']:
+        with pytest.raises(ValueError):
+            parse_rrule(bad)
+
+def test_overlap_is_arithmetic_on_unbounded_series():
+    """Test overlap far in the future without expanding earlier occurrences"""
+    series = Recurrence('FREQ=WEEKLY', '2030-01-07T09:00:00Z', '2030-01-07T11:00:00Z')
+
+    # Monday 10:00 roughly 20 years on is inside an occurrence
+    assert series.overlaps(utc(2050, 1, 3, 10), utc(2050, 1, 3, 10, 30))
+    # Tuesday of the same week is free
+    assert not series.overlaps(utc(2050, 1, 4, 10), utc(2050, 1, 4, 11))
+    # Touching the end of an occurrence is not an overlap
+    assert not series.overlaps(utc(2030, 1, 14, 11), utc(2030, 1, 14, 12))
+
+def test_count_and_until_bound_the_series():
+    """Test that no occurrences exist past COUNT or UNTIL"""
+    counted = Recurrence('FREQ=DAILY;COUNT=3', '2030-01-01T09:00:00Z', '2030-01-01T10:00:00Z')
+    assert counted.last_end() == utc(2030, 1, 3, 10)
+    assert not counted.overlaps(utc(2030, 1, 4, 9), utc(2030, 1, 4, 10))
+
+    until = Recurrence('FREQ=DAILY;UNTIL=2030-01-02T09:00:00Z', '2030-01-01T09:00:00Z', '2030-01-01T10:00:00Z')
+    assert len(list(until.occurrences())) == 2
+
+def test_occurrences_window_is_lazy():
+    """Test that expansion starts at the window rather than the first occurrence"""
+    series = Recurrence('FREQ=DAILY', '2030-01-01T09:00:00Z', '2030-01-01T10:00:00Z')
+    window = list(series.occurrences(utc(2031, 1, 1), utc(2031, 1, 3)))
+    assert window == [(utc(2031, 1, 1, 9), utc(2031, 1, 1, 10)), (utc(2031, 1, 2, 9), utc(2031, 1, 2, 10))]
+
+def test_series_against_series():
+    """Test overlap between series with different periods"""
+    weekly_monday = Recurrence('FREQ=WEEKLY', '2030-01-07T09:00:00Z', '2030-01-07T11:00:00Z')
+    every_third_day = Recurrence('FREQ=DAILY;INTERVAL=3', '2030-01-01T10:00:00Z', '2030-01-01T12:00:00Z')
+    every_other_week_tuesday = Recurrence('FREQ=WEEKLY;INTERVAL=2', '2030-01-08T09:00:00Z', '2030-01-08T11:00:00Z')
+
+    assert weekly_monday.overlaps_series(every_third_day)
+    assert not weekly_monday.overlaps_series(every_other_week_tuesday)
+
+def test_rules_are_bounded():
+    """Test that huge INTERVAL or COUNT values and series ending too late are rejected"""
+    for bad in ['FREQ=DAILY;COUNT=1000000000', 'FREQ=DAILY;INTERVAL=999983', 'FREQ=WEEKLY;COUNT=10000;INTERVAL=366',
+                'FREQ=DAILY;UNTIL=9500-01-01T00:00:00Z']:
+        with pytest.raises(ValueError):
+            Recurrence(bad, '2030-01-01T09:00:00Z', '2030-01-01T10:00:00Z')
+
+def test_series_overlap_stops_at_the_latest_datetime():
+    """Test that a cycle running past the supported range is searched without overflowing"""
+    first = Recurrence('FREQ=DAILY;INTERVAL=359', '8990-01-01T09:00:00Z', '8990-01-01T10:00:00Z')
+    second = Recurrence('FREQ=WEEKLY;INTERVAL=366', '8990-01-02T09:00:00Z', '8990-01-02T10:00:00Z')
+    assert first.overlaps_series(second) is False
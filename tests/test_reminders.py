@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+from app.models.booking import Booking
+from app.models.user import User
+from app.services.booking_store import BookingStore
+from app.services.reminder_service import ReminderService, REMINDER_MAX_ATTEMPTS, REMINDER_STALL_SECONDS
+from app.utils.time_utils import VirtualClock, use_clock
+
+NOW = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+class RecordingNotifier:
+    """Stand-in for NotificationService that records reminder batches"""
+
+    def __init__(self, ok=True):
+        self.batches = []
+        self.ok = ok
+
+    def send_expiration_reminders(self, reminders, hours_before=24):
+        self.batches.append(reminders)
+        return [self.ok] * len(reminders)
+
+def add_booking(store, ends_in_hours, code='123456'):
+    user = User(id=f"user-{ends_in_hours}", name='Guest', email='guest@example.com')
+    store.add_user(user)
+    booking = Booking(
+        device_id='lock-1', user_id=user.id, access_code_id='ac_1', code=code,
+        starts_at=(NOW - timedelta(hours=1)).isoformat(),
+        ends_at=(NOW + timedelta(hours=ends_in_hours)).isoformat()
+    )
+    store.add_booking(booking)
+    return booking
+
+def test_jobs_are_ordered_by_due_time_and_survive_restart(store):
+    """Test that the heap is rebuilt from the job log by a new store instance"""
+    late = add_booking(store, 48)
+    soon = add_booking(store, 30)
+    service = ReminderService(store, RecordingNotifier(), hours_before=24)
+    service.schedule_reminder(late)
+    service.schedule_reminder(soon)
+
+    reopened = BookingStore(data_dir=store.data_dir)
+    assert reopened.next_job_due() == NOW + timedelta(hours=6)
+    assert [job['booking_id'] for job in reopened.claim_due_jobs(NOW + timedelta(days=3))] == [soon.id, late.id]
+    assert store.next_job_due() is None
+
+def test_dispatch_sends_due_reminders_in_batches(store):
+    """Test that only due reminders are sent, a batch per SMTP connection"""
+    bookings = [add_booking(store, hours) for hours in (1, 2, 3, 100)]
+    notifier = RecordingNotifier()
+    service = ReminderService(store, notifier, hours_before=24)
+    for booking in bookings:
+        service.schedule_reminder(booking)
+
+    counts = service.dispatch_due(now=NOW, batch_size=2)
+
+    assert counts == {'sent': 3, 'skipped': 0, 'failed': 0}
+    assert [len(batch) for batch in notifier.batches] == [2, 1]
+    assert service.seconds_until_next(now=NOW) == 300
+    assert store.next_job_due() == NOW + timedelta(hours=76)
+
+def test_cancelled_and_failed_reminders(store):
+    """Test that cancelled bookings get no reminder and failures are retried a few times"""
+    cancelled = add_booking(store, 1)
+    failing = add_booking(store, 2)
+    notifier = RecordingNotifier(ok=False)
+    service = ReminderService(store, notifier, hours_before=24)
+    service.schedule_reminder(cancelled)
+    service.schedule_reminder(failing)
+    assert service.cancel_reminders(cancelled.id) == 1
+
+    now = NOW
+    for _ in range(REMINDER_MAX_ATTEMPTS):
+        assert service.dispatch_due(now=now)['failed'] == 1
+        now += timedelta(hours=1)
+
+    assert sum(len(batch) for batch in notifier.batches) == REMINDER_MAX_ATTEMPTS
+    assert store.get_job(f"expiration_reminder:{failing.id}")['status'] == 'failed'
+    assert store.get_job(f"expiration_reminder:{cancelled.id}")['status'] == 'cancelled'
+
+def test_reminders_left_running_by_a_dead_dispatcher_are_sent(store):
+    """Test that a reminder claimed by a process that died is queued again once it stalls"""
+    with use_clock(VirtualClock('2030-01-01T00:00:00Z')) as clock:
+        booking = add_booking(store, 1)
+        notifier = RecordingNotifier()
+        service = ReminderService(store, notifier, hours_before=24)
+        service.schedule_reminder(booking)
+        assert len(store.claim_due_jobs(NOW)) == 1
+
+        assert service.dispatch_due()['sent'] == 0
+        clock.advance(REMINDER_STALL_SECONDS + 1)
+        assert service.dispatch_due()['sent'] == 1
+        assert store.get_job(f"expiration_reminder:{booking.id}")['status'] == 'done'
+
+def test_booking_api_schedules_and_cancels_reminder(client, store):
+    """Test that creating a booking queues its reminder and cancelling it removes it"""
+    start = datetime.utcnow() + timedelta(days=2)
+    booking = client.post('/api/bookings', json={
+        'device_id': 'lock-1',
+        'starts_at': start.isoformat() + 'Z',
+        'ends_at': (start + timedelta(hours=2)).isoformat() + 'Z',
+        'user_name': 'Guest',
+        'user_email': 'guest@example.com'
+    }).get_json()['booking']
+    assert store.next_job_due() is not None
+
+    assert client.delete(f"/api/bookings/{booking['id']}").status_code == 200
+    assert store.next_job_due() is None
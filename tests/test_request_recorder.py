@@ -0,0 +1,58 @@
+import os
+from app import create_app
+from app.utils.request_recorder import TRACE_FILE
+from scripts.replay_traffic import TrafficReplayer, load_traces, percentile, start_local_instance
+
+BOOKING = {
+    'device_id': 'lock-1', 'user_name': 'Ada Lovelace', 'user_email': 'ada@example.org',
+    'user_phone': '+15551234567', 'starts_at': '2030-01-01T10:00:00Z', 'ends_at': '2030-01-01T12:00:00Z'
+}
+
+def record(services, trace_dir):
+    """Make a few requests through a recording app and return its traces"""
+    app = create_app({'TESTING': True, 'REQUEST_RECORDING': True, 'REQUEST_RECORDING_DIR': str(trace_dir)},
+                     services=services)
+    client = app.test_client()
+    booking_id = client.post('/api/bookings', json=BOOKING).get_json()['booking']['id']
+    client.get(f'/api/bookings/{booking_id}')
+    client.get('/api/check-availability?device_id=lock-1'
+               '&starts_at=2030-01-01T11:00:00Z&ends_at=2030-01-01T13:00:00Z')
+    app.extensions['request_recorder'].close()
+    return booking_id
+
+def test_traces_are_anonymized(services, tmp_path):
+    """Test that traces keep the request shape but no personal data or real IDs"""
+    booking_id = record(services, tmp_path)
+    with open(os.path.join(tmp_path, TRACE_FILE)) as f:
+        raw = f.read()
+    for secret in ('Ada', 'ada@example.org', '5551234567', booking_id):
+        assert secret not in raw
+
+    create, lookup, probe = load_traces([os.path.join(tmp_path, TRACE_FILE)])
+    assert (create['method'], create['route'], create['status']) == ('POST', '/api/bookings', 201)
+    assert create['body']['device_id'] == 'lock-1'
+    assert create['body']['user_email'].endswith('@example.com')
+    assert lookup['route'] == '/api/bookings/<booking_id>'
+    assert lookup['path'] == f"/api/bookings/{create['created']}"
+    assert probe['query']['starts_at'] == ['2030-01-01T11:00:00Z']
+    assert all(trace['duration_ms'] >= 0 for trace in (create, lookup, probe))
+
+def test_replay_against_local_instance(services, tmp_path):
+    """Test that a replay recreates bookings and reports per-route latency"""
+    record(services, tmp_path)
+    traces = load_traces([os.path.join(tmp_path, TRACE_FILE)])
+
+    summary = TrafficReplayer(start_local_instance(), speed=0, concurrency=1).replay(traces)
+    assert summary['requests'] == 3
+    assert summary['overall']['errors'] == 0
+    # The lookup found the booking the replay created, and the probe saw it
+    assert summary['overall']['status_mismatches'] == 0
+    assert summary['routes']['GET /api/bookings/<booking_id>']['p50_ms'] is not None
+
+def test_percentile():
+    """Test nearest-rank percentiles"""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 90) == 7
+    assert percentile([], 50) is None
@@ -0,0 +1,81 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+from app import create_app
+from app.services.container import ServiceContainer
+from app.services.shared_cache import SharedCache
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'cache')
+
+def small_cache(path, **kwargs):
+    return SharedCache(path, entry_slots=64, entry_size=512, device_slots=16, **kwargs)
+
+def test_entries_are_shared_between_instances(cache_path):
+    """Test that two mappings of one file (two workers) see the same entries"""
+    worker_a, worker_b = small_cache(cache_path), small_cache(cache_path)
+
+    worker_a.set('lock-1', 'periods', [{'starts_at': 'x'}], worker_a.version('lock-1'))
+    assert worker_b.get('lock-1', 'periods') == [{'starts_at': 'x'}]
+    assert worker_b.get('lock-2', 'periods') is None
+
+    worker_b.invalidate('lock-1')
+    assert worker_a.get('lock-1', 'periods') is None
+
+def test_value_computed_during_a_change_is_not_served(cache_path):
+    """Test that a value stored with a version read before an invalidation is a miss"""
+    cache = small_cache(cache_path)
+    version = cache.version('lock-1')
+    cache.invalidate('lock-1')
+    cache.set('lock-1', 'periods', [], version)
+    assert cache.get('lock-1', 'periods') is None
+
+def test_oversized_and_expired_values(cache_path):
+    """Test that values larger than a slot are skipped and old entries expire"""
+    cache = small_cache(cache_path, ttl_seconds=0)
+    assert cache.set('lock-1', 'big', 'x' * 1000, 0) is False
+
+    cache.set('lock-1', 'small', 'x', cache.version('lock-1'))
+    time.sleep(0.01)
+    assert cache.get('lock-1', 'small') is None
+
+def test_lock_listing_cached_until_booking_written(tmp_path, store, fake_seam, services):
+    """Test that availability checks reuse the lock listing until the device's bookings change"""
+    cache = small_cache(str(tmp_path / 'cache'))
+    store.add_listener(cache.invalidate)
+    services = ServiceContainer(
+        booking_store=store, seam_service=fake_seam, shared_cache=cache,
+        notification_service=services.notification_service
+    )
+    client = create_app({'TESTING': True}, services=services).test_client()
+
+    start = datetime.utcnow() + timedelta(days=1)
+    query = (f"device_id=lock-1&starts_at={start.isoformat()}Z"
+             f"&ends_at={(start + timedelta(hours=1)).isoformat()}Z")
+    assert client.get(f'/api/check-availability?{query}').get_json()['is_available'] is True
+    assert client.get(f'/api/check-availability?{query}').get_json()['is_available'] is True
+    assert fake_seam.calls.count(('list', 'lock-1')) == 1
+
+    response = client.post('/api/bookings', json={
+        'device_id': 'lock-1',
+        'starts_at': start.isoformat() + 'Z',
+        'ends_at': (start + timedelta(hours=1)).isoformat() + 'Z',
+        'user_name': 'Guest',
+        'user_email': 'guest@example.com'
+    })
+    assert response.status_code == 201
+    assert client.get(f'/api/check-availability?{query}').get_json()['is_available'] is False
+
+def test_geometry_change_replaces_file_without_shrinking_mappings(cache_path):
+    """Test that a cache with another layout gets a new file while old mappings stay readable"""
+    old = SharedCache(cache_path, entry_slots=128, entry_size=512, device_slots=16)
+    old.set('lock-1', 'periods', ['x'], old.version('lock-1'))
+
+    new = small_cache(cache_path)
+    assert new.get('lock-1', 'periods') is None
+    new.set('lock-1', 'periods', ['y'], new.version('lock-1'))
+
+    # The old mapping still covers a whole file instead of a truncated one
+    assert old.get('lock-1', 'periods') == ['x']
+    assert small_cache(cache_path).get('lock-1', 'periods') == ['y']
@@ -0,0 +1,88 @@
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from app.services.sms_service import SMSProvider, SMSService, LocalSMSProvider, RateLimiter
+
+class BlockingProvider(SMSProvider):
+    """Provider that records batch sizes and can hold senders until released"""
+
+    name = 'blocking'
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.batches = []
+        self.fail = fail
+
+    def send_batch(self, messages):
+        self.started.set()
+        self.release.wait(5)
+        self.batches.append(len(messages))
+        if self.fail:
+            raise RuntimeError("provider down")
+        return [{'status': 'sent'} for _ in messages]
+
+def test_messages_are_sent_in_background_batches():
+    """Test that queued messages go out in batches and report their status"""
+    provider = BlockingProvider()
+    sms = SMSService(provider, workers=1, batch_size=10)
+
+    first = sms.send('+15550000', 'one')
+    # The sender picks up the first message and blocks
+    assert provider.started.wait(5)
+    rest = [sms.send('+15550000', str(i)) for i in range(5)]
+    assert sms.get_status(rest[0])['status'] == 'queued'
+
+    provider.release.set()
+    assert sms.flush(timeout=5)
+    assert provider.batches == [1, 5]
+    assert all(sms.get_status(m)['status'] == 'sent' for m in [first] + rest)
+
+def test_failures_and_full_queue_are_tracked():
+    """Test that provider errors and overflow are recorded rather than raised"""
+    provider = BlockingProvider(fail=True)
+    sms = SMSService(provider, workers=1, batch_size=1, queue_size=1)
+
+    first = sms.send('+15550000', 'one')
+    assert provider.started.wait(5)
+    queued = sms.send('+15550000', 'two')
+    dropped = sms.send('+15550000', 'three')
+
+    provider.release.set()
+    assert sms.flush(timeout=5)
+    assert sms.get_status(first)['status'] == 'failed'
+    assert sms.get_status(queued)['error'] == 'provider down'
+    assert sms.get_status(dropped)['status'] == 'dropped'
+
+def test_rate_limiter_spaces_sends():
+    """Test that the token bucket holds the sustained rate after its burst"""
+    limiter = RateLimiter(50, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.09
+
+def test_access_code_sms_uses_provider(services):
+    """Test that the notification service queues access code texts through its provider"""
+    notifications = services.notification_service
+    start = datetime.utcnow() + timedelta(days=1)
+    message_id = notifications.send_access_code_sms('+15551234', {
+        'code': '4821',
+        'starts_at': start.isoformat() + 'Z',
+        'ends_at': (start + timedelta(hours=2)).isoformat() + 'Z'
+    })
+
+    assert notifications.sms_service.flush(timeout=5)
+    assert notifications.sms_status(message_id)['status'] == 'sent'
+    assert isinstance(notifications.sms_service.provider, LocalSMSProvider)
+    assert '4821' in notifications.sms_service.provider.outbox[0]['body']
+
+def test_provider_must_implement_send_batch():
+    """Test that a provider without send_batch cannot be created"""
+    class Incomplete(SMSProvider):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
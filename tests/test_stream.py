@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+from app.models.booking import Booking
+from app.services.booking_store import BookingStore
+from app.services.change_bus import ChangeBus
+
+def make_booking(device_id='lock-1'):
+    return Booking(device_id=device_id, access_code_id='ac_1', code='1234',
+                   starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z')
+
+def parse_events(body):
+    """Split a text/event-stream body into (event, id, data) tuples"""
+    events = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], fields.get('id'), fields.get('data')))
+    return events
+
+def test_resume_tokens_are_per_device_and_epoch_scoped():
+    """Test that a token resumes after its change, for one device, on one bus only"""
+    bus = ChangeBus(history=2)
+    start = bus.current_token()
+    first = bus.publish('lock-1', 'booking.created', {'booking_id': 'a'})
+    bus.publish('lock-2', 'booking.created', {'booking_id': 'b'})
+
+    assert [c['data']['booking_id'] for c in bus.changes_since('lock-1', start)] == ['a']
+    assert bus.changes_since('lock-1', first['id']) == []
+    assert bus.wait('lock-1', first['id'], 0) == []
+
+    # A token from another process or an earlier run cannot be resumed
+    assert bus.changes_since('lock-1', ChangeBus().current_token()) is None
+    assert bus.changes_since('lock-1', 'garbage') is None
+
+    # Nor can one whose changes have fallen out of the history
+    bus.publish('lock-1', 'booking.cancelled', {'booking_id': 'a'})
+    bus.publish('lock-1', 'booking.expired', {'booking_id': 'c'})
+    assert bus.changes_since('lock-1', start) is None
+    assert len(bus.changes_since('lock-1', first['id'])) == 2
+
+def test_store_reports_changes_written_by_another_process(tmp_path):
+    """Test that change listeners see new rows from other stores but not the initial load"""
+    writer = BookingStore(data_dir=str(tmp_path))
+    writer.add_booking(make_booking())
+
+    reader = BookingStore(data_dir=str(tmp_path))
+    bus = ChangeBus(poll=reader.refresh)
+    reader.refresh()
+    reader.add_change_listener(bus.publish_booking_row)
+    token = bus.current_token()
+
+    booking = make_booking()
+    writer.add_booking(booking)
+    booking.status = 'cancelled'
+    writer.update_booking(booking)
+
+    changes = bus.wait('lock-1', token, 1)
+    assert [(c['type'], c['data']['booking_id']) for c in changes] == [
+        ('booking.created', booking.id), ('booking.cancelled', booking.id)
+    ]
+    assert changes[0]['data']['access_code_id'] == 'ac_1'
+
+def test_streams_reset_when_another_process_rebuilds_the_log(tmp_path):
+    """Test that changes hidden by another process's compaction invalidate every token"""
+    writer = BookingStore(data_dir=str(tmp_path))
+    writer.add_booking(make_booking())
+
+    reader = BookingStore(data_dir=str(tmp_path))
+    bus = ChangeBus(poll=reader.refresh)
+    reader.refresh()
+    reader.add_change_listener(bus.publish_booking_row)
+    reader.add_reset_listener(bus.reset)
+    token = bus.current_token()
+
+    expired = make_booking(device_id='lock-2')
+    expired.status = 'expired'
+    writer.add_booking(expired)
+    writer.archive_finished(datetime(2031, 1, 1, tzinfo=timezone.utc))
+
+    assert bus.wait('lock-1', token, 1) is None
+    assert bus.wait('lock-1', bus.current_token(), 0) == []
+
+def test_stream_endpoint_sends_changes_after_token(app, services):
+    """Test that GET /api/stream replays changes after a token and resets on a stale one"""
+    client = app.test_client()
+    token = services.change_bus.current_token()
+
+    start = datetime.utcnow() + timedelta(days=1)
+    response = client.post('/api/bookings', json={
+        'device_id': 'lock-1',
+        'starts_at': start.isoformat() + 'Z',
+        'ends_at': (start + timedelta(hours=1)).isoformat() + 'Z',
+        'user_name': 'Guest',
+        'user_email': 'guest@example.com'
+    })
+    assert response.status_code == 201
+    booking = response.get_json()['booking']
+
+    response = client.get(f'/api/stream?device_id=lock-1&after={token}&timeout=0.1')
+    assert response.mimetype == 'text/event-stream'
+    events = parse_events(response.get_data(as_text=True))
+    assert [event for event, _, _ in events] == ['booking.created']
+    assert booking['id'] in events[0][2]
+
+    response = client.get('/api/stream?device_id=lock-1&timeout=0.1',
+                          headers={'Last-Event-ID': 'stale-1'})
+    assert [event for event, _, _ in parse_events(response.get_data(as_text=True))] == ['reset']
+
+    assert client.get('/api/stream').status_code == 400
@@ -0,0 +1,84 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from app.api.validators import validate_booking_data, Field, Schema, ValidationError, ends_after_starts
+
+def booking_payload(**overrides):
+    start = datetime.utcnow() + timedelta(days=1)
+    payload = {
+        'device_id': 'lock-1',
+        'starts_at': start.isoformat() + 'Z',
+        'ends_at': (start + timedelta(hours=2)).isoformat() + 'Z',
+        'user_name': 'Guest',
+        'user_email': 'guest@example.com'
+    }
+    payload.update(overrides)
+    return payload
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'starts_at': 'tomorrow'}, 'Invalid start time format'),
+    ({'starts_at': '2020-01-01T10:00:00Z', 'ends_at': '2020-01-01T12:00:00Z'}, 'in the past'),
+    ({'user_email': 'not-an-email'}, 'Invalid email'),
+    ({'user_phone': '12'}, 'Invalid phone'),
+    ({'device_id': ''}, 'Device ID is required'),
+    ({'recurrence': 'FREQ=HOURLY'}, 'FREQ'),
+    ({'recurrence': 'FREQ=DAILY;COUNT=1000000000'}, 'COUNT'),
+    ({'recurrence': 'FREQ=DAILY;INTERVAL=999983'}, 'INTERVAL'),
+    ({'recurrence': 'FREQ=WEEKLY;INTERVAL=366;COUNT=10000'}, 'year 9000'),
+])
+def test_invalid_bookings_never_reach_seam(client, fake_seam, overrides, message):
+    """Test that bad booking input is a 400 before any lock call"""
+    response = client.post('/api/bookings', json=booking_payload(**overrides))
+
+    assert response.status_code == 400
+    assert message in response.get_data(as_text=True)
+    assert fake_seam.calls == []
+
+def test_validate_booking_data():
+    """Test the tuple-returning helper built on the booking schema"""
+    assert validate_booking_data(booking_payload()) == (True, None)
+    start = datetime.utcnow() + timedelta(days=1)
+    assert validate_booking_data(booking_payload(ends_at=(start + timedelta(hours=80)).isoformat())) == \
+        (False, "Booking duration cannot exceed 72 hours.")
+
+def test_schema_parses_values_once():
+    """Test that parsed values (aware datetimes, lists, bools) come out of the schema"""
+    schema = Schema({
+        'starts_at': Field('datetime', required=True),
+        'ends_at': Field('datetime', required=True),
+        'apply': Field('bool', default=False),
+        'ids': Field('list', items=Field(pattern=r'^[a-z]+$')),
+    }, checks=(ends_after_starts(),))
+
+    params = schema.validate({'starts_at': '2030-01-01T10:00:00Z', 'ends_at': '2030-01-01T12:00:00+01:00',
+                              'apply': 'true', 'ids': ['a', 'b']})
+    assert params['starts_at'] == datetime(2030, 1, 1, 10, tzinfo=timezone.utc)
+    assert params['apply'] is True and params['ids'] == ['a', 'b']
+
+    with pytest.raises(ValidationError):
+        schema.validate({'starts_at': '2030-01-01T10:00:00Z', 'ends_at': '2030-01-01T10:30:00+01:00'})
+    with pytest.raises(ValidationError):
+        schema.validate({'starts_at': '2030-01-01T10:00:00Z', 'ends_at': '2030-01-01T11:00:00Z', 'ids': ['A']})
+
+@pytest.mark.parametrize('method, url, body', [
+    ('get', '/api/check-availability?device_id=lock-1&starts_at=2030-01-01&ends_at=soon', None),
+    ('get', '/api/check-availability?device_id=lock-1&starts_at=2030-01-01T10:00:00Z'
+            '&ends_at=2030-01-01T11:00:00Z&recurrence=FREQ=DAILY;INTERVAL=999983', None),
+    ('get', '/api/booked-periods?device_id=lock-1&start=2030-01-02T00:00:00Z&end=2030-01-01T00:00:00Z', None),
+    ('get', '/api/free-slots?device_id=lock-1&min_duration=-5', None),
+    ('get', '/api/free-slots?device_id=lock-1&min_duration=inf', None),
+    ('get', '/api/free-slots?device_id=lock-1&granularity=1e300', None),
+    ('get', '/api/free-slots?device_id=lock-1&start=9999-12-31T23:00:00Z', None),
+    ('get', '/api/scheduler-view?start=9999-12-31T23:00:00Z', None),
+    ('get', '/api/capacity?start=9999-12-31T23:00:00Z', None),
+    ('get', '/api/stream?device_id=lock-1&timeout=nan', None),
+    ('post', '/api/archive-finished-bookings', {'retention_days': 1e300}),
+    ('post', '/api/reconcile', {'device_ids': 'lock-1'}),
+    ('post', '/api/reconcile', {'apply': 'maybe'}),
+    ('post', '/api/cleanup-expired-codes', {}),
+    ('post', '/api/provision-upcoming-occurrences', [1, 2]),
+])
+def test_routes_reject_bad_input_without_lock_calls(client, fake_seam, method, url, body):
+    """Test that every validated route answers 400 without touching the lock"""
+    response = getattr(client, method)(url, json=body) if body is not None else getattr(client, method)(url)
+    assert response.status_code == 400
+    assert fake_seam.calls == []
@@ -0,0 +1,77 @@
+import json
+import time
+import pytest
+from app.models.booking import Booking
+from app.services.webhook_service import WebhookService
+
+SECRET = 'whsec_dGVzdC1zZWNyZXQ='
+
+@pytest.fixture(autouse=True)
+def webhook_secret(services):
+    services.webhook_service.secret = SECRET
+
+def post_event(client, event, timestamp=None):
+    """Post an event signed the way Seam (Svix) signs it"""
+    body = json.dumps(event).encode()
+    timestamp = timestamp or int(time.time())
+    signature = WebhookService(None, secret=SECRET).sign('msg_1', timestamp, body)
+    return client.post('/webhooks/seam', data=body, headers={
+        'Content-Type': 'application/json',
+        'svix-id': 'msg_1',
+        'svix-timestamp': str(timestamp),
+        'svix-signature': signature
+    })
+
+def test_access_code_event_updates_booking_once(client, store):
+    """Test that an event updates its booking and duplicates are skipped"""
+    booking = Booking(device_id='lock-1', access_code_id='ac_1',
+                      starts_at='2030-01-01T10:00:00Z', ends_at='2030-01-01T12:00:00Z')
+    store.add_booking(booking)
+    event = {'event_id': 'evt_1', 'event_type': 'access_code.set_on_device',
+             'access_code_id': 'ac_1', 'device_id': 'lock-1'}
+
+    assert post_event(client, event).get_json()['status'] == 'processed'
+    assert store.get_booking(booking.id).access_code_status == 'set'
+
+    assert post_event(client, event).get_json()['status'] == 'duplicate'
+    assert len(list(store.iter_events())) == 1
+
+def test_device_event_and_replay(client, store, services):
+    """Test device state tracking and rebuilding state from the event log"""
+    post_event(client, {'event_id': 'evt_2', 'event_type': 'device.disconnected', 'device_id': 'lock-1'})
+    assert store.get_device_state('lock-1')['status'] == 'offline'
+
+    store.set_device_state('lock-1', 'online')
+    assert services.webhook_service.replay() == 1
+    assert store.get_device_state('lock-1')['status'] == 'offline'
+
+def test_rejects_bad_signatures(client, services):
+    """Test that unsigned, wrongly signed and stale requests are refused"""
+    event = {'event_id': 'evt_3', 'event_type': 'device.connected', 'device_id': 'lock-1'}
+
+    assert client.post('/webhooks/seam', json=event).status_code == 401
+    assert post_event(client, event, timestamp=int(time.time()) - 3600).status_code == 401
+
+    services.webhook_service.secret = 'whsec_b3RoZXI='
+    response = client.post('/webhooks/seam', data=json.dumps(event), headers={
+        'svix-id': 'msg_1', 'svix-timestamp': str(int(time.time())), 'svix-signature': 'v1,AAAA'
+    })
+    assert response.status_code == 401
+
+def test_event_that_fails_to_apply_is_applied_on_retry(store, services, monkeypatch):
+    """Test that an event is only deduplicated once it has been applied"""
+    service = services.webhook_service
+    apply_event = service.apply_event
+    def fail_once(event):
+        monkeypatch.setattr(service, 'apply_event', apply_event)
+        raise OSError("disk full")
+    monkeypatch.setattr(service, 'apply_event', fail_once)
+    event = {'event_id': 'evt_4', 'event_type': 'device.disconnected', 'device_id': 'lock-1'}
+
+    with pytest.raises(OSError):
+        service.ingest('evt_4', event)
+    assert list(store.iter_events()) == []
+
+    assert service.ingest('evt_4', event) == 'processed'
+    assert store.get_device_state('lock-1')['status'] == 'offline'
+    assert service.ingest('evt_4', event) == 'duplicate'
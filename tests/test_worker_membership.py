@@ -0,0 +1,64 @@
+from app.services.worker_membership import HashRing, WorkerMembership
+from app.utils.time_utils import VirtualClock, use_clock
+from workers.cleanup_worker import CleanupWorker
+
+DEVICES = [f"lock-{n}" for n in range(200)]
+
+def test_hash_ring_moves_few_keys_when_a_member_joins():
+    """Test that keys spread over members and mostly stay put when one joins"""
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+
+    shares = [sum(1 for device in DEVICES if before.owner(device) == member) for member in 'abc']
+    assert all(share > len(DEVICES) / 6 for share in shares)
+
+    moved = [device for device in DEVICES if before.owner(device) != after.owner(device)]
+    assert all(after.owner(device) == 'd' for device in moved)
+    assert len(moved) < len(DEVICES) / 2
+    assert HashRing([]).owner('lock-1') is None
+
+def test_members_split_devices_and_fail_over(tmp_path):
+    """Test that live members share the devices and take over when one dies"""
+    with use_clock(VirtualClock('2030-01-01T00:00:00Z')) as clock:
+        first = WorkerMembership(str(tmp_path), member_id='w1', lease_seconds=60)
+        second = WorkerMembership(str(tmp_path), member_id='w2', lease_seconds=60)
+        first.renew()
+        clock.advance(1)
+        assert second.renew() == ['w1', 'w2']
+        first.renew()
+
+        assert set(first.share(DEVICES)).isdisjoint(second.share(DEVICES))
+        assert len(first.share(DEVICES)) + len(second.share(DEVICES)) == len(DEVICES)
+        assert first.is_leader() and not second.is_leader()
+
+        # w1 stops renewing; once its lease expires w2 has every device and leads
+        clock.advance(45)
+        second.renew()
+        clock.advance(30)
+        assert second.renew() == ['w2']
+        assert second.share(DEVICES) == DEVICES
+        assert second.is_leader()
+
+        # A member that leaves hands over at once
+        first.renew()
+        assert first.members == ['w1', 'w2']
+        second.leave()
+        assert first.renew() == ['w1']
+
+def test_cleanup_worker_only_sweeps_its_devices(tmp_path, fake_seam):
+    """Test that a worker in a group only cleans the devices it owns"""
+    config = {'devices': DEVICES[:20], 'reconcile_mode': None}
+    workers = [
+        CleanupWorker(config=config, seam_service=fake_seam,
+                      membership=WorkerMembership(str(tmp_path), member_id=member_id))
+        for member_id in ('w1', 'w2')
+    ]
+    for worker in workers:
+        worker.renew_membership()
+    for worker in workers:
+        worker.renew_membership()
+        worker.cleanup_expired_codes()
+
+    swept = [device_id for call, device_id in fake_seam.calls if call == 'delete_expired']
+    assert sorted(swept) == sorted(DEVICES[:20])
+    assert sum(worker.is_leader() for worker in workers) == 1
@@ -1,71 +1,212 @@
+import logging
 import sys
 import os
-import time
 import json
+import signal
 import requests
-from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from datetime import timedelta
 
 # Add the parent directory to the Python path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.services.seam_service import SeamService
+from app.services.worker_membership import WorkerMembership
 from app.models.booking import Booking
-from app.utils.time_utils import get_current_utc_iso
+from app.utils.logging_config import REQUEST_ID_HEADER, configure_logging, correlation_context, get_correlation_id
+from app.utils.time_utils import get_current_utc_iso, sleep
+
+logger = logging.getLogger('workers.cleanup')
 
 class CleanupWorker:
-    def __init__(self, config=None):
+    def __init__(self, config=None, seam_service=None, http=None, membership=None):
         """
         Initialize the cleanup worker
         
+        Times come from time_utils' process-wide clock, so a simulation can
+        run the worker on a VirtualClock.
+        
+        Several workers can run side by side: workers sharing a membership
+        directory split the devices between them by consistent hashing, and
+        only the group's leader runs the group-wide tasks (provisioning and
+        archiving). A worker that dies drops out of the group when its lease
+        expires and the others take over its devices.
+        
         Args:
             config (dict, optional): Configuration options
+            seam_service (SeamService, optional): Seam client (default: a real one)
+            http (optional): Object with requests' request(method, url, ...) used
+                             to call the API (default: the requests module)
+            membership (WorkerMembership, optional): Group to share the work with
+                                                     (default: one in the config's
+                                                     membership_dir, if any)
         """
         self.config = config or {
             'check_interval_seconds': 3600,  # Check every hour
             'api_base_url': 'http://localhost:5000/api',
-            'devices': ['mock-device-001']  # List of device IDs to check
+            'devices': ['mock-device-001'],  # List of device IDs to check
+            'reconcile_mode': 'dry_run',  # 'dry_run' reports drift, 'apply' repairs it, None skips
+            'archive_retention_days': None,  # Days finished bookings stay hot (None: server default)
+            'membership_dir': os.path.join(os.getenv('DATA_DIR', 'data'), 'workers'),  # Shared by the group (None: work alone)
+            'heartbeat_seconds': 30  # Lease renewal interval while sleeping
+        }
+        
+        self.seam_service = seam_service or SeamService()
+        self.http = http or requests
+        if membership is None and self.config.get('membership_dir'):
+            membership = WorkerMembership(self.config['membership_dir'])
+        self.membership = membership
+    
+    def owned_devices(self, device_ids):
+        """Get the devices this worker handles (all of them when working alone)"""
+        if self.membership is None:
+            return list(device_ids)
+        return self.membership.share(device_ids)
+    
+    def is_leader(self):
+        """Check whether this worker runs the group-wide tasks"""
+        return self.membership is None or self.membership.is_leader()
+    
+    def renew_membership(self):
+        """Renew this worker's lease and pick up members that joined or died"""
+        if self.membership is None:
+            return
+        try:
+            previous = self.membership.members
+            members = self.membership.renew()
+            if members != previous:
+                logger.info("Worker group changed: %d members, leader %s", len(members), self.membership.leader,
+                            extra={'event': 'cleanup.membership', 'members': members,
+                                   'leader': self.membership.leader})
+        except Exception as e:
+            # Keep working on the last known share rather than stopping
+            logger.error("Error renewing worker membership: %s", e)
+    
+    def _api(self, method, path, **kwargs):
+        """Call the API under this check's correlation id"""
+        headers = {REQUEST_ID_HEADER: get_correlation_id()} if get_correlation_id() else {}
+        return self.http.request(method, f"{self.config['api_base_url']}{path}", headers=headers, **kwargs)
+    
+    def find_expired_booking_devices(self):
+        """
+        Find devices that still have active bookings past their end time
+        
+        Pages through the bookings API with server-side filters so only the
+        expired-but-active rows are transferred.
+        
+        Returns:
+            set: Device IDs with expired active bookings
+        """
+        params = {
+            'status': 'active',
+            'end': get_current_utc_iso(),
+            'limit': self.config.get('page_size', 500)
         }
+        device_ids = set()
         
-        self.seam_service = SeamService()
+        while True:
+            response = self._api('GET', '/bookings', params=params)
+            response.raise_for_status()
+            page = response.json()
+            
+            for booking_data in page['bookings']:
+                device_ids.add(booking_data['device_id'])
+            
+            if not page.get('next_cursor'):
+                return device_ids
+            params['cursor'] = page['next_cursor']
     
     def update_booking_statuses(self):
         """Update booking statuses for expired bookings"""
         # In a production application, this would likely use a database
         # For this example, we'll use the API
         try:
-            response = requests.get(f"{self.config['api_base_url']}/bookings")
-            if response.status_code == 200:
-                bookings_data = response.json()
-                now = get_current_utc_iso()
-                
-                for booking_data in bookings_data:
-                    # Check if booking is expired but still marked as active
-                    if booking_data['status'] == 'active' and booking_data['ends_at'] < now:
-                        # Update booking status via API
-                        requests.post(
-                            f"{self.config['api_base_url']}/cleanup-expired-codes",
-                            json={"device_id": booking_data['device_id']}
-                        )
+            for device_id in self.owned_devices(self.find_expired_booking_devices()):
+                # Update booking status via API
+                self._api('POST', '/cleanup-expired-codes', json={"device_id": device_id})
         except Exception as e:
-            print(f"Error updating booking statuses: {str(e)}")
+            logger.error("Error updating booking statuses: %s", e)
     
     def cleanup_expired_codes(self):
         """Clean up expired access codes for all configured devices"""
-        for device_id in self.config['devices']:
+        for device_id in self.owned_devices(self.config['devices']):
             try:
                 deleted_codes = self.seam_service.delete_expired_codes(device_id)
                 if deleted_codes:
-                    print(f"Deleted {len(deleted_codes)} expired codes for device {device_id}")
+                    logger.info("Deleted %d expired codes for device %s", len(deleted_codes), device_id,
+                                extra={'event': 'cleanup.expired_codes', 'device_id': device_id, 'count': len(deleted_codes)})
             except Exception as e:
-                print(f"Error cleaning up codes for device {device_id}: {str(e)}")
+                logger.error("Error cleaning up codes for device %s: %s", device_id, e, extra={'device_id': device_id})
     
-    def run(self):
-        """Run the cleanup worker as a continuous process"""
-        print("Starting cleanup worker...")
+    def provision_upcoming_occurrences(self):
+        """Ask the API to push codes for recurring occurrences that start soon"""
+        try:
+            response = self._api('POST', '/provision-upcoming-occurrences', json={})
+            response.raise_for_status()
+            provisioned = response.json()['provisioned']
+            if provisioned:
+                logger.info("Provisioned %d upcoming recurring access codes", len(provisioned),
+                            extra={'event': 'cleanup.occurrences_provisioned', 'count': len(provisioned)})
+        except Exception as e:
+            logger.error("Error provisioning recurring access codes: %s", e)
+    
+    def provision_due_bookings(self):
+        """Ask the API to push codes for scheduled bookings entering the provisioning window"""
+        try:
+            response = self._api('POST', '/provision-due-bookings', json={})
+            response.raise_for_status()
+            activated = response.json()['outcomes'].get('active', 0)
+            if activated:
+                logger.info("Provisioned %d scheduled access codes", activated,
+                            extra={'event': 'cleanup.bookings_provisioned', 'count': activated})
+        except Exception as e:
+            logger.error("Error provisioning scheduled access codes: %s", e)
+    
+    def reconcile_devices(self):
+        """Check configured devices for drift between bookings and lock codes"""
+        mode = self.config.get('reconcile_mode')
+        device_ids = self.owned_devices(self.config['devices'])
+        if not mode or not device_ids:
+            return
         
-        while True:
-            current_time = datetime.now()
-            print(f"Running cleanup check at {current_time.isoformat()}")
+        try:
+            response = self._api('POST', '/reconcile', json={
+                "device_ids": device_ids,
+                "apply": mode == 'apply'
+            })
+            response.raise_for_status()
+            for report in response.json()['devices']:
+                if report['actions']:
+                    verb = 'Repaired' if mode == 'apply' else 'Found'
+                    logger.warning("%s %d drifted codes on device %s", verb, len(report['actions']), report['device_id'],
+                                   extra={'event': 'cleanup.drift', 'device_id': report['device_id'],
+                                          'count': len(report['actions'])})
+        except Exception as e:
+            logger.error("Error reconciling devices: %s", e)
+    
+    def archive_finished_bookings(self):
+        """Ask the API to move long-finished bookings out of the hot store"""
+        payload = {}
+        if self.config.get('archive_retention_days') is not None:
+            payload['retention_days'] = self.config['archive_retention_days']
+        
+        try:
+            response = self._api('POST', '/archive-finished-bookings', json=payload)
+            response.raise_for_status()
+            archived = response.json()['archived']
+            if archived:
+                logger.info("Archived %d finished bookings", archived,
+                            extra={'event': 'cleanup.archived', 'count': archived})
+        except Exception as e:
+            logger.error("Error archiving finished bookings: %s", e)
+    
+    def run_check(self):
+        """Run one cleanup check; its log records and API calls share one correlation id"""
+        with correlation_context():
+            logger.info("Running cleanup check at %s", get_current_utc_iso(), extra={'event': 'cleanup.check'})
+            
+            # Agree with the other workers on who handles which devices
+            self.renew_membership()
             
             # Clean up expired codes
             self.cleanup_expired_codes()
@@ -73,10 +214,47 @@ class CleanupWorker:
             # Update booking statuses
             self.update_booking_statuses()
             
-            # Sleep until the next check
-            print(f"Next check in {self.config['check_interval_seconds']} seconds")
-            time.sleep(self.config['check_interval_seconds'])
+            # Detect (and optionally repair) drift between bookings and locks
+            self.reconcile_devices()
+            
+            if not self.is_leader():
+                return
+            
+            # Push codes for recurring bookings entering the lookahead window
+            self.provision_upcoming_occurrences()
+            
+            # Push codes for one-off bookings entering the provisioning window
+            self.provision_due_bookings()
+            
+            # Keep the hot booking store small
+            self.archive_finished_bookings()
+    
+    def run(self):
+        """Run the cleanup worker as a continuous process"""
+        logger.info("Starting cleanup worker...")
+        
+        try:
+            while True:
+                self.run_check()
+                
+                # Sleep until the next check, renewing the lease so the group keeps us
+                logger.info("Next check in %s seconds", self.config['check_interval_seconds'])
+                remaining = self.config['check_interval_seconds']
+                while remaining > 0:
+                    step = min(remaining, self.config.get('heartbeat_seconds') or remaining)
+                    sleep(step)
+                    remaining -= step
+                    self.renew_membership()
+        finally:
+            # Hand our devices over at once instead of when the lease expires
+            if self.membership is not None:
+                self.membership.leave()
 
 if __name__ == "__main__":
+    load_dotenv()
+    # Same JSON pipeline and settings (LOG_LEVEL, LOG_SAMPLE_RATES) as the web app
+    configure_logging()
+    # Leave the worker group on SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
     worker = CleanupWorker()
     worker.run() 
\ No newline at end of file
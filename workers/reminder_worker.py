@@ -0,0 +1,48 @@
+import logging
+import sys
+import os
+import signal
+
+# Add the parent directory to the Python path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from app.services.booking_store import BookingStore
+from app.services.notification_service import NotificationService
+from app.services.reminder_service import ReminderService
+from app.utils.logging_config import configure_logging
+
+logger = logging.getLogger('workers.reminder')
+
+class ReminderWorker:
+    def __init__(self, data_dir=None):
+        """
+        Initialize the reminder worker
+        
+        Reads the job queue from the same data directory as the web app.
+        
+        Args:
+            data_dir (str, optional): Data directory (default: DATA_DIR or "data")
+        """
+        self.data_dir = data_dir or os.getenv('DATA_DIR', 'data')
+        self.reminder_service = ReminderService(
+            BookingStore(data_dir=self.data_dir),
+            NotificationService()
+        )
+    
+    def run(self):
+        """Run the reminder dispatcher until interrupted"""
+        logger.info("Starting reminder worker...")
+        
+        # Stop cleanly between batches on SIGTERM/SIGINT
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *args: self.reminder_service.stop())
+        
+        self.reminder_service.run()
+        logger.info("Reminder worker stopped")
+
+if __name__ == "__main__":
+    load_dotenv()
+    configure_logging()
+    worker = ReminderWorker()
+    worker.run()